@@ -0,0 +1 @@
+"""Benchmark di fill_dnd_sheet su roster di file .cah sintetici"""
@@ -0,0 +1,311 @@
+"""Generatore di file .cah sintetici con la stessa forma di quelli in input/
+
+Uso: python -m benchmarks.generate_cah CARTELLA --count 100 --preset medium
+"""
+import argparse
+import base64
+import importlib.util
+import io
+import json
+import random
+import uuid
+from pathlib import Path
+
+SKILL_NAMES = [
+    'ACROBATICS', 'ANIMAL_HANDLING', 'ARCANA', 'ATHLETICS', 'DECEPTION', 'HISTORY',
+    'INSIGHT', 'INTIMIDATION', 'INVESTIGATION', 'MEDICINE', 'NATURE', 'PERCEPTION',
+    'PERFORMANCE', 'PERSUASION', 'RELIGION', 'SLEIGHT_OF_HAND', 'STEALTH', 'SURVIVAL',
+]
+
+ABILITIES = ['strength', 'dexterity', 'constitution', 'intelligence', 'wisdom', 'charisma']
+
+SLOT_KEYS = ['first', 'second', 'third', 'fourth', 'fifth', 'sixth', 'seventh', 'eighth', 'ninth']
+
+RACES = [('variant_human', ''), ('halfling', 'ghostwise_halfling'), ('gem_dragonborn_[ftd]', 'topaz_ancestry')]
+
+ALIGNMENTS = ['TRUE_NEUTRAL', 'CHAOTIC_GOOD', 'LAWFUL_NEUTRAL', 'NEUTRAL_EVIL']
+
+WORDS = (
+    "the creature must make a saving throw on a failed save it takes damage and is pushed "
+    "away from you until the end of your next turn you can use your action to regain "
+    "expended spell slots when you finish a long rest within 30 feet of you"
+).split()
+
+# Va incrementata quando cambia il contenuto generato, così i pool di file
+# dei benchmark creati con la versione precedente vengono rigenerati
+GENERATOR_VERSION = 2
+
+# Ritratti: qualità JPEG del rumore generato con Pillow e, senza Pillow, un
+# JPEG 16x16 valido da allungare fino alla dimensione richiesta
+PORTRAIT_QUALITY = 85
+EMBEDDED_JPEG = (
+    "/9j/4AAQSkZJRgABAQAAAQABAAD/2wBDAAgGBgcGBQgHBwcJCQgKDBQNDAsLDBkSEw8UHRofHh0aHBwgJC4nICIs"
+    "IxwcKDcpLDAxNDQ0Hyc5PTgyPC4zNDL/2wBDAQkJCQwLDBgNDRgyIRwhMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIy"
+    "MjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjL/wAARCAAQABADASIAAhEBAxEB/8QAHwAAAQUBAQEBAQEAAAAAAAAA"
+    "AAECAwQFBgcICQoL/8QAtRAAAgEDAwIEAwUFBAQAAAF9AQIDAAQRBRIhMUEGE1FhByJxFDKBkaEII0KxwRVS0fAk"
+    "M2JyggkKFhcYGRolJicoKSo0NTY3ODk6Q0RFRkdISUpTVFVWV1hZWmNkZWZnaGlqc3R1dnd4eXqDhIWGh4iJipKT"
+    "lJWWl5iZmqKjpKWmp6ipqrKztLW2t7i5usLDxMXGx8jJytLT1NXW19jZ2uHi4+Tl5ufo6erx8vP09fb3+Pn6/8QA"
+    "HwEAAwEBAQEBAQEBAQAAAAAAAAECAwQFBgcICQoL/8QAtREAAgECBAQDBAcFBAQAAQJ3AAECAxEEBSExBhJBUQdh"
+    "cRMiMoEIFEKRobHBCSMzUvAVYnLRChYkNOEl8RcYGRomJygpKjU2Nzg5OkNERUZHSElKU1RVVldYWVpjZGVmZ2hp"
+    "anN0dXZ3eHl6goOEhYaHiImKkpOUlZaXmJmaoqOkpaanqKmqsrO0tba3uLm6wsPExcbHyMnK0tPU1dbX2Nna4uPk"
+    "5ebn6Onq8vP09fb3+Pn6/9oADAMBAAIRAxEAPwC5ommx6hPIZifLjAJAOCST/Lg1Prukw2UaT2+VRm2shbODjjH5"
+    "HvWZZ3k1jP5sDANjBBGQRnOP0p99qNxqDq05XC/dVRgDOM+/avP1ueof/9k="
+)
+
+# Profili ricavati dai tre personaggi di esempio:
+# small ~ Bella Tascabilly, medium ~ Arkan, large ~ Valadurg
+PRESETS = {
+    'small': {
+        'portrait_kb': 0,
+        'classes_kb': 90,
+        'spells_per_level': [],
+        'proficient_skills': 6,
+        'jobs': [('rogue', 1)],
+    },
+    'medium': {
+        'portrait_kb': 230,
+        'classes_kb': 700,
+        'spells_per_level': [6, 8, 6, 5, 3],
+        'proficient_skills': 5,
+        'jobs': [('cleric', 2), ('sorcerer', 7)],
+    },
+    'large': {
+        'portrait_kb': 800,
+        'classes_kb': 440,
+        'spells_per_level': [4, 6],
+        'proficient_skills': 5,
+        'jobs': [('paladin', 1), ('warlock', 2)],
+    },
+}
+
+def _text(rng, sentences):
+    """Testo descrittivo con a capo e virgolette, come nelle descrizioni reali"""
+    parts = []
+    for _ in range(sentences):
+        words = rng.choices(WORDS, k=rng.randint(8, 24))
+        if rng.random() < 0.2:
+            words[0] = f'"{words[0]}"'
+        parts.append(" ".join(words).capitalize() + ".")
+    return "\n\n".join(parts)
+
+def portrait_source():
+    """Come vengono generati i ritratti: "pillow" (JPEG di rumore) o "embedded" (JPEG incluso)"""
+    return "pillow" if importlib.util.find_spec("PIL") is not None else "embedded"
+
+def _random_bytes(rng, count):
+    """Come rng.randbytes (Python 3.9+), con lo stesso risultato"""
+    return rng.getrandbits(count * 8).to_bytes(count, 'little') if count > 0 else b''
+
+def _noise_jpeg(rng, target_bytes):
+    """JPEG di rumore colorato, con il lato scelto per arrivare circa a target_bytes"""
+    from PIL import Image
+    side = max(8, int((target_bytes / 1.5) ** 0.5))
+    for _ in range(2):
+        image = Image.frombytes('RGB', (side, side), _random_bytes(rng, side * side * 3))
+        output = io.BytesIO()
+        image.save(output, 'JPEG', quality=PORTRAIT_QUALITY)
+        data = output.getvalue()
+        # Una correzione del lato basta per avvicinarsi alla dimensione voluta
+        side = max(8, int(side * (target_bytes / len(data)) ** 0.5))
+    return data
+
+def _padded_jpeg(rng, target_bytes):
+    """Il JPEG incluso, allungato fino a target_bytes con segmenti di commento (COM)"""
+    data = base64.b64decode(EMBEDDED_JPEG)
+    segments = []
+    missing = target_bytes - len(data)
+    while missing > 4:
+        payload = _random_bytes(rng, min(missing - 4, 65533))
+        segments.append(b'\xff\xfe' + (len(payload) + 2).to_bytes(2, 'big') + payload)
+        missing -= len(payload) + 4
+    # Subito dopo SOI: i decoder saltano i commenti
+    return data[:2] + b''.join(segments) + data[2:]
+
+def _portrait(rng, size_kb):
+    """Ritratto JPEG in base64 con righe da 76 caratteri, come l'export dell'app
+
+    Con Pillow è un'immagine di rumore (decodifica e riduzione costano come per
+    una foto vera); senza, un piccolo JPEG incluso allungato da commenti.
+    """
+    if size_kb <= 0:
+        return None
+    target_bytes = size_kb * 1024 * 3 // 4
+    if portrait_source() == "pillow":
+        data = _noise_jpeg(rng, target_bytes)
+    else:
+        data = _padded_jpeg(rng, target_bytes)
+    return base64.encodebytes(data).decode('ascii')
+
+def _feature(rng, level, index):
+    return {
+        'feat': {
+            'descriptionModels': [{'description': _text(rng, rng.randint(2, 8)), 'level': level}],
+            'id': str(uuid.UUID(int=rng.getrandbits(128))),
+            'isFeature': True,
+            'jsonType': 'feat',
+            'level': level,
+            'name': f"Feature {level}-{index}",
+            'notes': '',
+            'type': 'Feat',
+        },
+        'level': level,
+    }
+
+def _required_class(rng, job_id, target_bytes):
+    """Definizione di classe serializzata come stringa JSON annidata"""
+    job_class = {
+        'acModifier': 'Dexterity',
+        'baseAc': 10,
+        'hitDie': 'd8',
+        'id': job_id,
+        'jsonType': 'class',
+        'name': job_id.title(),
+        'features': [],
+        'archetypes': [],
+        'savingThrows': {'cha': False, 'con': False, 'dex': False, 'intelligence': False, 'str': False, 'wis': True},
+    }
+    size = 0
+    index = 0
+    while size < target_bytes:
+        feature = _feature(rng, index % 20 + 1, index)
+        size += len(json.dumps(feature))
+        # Metà delle feature finisce negli archetipi, come nelle classi vere
+        if index % 2:
+            job_class['features'].append(feature)
+        else:
+            job_class['archetypes'].append({'id': f"{job_id}_archetype_{index}", 'features': [feature]})
+        index += 1
+    return json.dumps(job_class, sort_keys=True, separators=(',', ':'))
+
+def _spell(rng, level, index):
+    return {
+        'castingTime': '1 action',
+        'classes': 'bard, cleric, sorcerer, wizard',
+        'components': 'V, S',
+        'description': _text(rng, rng.randint(2, 6)),
+        'duration': 'Instantaneous',
+        'higherLevels': _text(rng, 1) if level else '',
+        'isCustom': False,
+        'isRitual': rng.random() < 0.1,
+        'jsonType': 'spell',
+        'level': level,
+        'name': f"Spell {level}-{index}",
+        'notes': '',
+        'pinned': False,
+        'prepared': rng.random() < 0.5,
+        'range': '60 feet',
+        'school': 'evocation',
+        'type': f"Level {level} evocation",
+    }
+
+def generate_character(seed=0, portrait_kb=230, classes_kb=700, spells_per_level=(6, 8, 6, 5, 3),
+                       proficient_skills=5, jobs=(('cleric', 2), ('sorcerer', 7))):
+    """Costruisce il dizionario di un personaggio sintetico, deterministico per seed"""
+    rng = random.Random(seed)
+    race_id, subrace_id = rng.choice(RACES)
+    proficient = set(rng.sample(SKILL_NAMES, min(proficient_skills, len(SKILL_NAMES))))
+    jobs = list(jobs)
+    class_bytes = classes_kb * 1024 // max(len(jobs), 1)
+    slots = {key: 0 for key in SLOT_KEYS}
+    for level, count in enumerate(spells_per_level):
+        if level and count:
+            slots[SLOT_KEYS[level - 1]] = rng.randint(1, 4)
+
+    data = {
+        'about': '',
+        'alignmentName': rng.choice(ALIGNMENTS),
+        'allRequiredClasses': {'jobs': [_required_class(rng, job_id, class_bytes) for job_id, _ in jobs]},
+        'background': {'backgroundId': 'outlander', 'skillProficiencies': []},
+        'baseAc': 10,
+        'baseHp': rng.randint(8, 80),
+        'created': '2024-01-01T00:00:00Z',
+        'exp': rng.randint(0, 50000),
+        'extraAC': rng.randint(0, 2),
+        'feats': [_feature(rng, 4, 0)['feat']],
+        'hp': rng.randint(8, 90),
+        'id': str(uuid.UUID(int=rng.getrandbits(128))),
+        'jobs': [
+            {'dice': level, 'jobId': job_id, 'languageProficiencies': [], 'level': level, 'toolProficiencies': []}
+            for job_id, level in jobs
+        ],
+        'jsonType': 'character',
+        'name': f"Synthetic {seed}",
+        'notes': [{'id': str(uuid.UUID(int=rng.getrandbits(128))), 'text': _text(rng, 2)}],
+        'player': f"Player {seed % 7}",
+        'race': {'raceId': race_id, 'subraceId': subrace_id, 'languageProficiencies': []},
+        'skills': [
+            {'proficiencyName': rng.choice(['FULL', 'FULL', 'EXPERT']) if name in proficient else 'NONE', 'typeName': name}
+            for name in SKILL_NAMES
+        ],
+        'spellSlots': slots,
+        'spells': [_spell(rng, level, i) for level, count in enumerate(spells_per_level) for i in range(count)],
+        'updated': '2024-10-06T17:31:33Z',
+    }
+    for ability in ABILITIES:
+        data[ability] = {'save': rng.random() < 0.33, 'saveModifier': 0, 'score': rng.randint(8, 18), 'scoreModifier': 0}
+    portrait = _portrait(rng, portrait_kb)
+    if portrait is not None:
+        data['image'] = portrait
+    return data
+
+def write_character(path, data):
+    """Scrive il personaggio nel formato compatto dell'export .cah"""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+
+def write_roster(output_dir, count, preset='medium', seed=0, reuse=False, **overrides):
+    """Genera count file .cah in output_dir e restituisce i loro percorsi
+
+    Con reuse=True i file già presenti vengono tenuti: va usato solo su
+    cartelle generate con lo stesso profilo e lo stesso seed.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    shape = dict(PRESETS[preset], **overrides)
+    paths = []
+    for i in range(count):
+        path = output_dir / f"synthetic_{i:05d}.cah"
+        if not (reuse and path.exists()):
+            write_character(path, generate_character(seed + i, **shape))
+        paths.append(path)
+    return paths
+
+def _parse_jobs(value):
+    jobs = []
+    for item in value.split(","):
+        job_id, _, level = item.partition(":")
+        jobs.append((job_id, int(level or 1)))
+    return jobs
+
+def _parse_levels(value):
+    return [int(v) for v in value.split(",") if v]
+
+def add_shape_arguments(parser):
+    """Opzioni comuni per controllare la forma dei file generati"""
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="medium",
+                        help="profilo di partenza (small, medium, large)")
+    parser.add_argument("--portrait-kb", type=int, help="dimensione del ritratto base64 in KB (0 = nessuno)")
+    parser.add_argument("--classes-kb", type=int, help="dimensione di allRequiredClasses in KB")
+    parser.add_argument("--spells-per-level", type=_parse_levels,
+                        help="incantesimi per livello a partire dai trucchetti, es. 4,6,3")
+    parser.add_argument("--proficient-skills", type=int, help="numero di abilità con competenza")
+    parser.add_argument("--class-levels", type=_parse_jobs, dest="jobs",
+                        help="classi e livelli (campo jobs), es. cleric:2,sorcerer:7")
+    parser.add_argument("--seed", type=int, default=0, help="seed del primo personaggio")
+
+def shape_overrides(args):
+    """Estrae dagli argomenti le sole opzioni di forma indicate esplicitamente"""
+    names = ['portrait_kb', 'classes_kb', 'spells_per_level', 'proficient_skills', 'jobs']
+    return {name: getattr(args, name) for name in names if getattr(args, name) is not None}
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera file .cah sintetici per i benchmark")
+    parser.add_argument("output_dir", help="cartella in cui scrivere i file")
+    parser.add_argument("--count", type=int, default=10, help="numero di personaggi")
+    add_shape_arguments(parser)
+    args = parser.parse_args()
+    paths = write_roster(args.output_dir, args.count, args.preset, args.seed, **shape_overrides(args))
+    print(f"Generati {len(paths)} file in {args.output_dir}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""Harness di benchmark: tempi per fase ed end-to-end su roster sintetici
+
+Uso: python -m benchmarks.run_benchmarks --sizes 1,10,100 --output risultati.json
+
+Ogni misura gira in un sottoprocesso separato, così il picco di memoria
+(RSS) riportato appartiene solo a quella fase. Il risultato è un JSON
+confrontabile tra commit diversi.
+"""
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:
+    # Su Windows il picco di RSS non è disponibile
+    resource = None
+
+from benchmarks.generate_cah import (
+    GENERATOR_VERSION, PRESETS, add_shape_arguments, portrait_source, shape_overrides, write_roster,
+)
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+TEMPLATE_NAME = "5E_CharacterSheet_Fillable.pdf"
+BENCHMARK_VERSION = 1
+STAGES = ("load", "load_full", "extract", "extract_batch", "fill")
+
+def peak_rss_bytes(children=False):
+    """Picco di memoria residente del processo (o dei figli terminati), in byte"""
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    # Linux riporta KB, macOS byte
+    return usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+
+def _dir_bytes(path, pattern):
+    return sum(p.stat().st_size for p in Path(path).glob(pattern))
+
+def measure_stage(stage, roster_dir, output_dir):
+    """Misura una singola fase su tutti i file del roster, nel processo corrente"""
+    import fill_dnd_sheet
+
+    files = sorted(Path(roster_dir).glob("*.cah"))
+    template_pdf = REPO_DIR / TEMPLATE_NAME
+    result = {}
+    if stage == "fill":
+        # Il caricamento del template è un costo una tantum e viene riportato a parte
+        start = time.perf_counter()
+        fill_dnd_sheet.template_cache.get(template_pdf)
+        result['template_load_s'] = time.perf_counter() - start
+
+    wall = 0.0
+    cpu = 0.0
+    if stage == "extract_batch":
+        # L'intero roster in memoria, derivato in una sola chiamata
+        roster = [fill_dnd_sheet.load_character_data(cah_file, keys=fill_dnd_sheet.CHARACTER_KEYS)
+                  for cah_file in files]
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        fill_dnd_sheet.extract_character_info_batch(roster)
+        wall += time.perf_counter() - wall_start
+        cpu += time.process_time() - cpu_start
+        result['numpy'] = fill_dnd_sheet._import_numpy() is not None
+        files_to_time = []
+    else:
+        files_to_time = files
+    for cah_file in files_to_time:
+        # Le fasi precedenti a quella misurata restano fuori dal cronometro
+        if stage == "load_full":
+            wall_start, cpu_start = time.perf_counter(), time.process_time()
+            fill_dnd_sheet.load_character_data(cah_file)
+        else:
+            wall_start, cpu_start = time.perf_counter(), time.process_time()
+            char_data = fill_dnd_sheet.load_character_data(cah_file, keys=fill_dnd_sheet.CHARACTER_KEYS)
+            if stage != "load":
+                wall_start, cpu_start = time.perf_counter(), time.process_time()
+                char_info = fill_dnd_sheet.extract_character_info(char_data)
+                if stage == "fill":
+                    wall_start, cpu_start = time.perf_counter(), time.process_time()
+                    fill_dnd_sheet.fill_pdf(template_pdf, Path(output_dir) / f"{cah_file.stem}_sheet.pdf", char_info)
+        wall += time.perf_counter() - wall_start
+        cpu += time.process_time() - cpu_start
+
+    result.update({
+        'wall_s': wall,
+        'cpu_s': cpu,
+        'per_sheet_ms': wall / len(files) * 1000 if files else 0.0,
+        'peak_rss_bytes': peak_rss_bytes(),
+    })
+    if stage == "fill":
+        result['output_bytes'] = _dir_bytes(output_dir, "*.pdf")
+    return result
+
+def measure_end_to_end(roster_dir, workers):
+    """Esegue `fill_dnd_sheet.py --all` in una cartella di lavoro con il roster in input/"""
+    with tempfile.TemporaryDirectory(prefix="cah_e2e_") as work_dir:
+        work_dir = Path(work_dir)
+        shutil.copyfile(REPO_DIR / TEMPLATE_NAME, work_dir / TEMPLATE_NAME)
+        input_dir = work_dir / "input"
+        input_dir.mkdir()
+        for cah_file in Path(roster_dir).glob("*.cah"):
+            _link_or_copy(cah_file, input_dir / cah_file.name)
+
+        command = [sys.executable, "-m", "benchmarks.run_benchmarks", "--child", "e2e", str(workers)]
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join([str(REPO_DIR), os.environ.get('PYTHONPATH', '')]))
+        start = time.perf_counter()
+        completed = subprocess.run(command, cwd=work_dir, env=env, capture_output=True, text=True, check=True)
+        wall = time.perf_counter() - start
+        child = json.loads(completed.stdout.strip().splitlines()[-1])
+        sheets = len(list(input_dir.glob("*.cah")))
+        return {
+            'workers': workers,
+            'wall_s': wall,
+            'sheets_per_s': sheets / wall if wall else 0.0,
+            'peak_rss_bytes': child['peak_rss_bytes'],
+            'peak_rss_workers_bytes': child['peak_rss_workers_bytes'],
+            'output_bytes': _dir_bytes(work_dir / "output", "*.pdf"),
+        }
+
+def _run_end_to_end_child(workers):
+    """Processo figlio dell'end-to-end: esegue la CLI e stampa le misure di memoria"""
+    import fill_dnd_sheet
+
+    sys.argv = ["fill_dnd_sheet.py", "--all", "--force", "--jobs", str(workers)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        fill_dnd_sheet.main_cli()
+    print(json.dumps({
+        'peak_rss_bytes': peak_rss_bytes(),
+        'peak_rss_workers_bytes': peak_rss_bytes(children=True),
+    }))
+
+def _run_stage_child(stage, roster_dir):
+    with tempfile.TemporaryDirectory(prefix="cah_stage_") as output_dir:
+        print(json.dumps(measure_stage(stage, roster_dir, output_dir)))
+
+def _run_child(args):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([str(REPO_DIR), os.environ.get('PYTHONPATH', '')]))
+    completed = subprocess.run([sys.executable, "-m", "benchmarks.run_benchmarks", "--child", *args],
+                               cwd=REPO_DIR, env=env, capture_output=True, text=True, check=True)
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+def _link_or_copy(source, target):
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+def _git_commit():
+    try:
+        completed = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_DIR,
+                                   capture_output=True, text=True, check=True)
+        return completed.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmarks(sizes, preset="medium", seed=0, workers=1, work_dir=None, stages=STAGES, log=print, **overrides):
+    """Genera i roster richiesti, misura ogni fase e l'end-to-end, restituisce il report"""
+    shape = dict(PRESETS[preset], **overrides)
+    # Anche versione del generatore e tipo di ritratti: i pool vecchi non vengono riusati
+    shape_id = hashlib.sha256(json.dumps([shape, seed, GENERATOR_VERSION, portrait_source()],
+                                         sort_keys=True).encode()).hexdigest()[:12]
+    with contextlib.ExitStack() as stack:
+        if work_dir is None:
+            work_dir = stack.enter_context(tempfile.TemporaryDirectory(prefix="cah_bench_"))
+        work_dir = Path(work_dir)
+        # Un solo pool di file per profilo: i roster più piccoli ne usano i primi N
+        pool_dir = work_dir / f"pool_{shape_id}"
+        log(f"Generazione di {max(sizes)} file .cah ({preset})...")
+        pool = write_roster(pool_dir, max(sizes), preset, seed, reuse=True, **overrides)
+
+        results = []
+        for size in sizes:
+            roster_dir = work_dir / f"roster_{shape_id}_{size}"
+            if roster_dir.exists():
+                shutil.rmtree(roster_dir)
+            roster_dir.mkdir()
+            for cah_file in pool[:size]:
+                _link_or_copy(cah_file, roster_dir / cah_file.name)
+
+            entry = {
+                'sheets': size,
+                'input_bytes': _dir_bytes(roster_dir, "*.cah"),
+                'stages': {},
+            }
+            for stage in stages:
+                log(f"  {size} schede: {stage}...")
+                entry['stages'][stage] = _run_child(["stage", stage, str(roster_dir)])
+            log(f"  {size} schede: end-to-end con {workers} processi...")
+            entry['end_to_end'] = measure_end_to_end(roster_dir, workers)
+            results.append(entry)
+            shutil.rmtree(roster_dir)
+
+    return {
+        'benchmark_version': BENCHMARK_VERSION,
+        'commit': _git_commit(),
+        'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'preset': preset,
+        'shape': shape,
+        'seed': seed,
+        'results': results,
+    }
+
+def _parse_sizes(value):
+    return sorted({int(v) for v in value.split(",") if v})
+
+def main():
+    if len(sys.argv) > 2 and sys.argv[1] == "--child":
+        # Invocazione interna: una singola misura in un processo pulito
+        if sys.argv[2] == "stage":
+            _run_stage_child(sys.argv[3], sys.argv[4])
+        else:
+            _run_end_to_end_child(int(sys.argv[3]))
+        return
+
+    parser = argparse.ArgumentParser(description="Benchmark di fill_dnd_sheet su roster sintetici")
+    parser.add_argument("--sizes", type=_parse_sizes, default=[1, 10, 100],
+                        help="dimensioni dei roster, es. 1,10,100,1000,10000")
+    parser.add_argument("-w", "--workers", type=int, default=1,
+                        help="processi per l'end-to-end --all (0 = tutti i core)")
+    parser.add_argument("--stages", default=",".join(STAGES),
+                        help=f"fasi da misurare (tra {', '.join(STAGES)})")
+    parser.add_argument("--work-dir", help="cartella dove tenere i file generati tra un'esecuzione e l'altra")
+    parser.add_argument("--output", help="file JSON del report (predefinito: stdout)")
+    add_shape_arguments(parser)
+    args = parser.parse_args()
+
+    stages = [stage for stage in args.stages.split(",") if stage]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"fasi sconosciute: {', '.join(sorted(unknown))}")
+    workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+    log = (lambda message: print(message, file=sys.stderr))
+    report = run_benchmarks(args.sizes, args.preset, args.seed, workers, args.work_dir, stages, log,
+                            **shape_overrides(args))
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+        log(f"Report salvato in {args.output}")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
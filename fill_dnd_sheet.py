@@ -1,43 +1,80 @@
+import time
+
+# Inizio dell'import del modulo, per il report di --import-time
+_IMPORT_START = time.perf_counter()
+
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import mmap
+import os
+import re
+import shutil
 import sys
-import traceback
-import ctypes
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import sheet_profiles
+from sheet_profiles import ABILITIES, DEFAULT_PROFILE, SKILL_TYPES
+
+# Eseguito come script il modulo si chiama __main__: lo registriamo anche col
+# suo nome, così i moduli caricati su richiesta (sheet_render, sheet_gui,
+# sheet_server) che importano fill_dnd_sheet non ne creano una seconda copia
+sys.modules.setdefault("fill_dnd_sheet", sys.modules[__name__])
+
+# Tempi di import per --import-time: il modulo stesso e i moduli caricati al primo uso
+IMPORT_TIMES = {}
 
 def show_error_box(title, message):
     """Mostra un messaggio di errore nativo Windows"""
     try:
+        import ctypes
         ctypes.windll.user32.MessageBoxW(0, message, title, 0x10) # 0x10 = MB_ICONERROR
     except:
         pass
 
-# Global Exception Hook
+# Global Exception Hook: installato da main(), non all'import del modulo
 def global_exception_handler(exctype, value, tb):
+    import traceback
     err_msg = "".join(traceback.format_exception(exctype, value, tb))
     with open("crash_log.txt", "w") as f:
         f.write(err_msg)
     show_error_box("Errore Critico", f"L'applicazione ha riscontrato un errore:\n\n{err_msg}\n\nLog salvato in crash_log.txt")
     sys.exit(1)
 
-sys.excepthook = global_exception_handler
+def _import_timed(module_name):
+    """Importa un modulo caricato su richiesta, registrando in IMPORT_TIMES il costo del primo import"""
+    if module_name in IMPORT_TIMES:
+        return sys.modules[module_name]
+    # Sempre tramite __import__, anche se il modulo è già in sys.modules: un
+    # altro thread potrebbe averlo inserito e non aver finito di eseguirlo
+    start = time.perf_counter()
+    module = __import__(module_name)
+    IMPORT_TIMES.setdefault(module_name, time.perf_counter() - start)
+    return module
 
-try:
-    import json
-    import os
-    from pathlib import Path
-    # Usa pypdf invece di PyPDF2 (più moderno e compatibile)
-    from pypdf import PdfReader, PdfWriter
-    from pypdf.generic import NameObject, BooleanObject, DictionaryObject
-    import io
-    from reportlab.pdfgen import canvas
-    from reportlab.lib.pagesizes import letter
+def _import_renderer():
+    """Motore di render (pypdf e ReportLab): lo importa al primo render"""
+    return _import_timed("sheet_render")
 
-    # GUI Imports
-    import tkinter as tk
-    from tkinter import filedialog, messagebox
-    import threading
+# Nomi dell'interfaccia grafica, ora in sheet_gui (tkinter si carica solo se servono)
+GUI_NAMES = frozenset({"DndConverterApp", "GuiBatch", "BatchCancelled", "run_gui"})
 
-except Exception as e:
-    # Catch import errors
-    global_exception_handler(type(e), e, e.__traceback__)
+def __getattr__(name):
+    # fill_dnd_sheet.fill_pdf, .template_cache, .PartyBundle, .DndConverterApp...
+    # restano disponibili a chi importa il modulo, ma caricano il motore
+    # (o l'interfaccia grafica) solo ora
+    if name.startswith("__"):
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    if name in GUI_NAMES:
+        return getattr(_import_timed("sheet_gui"), name)
+    try:
+        return getattr(_import_renderer(), name)
+    except AttributeError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
 
 def get_resource_path(relative_path):
     """ Get absolute path to resource, works for dev and for PyInstaller """
@@ -45,10 +82,194 @@ def get_resource_path(relative_path):
         return Path(sys._MEIPASS) / relative_path
     return Path(relative_path)
 
-def load_character_data(cah_file):
-    """Carica i dati del personaggio dal file .cah (JSON)"""
-    with open(cah_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+# Template incluso, usato quando non ne viene indicato un altro
+DEFAULT_TEMPLATE = "5E_CharacterSheet_Fillable.pdf"
+
+def resolve_template(template_pdf=None):
+    """Percorso del template indicato o, se è None, di quello incluso"""
+    return Path(template_pdf) if template_pdf is not None else get_resource_path(DEFAULT_TEMPLATE)
+
+# Font del testo: helvetica è il font standard dei PDF, non incorporato; gli
+# altri sono TrueType inclusi in fonts/, incorporati a sottoinsiemi
+TEXT_FONTS = {"helvetica": None, "dejavu": "fonts/DejaVuSans.ttf"}
+DEFAULT_FONT = "helvetica"
+
+def resolve_font(font=None):
+    """File TrueType del font indicato (nome incluso o percorso di un .ttf), None per Helvetica"""
+    font = font or DEFAULT_FONT
+    if font in TEXT_FONTS:
+        return get_resource_path(TEXT_FONTS[font]) if TEXT_FONTS[font] else None
+    return Path(font)
+
+# Scansione selettiva dei .cah: le classi incorporate ('allRequiredClasses')
+# occupano buona parte del file e alla scheda servono solo i privilegi. Invece
+# di costruirle, ne cerchiamo solo la fine e le teniamo come byte grezzi
+# (RAW_KEYS); anche il ritratto base64 ('image') resta grezzo (RawImage):
+# le cache lo riconoscono dal suo hash e viene decodificato solo se la sua
+# miniatura non è in cache.
+_JSON_WS = re.compile(rb'[ \t\r\n]*')
+_JSON_STRUCT = re.compile(rb'["{}\[\]]')
+_JSON_SCALAR = re.compile(rb'[^,}\]\s]*')
+# Corpo di stringa che consuma le virgolette precedute da uno o tre backslash
+# (sicuramente escape: \" e, nelle descrizioni annidate, \\\") e si ferma alla
+# prima da verificare. Solo quantificatori ordinari (quelli possessivi
+# richiedono Python 3.11): [^"]* e la virgolette non si sovrappongono, quindi
+# non c'è backtracking da evitare
+_JSON_STRING_BODY = re.compile(rb'[^"]*(?:(?:(?<=[^\\]\\)|(?<=[^\\]\\\\\\))"[^"]*)*"')
+_DECODE_WINDOW = 4 * 1024
+_DECODE_WINDOW_MAX = 64 * 1024
+_json_decoder = json.JSONDecoder()
+
+def _is_unescaped_quote(buf, pos):
+    """True se la virgolette in pos non è preceduta da un numero dispari di backslash"""
+    k = pos - 1
+    while buf[k] == 0x5C:  # '\\'
+        k -= 1
+    return (pos - 1 - k) % 2 == 0
+
+def _skip_json_string(buf, pos):
+    """Restituisce l'offset subito dopo la stringa JSON che inizia in pos"""
+    # Caso comune (anche il ritratto base64): nessuna virgolette con escape
+    end = buf.find(b'"', pos + 1)
+    if end == -1:
+        raise ValueError(f"Stringa JSON non terminata all'offset {pos}")
+    if _is_unescaped_quote(buf, end):
+        return end + 1
+
+    # Stringhe con JSON annidato (allRequiredClasses): la regex salta in C le
+    # migliaia di \" e ci restituisce solo le virgolette dubbie (\\\")
+    while True:
+        m = _JSON_STRING_BODY.match(buf, end + 1)
+        if m is None:
+            raise ValueError(f"Stringa JSON non terminata all'offset {pos}")
+        end = m.end() - 1
+        if _is_unescaped_quote(buf, end):
+            return end + 1
+
+def _skip_json_container(buf, pos):
+    """Restituisce l'offset subito dopo l'oggetto/array JSON che inizia in pos"""
+    # I contenitori piccoli li chiude più in fretta il decoder C su una finestra
+    window = _DECODE_WINDOW
+    while window <= _DECODE_WINDOW_MAX:
+        window_end = min(pos + window, len(buf))
+        try:
+            text = buf[pos:window_end].decode('latin-1')
+            return pos + _json_decoder.raw_decode(text)[1]
+        except json.JSONDecodeError as e:
+            if window_end == len(buf):
+                raise
+            # Una stringa che occupa gran parte della finestra va saltata, non decodificata
+            if e.msg.startswith('Unterminated string') and e.pos < window // 2:
+                break
+        window *= 2
+
+    # Contenitore con stringhe enormi: lo percorriamo saltandole senza decodificarle
+    depth = 0
+    while True:
+        m = _JSON_STRUCT.search(buf, pos)
+        if m is None:
+            raise ValueError("Contenitore JSON non terminato")
+        token = buf[m.start()]
+        if token == 0x22:  # '"'
+            pos = _skip_json_string(buf, m.start())
+            continue
+        pos = m.end()
+        depth += 1 if token in (0x7B, 0x5B) else -1
+        if depth == 0:
+            return pos
+
+def _skip_json_value(buf, pos):
+    """Restituisce l'offset subito dopo il valore JSON che inizia in pos"""
+    first = buf[pos]
+    if first == 0x22:
+        return _skip_json_string(buf, pos)
+    if first in (0x7B, 0x5B):
+        return _skip_json_container(buf, pos)
+    return _JSON_SCALAR.match(buf, pos).end()
+
+def _iter_top_level(buf):
+    """Itera (chiave, inizio, fine) sui valori di primo livello di un oggetto JSON"""
+    pos = _JSON_WS.match(buf, 0).end()
+    if buf[pos:pos + 1] != b'{':
+        raise ValueError("Il file .cah non contiene un oggetto JSON")
+    pos = _JSON_WS.match(buf, pos + 1).end()
+    if buf[pos:pos + 1] == b'}':
+        return
+    while True:
+        key_end = _skip_json_string(buf, pos)
+        key = buf[pos:key_end]
+        key = json.loads(key) if b'\\' in key else key[1:-1].decode('utf-8')
+        pos = _JSON_WS.match(buf, key_end).end()
+        if buf[pos:pos + 1] != b':':
+            raise ValueError(f"Atteso ':' all'offset {pos}")
+        start = _JSON_WS.match(buf, pos + 1).end()
+        end = _skip_json_value(buf, start)
+        yield key, start, end
+        pos = _JSON_WS.match(buf, end).end()
+        sep = buf[pos:pos + 1]
+        if sep == b'}':
+            return
+        if sep != b',':
+            raise ValueError(f"Atteso ',' all'offset {pos}")
+        pos = _JSON_WS.match(buf, pos + 1).end()
+
+def load_character_data(cah_file, keys=None):
+    """Carica i dati del personaggio dal file .cah (JSON)
+
+    Con `keys` vengono decodificate solo le chiavi di primo livello indicate;
+    gli altri valori vengono saltati senza essere costruiti in memoria.
+    """
+    if keys is None:
+        with open(cah_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    with open(cah_file, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError(f"File vuoto: {cah_file}")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            return parse_character_data(buf, keys)
+
+class RawImage:
+    """Ritratto come stringa JSON grezza del .cah, decodificato solo per disegnarlo
+
+    digest (SHA-256 dei byte grezzi) lo identifica nelle chiavi delle cache.
+    """
+
+    __slots__ = ('raw', '_digest')
+
+    def __init__(self, raw):
+        self.raw = bytes(raw)
+        self._digest = None
+
+    @property
+    def digest(self):
+        if self._digest is None:
+            self._digest = hashlib.sha256(self.raw).hexdigest()
+        return self._digest
+
+    def base64(self):
+        """Testo base64 del ritratto; ValueError se nel .cah non è una stringa"""
+        value = json.loads(self.raw)
+        if not isinstance(value, str):
+            raise ValueError("Il ritratto non è una stringa base64")
+        return value
+
+    def __bool__(self):
+        # Come per la stringa decodificata: vuoto o null vuol dire nessun ritratto
+        return self.raw not in (b'""', b'null', b'false')
+
+# Chiavi che parse_character_data lascia come JSON grezzo, con il tipo in cui
+# vengono conservate: le decodifica solo chi le usa, e solo la parte che gli serve
+RAW_KEYS = {'allRequiredClasses': bytes, 'image': RawImage}
+
+def parse_character_data(buf, keys=None):
+    """Decodifica i dati del personaggio dal contenuto di un .cah già in memoria"""
+    if keys is None:
+        return json.loads(buf)
+    data = {}
+    for key, start, end in _iter_top_level(buf):
+        if key in keys:
+            data[key] = RAW_KEYS[key](buf[start:end]) if key in RAW_KEYS else json.loads(buf[start:end])
     return data
 
 def calculate_modifier(score):
@@ -59,520 +280,1760 @@ def get_proficiency_bonus(level):
     """Calcola il bonus di competenza basato sul livello"""
     return 2 + (level - 1) // 4
 
-def extract_character_info(data):
-    """Estrae le informazioni principali dal JSON del personaggio"""
+# Chiavi di primo livello del .cah lette da extract_character_info
+CHARACTER_KEYS = frozenset({
+    'name', 'player', 'background', 'race', 'jobs', 'alignmentName', 'exp', 'xp',
+    'strength', 'dexterity', 'constitution', 'intelligence', 'wisdom', 'charisma',
+    'hp', 'baseAc', 'extraAC', 'skills', 'spells', 'spellSlots', 'image',
+    'allRequiredClasses',
+})
+
+# Nomi dei campi del PDF: vengono dal profilo del template (sheet_profiles),
+# qui restano solo i dati di gioco
+
+# Caratteristica di ogni abilità; l'ordine delle abilità è SKILL_TYPES
+SKILL_ABILITIES = {
+    'ACROBATICS': 'dexterity',
+    'ANIMAL_HANDLING': 'wisdom',
+    'ARCANA': 'intelligence',
+    'ATHLETICS': 'strength',
+    'DECEPTION': 'charisma',
+    'HISTORY': 'intelligence',
+    'INSIGHT': 'wisdom',
+    'INTIMIDATION': 'charisma',
+    'INVESTIGATION': 'intelligence',
+    'MEDICINE': 'wisdom',
+    'NATURE': 'intelligence',
+    'PERCEPTION': 'wisdom',
+    'PERFORMANCE': 'charisma',
+    'PERSUASION': 'charisma',
+    'RELIGION': 'intelligence',
+    'SLEIGHT_OF_HAND': 'dexterity',
+    'STEALTH': 'dexterity',
+    'SURVIVAL': 'wisdom',
+}
+SKILL_INDEX = {skill_type: i for i, skill_type in enumerate(SKILL_TYPES)}
+SKILL_ABILITY_INDEX = tuple(ABILITIES.index(SKILL_ABILITIES[skill_type]) for skill_type in SKILL_TYPES)
+PERCEPTION_INDEX = SKILL_INDEX['PERCEPTION']
+
+# Quante volte si somma il bonus di competenza per ogni livello di competenza
+PROFICIENCY_MULTIPLIERS = {'FULL': 1, 'EXPERT': 2}
+
+# Classi incantatrici e relativa caratteristica da incantesimo
+SPELLCASTING_ABILITIES = {
+    'wizard': 'Intelligence',
+    'sorcerer': 'Charisma',
+    'bard': 'Charisma',
+    'warlock': 'Charisma',
+    'cleric': 'Wisdom',
+    'druid': 'Wisdom',
+    'paladin': 'Wisdom',
+    'ranger': 'Wisdom',
+}
+
+# Chiave di char_info con gli incantesimi che non entrano nella pagina:
+# una lista di dizionari campo -> testo, uno per pagina di continuazione
+SPELL_PAGES_FIELD = 'SPELL CONTINUATION'
+
+# Chiavi degli slot incantesimo nell'export dell'app, dal livello 1 al 9
+SPELL_SLOT_KEYS = ('first', 'second', 'third', 'fourth', 'fifth', 'sixth', 'seventh', 'eighth', 'ninth')
+
+def spell_slots(data):
+    """Slot incantesimo dei livelli 1-9; accetta anche le chiavi 'Lvl1'...'Lvl9'"""
+    slots = data.get('spellSlots', {})
+    return [slots.get(key, slots.get(f'Lvl{level}', 0)) for level, key in enumerate(SPELL_SLOT_KEYS, 1)]
+
+def experience(data):
+    """Punti esperienza: 'exp' nell'export dell'app, 'xp' nei .cah ricostruiti da pdf_to_cah"""
+    return data.get('exp', data.get('xp', 0))
+
+def _signed(value):
+    return f"+{value}" if value >= 0 else str(value)
+
+def _character_columns(data):
+    """Valori grezzi da cui dipendono i calcoli: livello, punteggi, competenze, incantatore
+
+    L'ultimo elemento è l'elenco (indice abilità, competente) delle voci
+    di 'skills' nell'ordine del file, usato solo per comporre i campi.
+    """
+    jobs = data.get('jobs', [])
+    total_level = sum(job.get('level', 0) for job in jobs)
+    scores = []
+    saves = []
+    for ability in ABILITIES:
+        ability_data = data.get(ability, {})
+        scores.append(ability_data.get('score', 10))
+        saves.append(1 if ability_data.get('save', False) else 0)
+    
+    # Con voci ripetute vale l'ultima, come nella compilazione dei campi
+    skill_multipliers = [0] * len(SKILL_TYPES)
+    skill_entries = []
+    for skill in data.get('skills', []):
+        index = SKILL_INDEX.get(skill.get('typeName', ''))
+        if index is not None:
+            multiplier = PROFICIENCY_MULTIPLIERS.get(skill.get('proficiencyName', 'NONE'), 0)
+            skill_multipliers[index] = multiplier
+            skill_entries.append((index, multiplier > 0))
+    has_perception = 1 if any(index == PERCEPTION_INDEX for index, _ in skill_entries) else 0
+    
+    # Il primo lavoro incantatore determina la caratteristica da incantesimo
+    spell_ability = -1
+    for job in jobs:
+        ability_name = SPELLCASTING_ABILITIES.get(job.get('jobId', '').lower())
+        if ability_name is not None:
+            spell_ability = ABILITIES.index(ability_name.lower())
+            break
+    return total_level, scores, saves, skill_multipliers, has_perception, spell_ability, skill_entries
+
+def _derive_values(total_level, scores, saves, skill_multipliers, has_perception, spell_ability, *_):
+    """Statistiche derivate di un personaggio come interi
+
+    È la versione scalare di derive_roster_stats: bonus di competenza,
+    modificatori, tiri salvezza, abilità, percezione passiva, CD e bonus
+    di attacco degli incantesimi.
+    """
+    prof_bonus = get_proficiency_bonus(total_level)
+    modifiers = [calculate_modifier(score) for score in scores]
+    save_values = [modifier + prof_bonus * save for modifier, save in zip(modifiers, saves)]
+    skill_values = [modifiers[ability] + prof_bonus * multiplier
+                    for ability, multiplier in zip(SKILL_ABILITY_INDEX, skill_multipliers)]
+    passive = 10 + (skill_values[PERCEPTION_INDEX] if has_perception else 0)
+    spell_mod = modifiers[spell_ability] if spell_ability >= 0 else 0
+    return prof_bonus, modifiers, save_values, skill_values, passive, 8 + prof_bonus + spell_mod, prof_bonus + spell_mod
+
+def _derive_stats(*columns):
+    """Le statistiche di _derive_values, già formattate per il PDF"""
+    prof_bonus, modifiers, save_values, skill_values, passive, spell_dc, spell_attack = _derive_values(*columns)
+    return (
+        f"+{prof_bonus}",
+        [_signed(modifier) for modifier in modifiers],
+        [_signed(value) for value in save_values],
+        [_signed(value) for value in skill_values],
+        str(passive),
+        str(spell_dc),
+        _signed(spell_attack),
+    )
+
+# Privilegi di classe: ogni .cah incorpora in 'allRequiredClasses.jobs' la
+# definizione completa delle sue classi, ciascuna come stringa JSON annidata
+# identica in tutti i personaggi di quella classe
+CLASS_CACHE_ITEMS = 64
+FEATURE_SUMMARY_CHARS = 160
+_CLASS_STRINGS_START = re.compile(rb'[ \t\r\n]*\{[ \t\r\n]*"jobs"[ \t\r\n]*:[ \t\r\n]*\[[ \t\r\n]*')
+
+def _compact_features(features):
+    """(livello, nome, ((livello, descrizione), ...)) per ogni privilegio della lista"""
+    compact = []
+    for entry in features:
+        feat = entry.get('feat', {})
+        descriptions = sorted(((model.get('level', 0), model.get('description', ''))
+                               for model in feat.get('descriptionModels', [])), key=lambda model: model[0])
+        compact.append((entry.get('level', feat.get('level', 1)), feat.get('name', ''), tuple(descriptions)))
+    return tuple(compact)
+
+class ClassDefinitionCache:
+    """Definizioni di classe decodificate e ridotte ai soli privilegi
+
+    La chiave è l'hash della stringa annidata, così un roster di dieci
+    chierici decodifica la definizione del chierico una volta sola. Sopra
+    c'è un secondo livello per l'intero 'allRequiredClasses' grezzo: un
+    personaggio con le stesse classi di uno già visto non va nemmeno diviso
+    nelle sue stringhe. In memoria restano le CLASS_CACHE_ITEMS voci usate
+    più di recente per livello.
+    """
+
+    def __init__(self, max_items=CLASS_CACHE_ITEMS):
+        self.max_items = max_items
+        self.decoded = 0
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._combinations = OrderedDict()
+
+    def definitions(self, classes):
+        """Definizioni compatte di tutte le classi di un valore 'allRequiredClasses'"""
+        if not isinstance(classes, bytes):
+            return [self.get(nested) for nested in _class_strings(classes)]
+        key = hashlib.sha256(classes).digest()
+        with self._lock:
+            definitions = self._combinations.get(key)
+            if definitions is not None:
+                self._combinations.move_to_end(key)
+                return definitions
+
+        definitions = tuple(self.get(nested) for nested in _class_strings(classes))
+        with self._lock:
+            self._combinations[key] = definitions
+            while len(self._combinations) > self.max_items:
+                self._combinations.popitem(last=False)
+        return definitions
+
+    def get(self, nested):
+        """Definizione compatta da una stringa annidata: letterale JSON grezzo (bytes) o già decodificata"""
+        raw = isinstance(nested, bytes)
+        key = hashlib.sha256(nested if raw else nested.encode('utf-8')).digest()
+        with self._lock:
+            definition = self._memory.get(key)
+            if definition is not None:
+                self._memory.move_to_end(key)
+                return definition
+
+        job_class = json.loads(json.loads(nested) if raw else nested)
+        definition = {
+            'id': job_class.get('id', ''),
+            'name': job_class.get('name', ''),
+            'features': _compact_features(job_class.get('features', [])),
+            'archetypes': {archetype.get('id'): _compact_features(archetype.get('features', []))
+                           for archetype in job_class.get('archetypes', [])},
+        }
+        with self._lock:
+            self.decoded += 1
+            self._memory[key] = definition
+            while len(self._memory) > self.max_items:
+                self._memory.popitem(last=False)
+        return definition
+
+class_definitions = ClassDefinitionCache()
+
+def _class_strings(classes):
+    """Stringhe annidate di 'allRequiredClasses', una alla volta
+
+    Dal valore grezzo di parse_character_data escono i letterali JSON senza
+    decodificarli; da un .cah caricato per intero le stringhe già decodificate.
+    """
+    if not isinstance(classes, bytes):
+        yield from classes.get('jobs', [])
+        return
+    m = _CLASS_STRINGS_START.match(classes)
+    if m is None:
+        # Forma inattesa: decodifica completa
+        yield from json.loads(classes).get('jobs', [])
+        return
+    pos = m.end()
+    while classes[pos:pos + 1] == b'"':
+        end = _skip_json_string(classes, pos)
+        yield classes[pos:end]
+        pos = _JSON_WS.match(classes, end).end()
+        if classes[pos:pos + 1] != b',':
+            return
+        pos = _JSON_WS.match(classes, pos + 1).end()
+
+def _description_at(descriptions, level):
+    """Descrizione valida al livello indicato: l'ultima già raggiunta, o la prima"""
+    current = descriptions[0][1] if descriptions else ''
+    for model_level, description in descriptions:
+        if model_level > level:
+            break
+        current = description
+    return current
+
+def character_features(data, cache=class_definitions):
+    """Privilegi sbloccati dai livelli di classe: [(classe, [(livello, nome, descrizione), ...]), ...]
+
+    Per ogni classe in 'jobs' i privilegi della classe e della sottoclasse
+    scelta fino al livello raggiunto, con la descrizione valida a quel
+    livello. Le definizioni vengono decodificate solo qui, non al caricamento
+    del .cah, e solo se non sono già in cache.
+    """
+    jobs = data.get('jobs', [])
+    classes = data.get('allRequiredClasses')
+    if not jobs or not classes:
+        return []
+    definitions = {definition['id']: definition for definition in cache.definitions(classes)}
+
+    result = []
+    for job in jobs:
+        definition = definitions.get(job.get('jobId', ''))
+        if definition is None:
+            continue
+        level = job.get('level', 1)
+        features = list(definition['features'])
+        features += definition['archetypes'].get(job.get('archetypeId'), ())
+        unlocked = [(feature_level, name, _description_at(descriptions, level))
+                    for feature_level, name, descriptions in features if feature_level <= level]
+        unlocked.sort(key=lambda feature: feature[0])
+        result.append((definition['name'] or job.get('jobId', '').title(), unlocked))
+    return result
+
+def _feature_summary(description):
+    """Prima frase della descrizione su una riga, al massimo FEATURE_SUMMARY_CHARS caratteri"""
+    text = " ".join(description.split())
+    end = text.find(". ")
+    if end != -1:
+        text = text[:end + 1]
+    if len(text) > FEATURE_SUMMARY_CHARS:
+        text = text[:FEATURE_SUMMARY_CHARS].rsplit(" ", 1)[0] + "..."
+    return text
+
+def features_text(class_features):
+    """Testo del campo Features and Traits: una riga per privilegio"""
+    lines = []
+    for class_name, features in class_features:
+        for level, name, description in features:
+            summary = _feature_summary(description)
+            lines.append(f"{name} ({class_name} {level}): {summary}" if summary else f"{name} ({class_name} {level})")
+    return "\n".join(lines)
+
+def extract_character_info(data, sheet_profile=None):
+    """Estrae le informazioni principali dal JSON del personaggio
+
+    Le chiavi sono i nomi dei campi del template descritto da sheet_profile
+    (predefinito: il template incluso).
+    """
+    columns = _character_columns(data)
+    return _build_character_info(data, columns, _derive_stats(*columns), sheet_profile or DEFAULT_PROFILE)
+
+def _build_character_info(data, columns, stats, sheet_profile):
+    """Compone i campi del PDF a partire dai dati grezzi e dai testi già derivati"""
+    total_level, scores, saves, _, _, spell_ability, skill_entries = columns
+    (prof_bonus_text, modifier_texts, save_texts, skill_texts, passive_text,
+     spell_dc_text, spell_attack_text) = stats
+    # Gli slot che il template non ha valgono None: finiscono tutti sotto la
+    # chiave None, tolta alla fine
+    fields = sheet_profile.fields
     char_info = {}
     
     # Informazioni base
-    char_info['CharacterName'] = data.get('name', '')
-    char_info['PlayerName'] = data.get('player', '')
-    char_info['Background'] = data.get('background', {}).get('backgroundId', '').replace('_', ' ').title()
+    char_info[fields['character_name']] = data.get('name', '')
+    char_info[fields['player_name']] = data.get('player', '')
+    char_info[fields['background']] = data.get('background', {}).get('backgroundId', '').replace('_', ' ').title()
     
     # Razza
     race_data = data.get('race', {})
-    char_info['Race '] = race_data.get('raceId', '').replace('_', ' ').title()
+    race = race_data.get('raceId', '').replace('_', ' ').title()
     subrace = race_data.get('subraceId', '')
     if subrace:
-        char_info['Race '] += f" ({subrace.replace('_', ' ').title()})"
+        race += f" ({subrace.replace('_', ' ').title()})"
+    char_info[fields['race']] = race
     
     # Classi e livello
     jobs = data.get('jobs', [])
-    total_level = sum(job.get('level', 0) for job in jobs)
-    char_info['ClassLevel'] = f"{jobs[0].get('jobId', '').title()} {total_level}" if jobs else ''
+    char_info[fields['class_level']] = f"{jobs[0].get('jobId', '').title()} {total_level}" if jobs else ''
     
     # Allineamento
     alignment = data.get('alignmentName', '').replace('_', ' ').title()
-    char_info['Alignment'] = alignment
+    char_info[fields['alignment']] = alignment
     
     # XP
-    char_info['XP'] = str(data.get('xp', 0))
+    char_info[fields['xp']] = str(experience(data))
     
     # Punteggi caratteristica e modificatori
-    ability_mapping = {
-        'strength': ('STR', 'STRmod'),
-        'dexterity': ('DEX', 'DEXmod '),
-        'constitution': ('CON', 'CONmod'),
-        'intelligence': ('INT', 'INTmod'),
-        'wisdom': ('WIS', 'WISmod'),
-        'charisma': ('CHA', 'CHamod')
-    }
-    
-    for ability, (score_field, mod_field) in ability_mapping.items():
-        ability_data = data.get(ability, {})
-        score = ability_data.get('score', 10)
-        modifier = calculate_modifier(score)
-        
+    for (score_field, mod_field, _, _), score, modifier_text in zip(sheet_profile.abilities, scores, modifier_texts):
         char_info[score_field] = str(score)
-        char_info[mod_field] = f"+{modifier}" if modifier >= 0 else str(modifier)
+        char_info[mod_field] = modifier_text
     
     # HP
-    char_info['HPMax'] = str(data.get('hp', 0))
-    char_info['HPCurrent'] = str(data.get('hp', 0))
+    char_info[fields['hp_max']] = str(data.get('hp', 0))
+    char_info[fields['hp_current']] = str(data.get('hp', 0))
     
     # CA (AC)
-    char_info['AC'] = str(data.get('baseAc', 10) + data.get('extraAC', 0))
+    char_info[fields['ac']] = str(data.get('baseAc', 10) + data.get('extraAC', 0))
     
     # Velocità
-    speed = data.get('race', {}).get('speed', {}).get('normal', 30)
-    char_info['Speed'] = f"{speed} ft."
+    speed = race_data.get('speed', {}).get('normal', 30)
+    char_info[fields['speed']] = f"{speed} ft."
     
     # Bonus di competenza
-    prof_bonus = get_proficiency_bonus(total_level)
-    char_info['ProfBonus'] = f"+{prof_bonus}"
+    char_info[fields['proficiency_bonus']] = prof_bonus_text
     
     # Tiri salvezza
-    save_mapping = {
-        'strength': 'ST Strength',
-        'dexterity': 'ST Dexterity',
-        'constitution': 'ST Constitution',
-        'intelligence': 'ST Intelligence',
-        'wisdom': 'ST Wisdom',
-        'charisma': 'ST Charisma'
-    }
-    
-    save_checkbox_mapping = {
-        'strength': 'Check Box 11',
-        'dexterity': 'Check Box 18',
-        'constitution': 'Check Box 19',
-        'intelligence': 'Check Box 20',
-        'wisdom': 'Check Box 21',
-        'charisma': 'Check Box 22'
-    }
-    
-    for ability, save_field in save_mapping.items():
-        ability_data = data.get(ability, {})
-        has_save = ability_data.get('save', False)
-        score = ability_data.get('score', 10)
-        modifier = calculate_modifier(score)
-        
+    for (_, _, save_field, checkbox), has_save, save_text in zip(sheet_profile.abilities, saves, save_texts):
         if has_save:
-            modifier += prof_bonus
             # Mark the checkbox
-            if ability in save_checkbox_mapping:
-                char_info[save_checkbox_mapping[ability]] = 'Yes'
-        
-        char_info[save_field] = f"+{modifier}" if modifier >= 0 else str(modifier)
-    
-    # Abilità
-    skills = data.get('skills', [])
-    skill_mapping = {
-        'ACROBATICS': ('Acrobatics', 'dexterity'),
-        'ANIMAL_HANDLING': ('Animal', 'wisdom'),
-        'ARCANA': ('Arcana', 'intelligence'),
-        'ATHLETICS': ('Athletics', 'strength'),
-        'DECEPTION': ('Deception ', 'charisma'),
-        'HISTORY': ('History ', 'intelligence'),
-        'INSIGHT': ('Insight', 'wisdom'),
-        'INTIMIDATION': ('Intimidation', 'charisma'),
-        'INVESTIGATION': ('Investigation ', 'intelligence'),
-        'MEDICINE': ('Medicine', 'wisdom'),
-        'NATURE': ('Nature', 'intelligence'),
-        'PERCEPTION': ('Perception ', 'wisdom'),
-        'PERFORMANCE': ('Performance', 'charisma'),
-        'PERSUASION': ('Persuasion', 'charisma'),
-        'RELIGION': ('Religion', 'intelligence'),
-        'SLEIGHT_OF_HAND': ('SleightofHand', 'dexterity'),
-        'STEALTH': ('Stealth ', 'dexterity'),
-        'SURVIVAL': ('Survival', 'wisdom')
-    }
-    
-    skill_checkbox_mapping = {
-        'ACROBATICS': 'Check Box 23',
-        'ANIMAL_HANDLING': 'Check Box 24',
-        'ARCANA': 'Check Box 25',
-        'ATHLETICS': 'Check Box 26',
-        'DECEPTION': 'Check Box 27',
-        'HISTORY': 'Check Box 28',
-        'INSIGHT': 'Check Box 29',
-        'INTIMIDATION': 'Check Box 30',
-        'INVESTIGATION': 'Check Box 31',
-        'MEDICINE': 'Check Box 32',
-        'NATURE': 'Check Box 33',
-        'PERCEPTION': 'Check Box 34',
-        'PERFORMANCE': 'Check Box 35',
-        'PERSUASION': 'Check Box 36',
-        'RELIGION': 'Check Box 37',
-        'SLEIGHT_OF_HAND': 'Check Box 38',
-        'STEALTH': 'Check Box 39',
-        'SURVIVAL': 'Check Box 40'
-    }
+            char_info[checkbox] = 'Yes'
+        char_info[save_field] = save_text
     
-    for skill in skills:
-        skill_type = skill.get('typeName', '')
-        proficiency = skill.get('proficiencyName', 'NONE')
-        
-        if skill_type in skill_mapping:
-            skill_name, ability = skill_mapping[skill_type]
-            ability_score = data.get(ability, {}).get('score', 10)
-            modifier = calculate_modifier(ability_score)
-            
-            if proficiency == 'FULL':
-                modifier += prof_bonus
-                if skill_type in skill_checkbox_mapping:
-                     char_info[skill_checkbox_mapping[skill_type]] = 'Yes'
-            elif proficiency == 'EXPERT':
-                modifier += prof_bonus * 2
-                if skill_type in skill_checkbox_mapping:
-                     char_info[skill_checkbox_mapping[skill_type]] = 'Yes'
-            
-            char_info[skill_name] = f"+{modifier}" if modifier >= 0 else str(modifier)
+    # Abilità: i valori sono già calcolati, qui si seguono le voci del .cah
+    # perché l'ordine dei campi nel dizionario resti lo stesso
+    for index, proficient in skill_entries:
+        skill_name, checkbox = sheet_profile.skills[index]
+        if proficient:
+            char_info[checkbox] = 'Yes'
+        char_info[skill_name] = skill_texts[index]
     
     # Initiativa
-    dex_mod = calculate_modifier(data.get('dexterity', {}).get('score', 10))
-    char_info['Initiative'] = f"+{dex_mod}" if dex_mod >= 0 else str(dex_mod)
+    char_info[fields['initiative']] = modifier_texts[ABILITIES.index('dexterity')]
     
     # Percezione passiva
-    perception_bonus = 0
-    for skill in skills:
-        if skill.get('typeName') == 'PERCEPTION':
-            wis_score = data.get('wisdom', {}).get('score', 10)
-            wis_mod = calculate_modifier(wis_score)
-            proficiency = skill.get('proficiencyName', 'NONE')
-            
-            if proficiency == 'FULL':
-                perception_bonus = wis_mod + prof_bonus
-            elif proficiency == 'EXPERT':
-                perception_bonus = wis_mod + (prof_bonus * 2)
-            else:
-                perception_bonus = wis_mod
-    
-    char_info['Passive'] = str(10 + perception_bonus)
+    char_info[fields['passive_perception']] = passive_text
     
     # Magie
     spells = data.get('spells', [])
     if spells:
         # Classe incantatore e caratteristica
-        spellcaster_class = ''
-        spellcasting_ability = ''
-        
-        for job in jobs:
-            job_id = job.get('jobId', '').lower()
-            if job_id in ['wizard', 'sorcerer', 'warlock', 'bard', 'cleric', 'druid', 'paladin', 'ranger']:
-                spellcaster_class = job.get('jobId', '').title()
-                
-                # Determina la caratteristica da incantesimo
-                if job_id in ['wizard']:
-                    spellcasting_ability = 'Intelligence'
-                    ability_score = data.get('intelligence', {}).get('score', 10)
-                elif job_id in ['sorcerer', 'bard', 'warlock']:
-                    spellcasting_ability = 'Charisma'
-                    ability_score = data.get('charisma', {}).get('score', 10)
-                elif job_id in ['cleric', 'druid', 'paladin', 'ranger']:
-                    spellcasting_ability = 'Wisdom'
-                    ability_score = data.get('wisdom', {}).get('score', 10)
-                break
-        
-        if spellcasting_ability:
-            char_info['Spellcasting Class 2'] = spellcaster_class
-            char_info['SpellcastingAbility 2'] = spellcasting_ability
+        if spell_ability >= 0:
+            for job in jobs:
+                if job.get('jobId', '').lower() in SPELLCASTING_ABILITIES:
+                    char_info[fields['spellcasting_class']] = job.get('jobId', '').title()
+                    break
+            char_info[fields['spellcasting_ability']] = ABILITIES[spell_ability].title()
             
             # CD Tiro Salvezza Incantesimi
-            spell_mod = calculate_modifier(ability_score)
-            spell_save_dc = 8 + prof_bonus + spell_mod
-            char_info['SpellSaveDC  2'] = str(spell_save_dc)
+            char_info[fields['spell_save_dc']] = spell_dc_text
             
             # Bonus di attacco con incantesimo
-            spell_attack_bonus = prof_bonus + spell_mod
-            char_info['SpellAtkBonus 2'] = f"+{spell_attack_bonus}" if spell_attack_bonus >= 0 else str(spell_attack_bonus)
+            char_info[fields['spell_attack_bonus']] = spell_attack_text
         
-        # Slot incantesimi (il PDF usa 19-27 per livelli 1-9)
-        spell_slots = data.get('spellSlots', {})
-        for level in range(1, 10):
-            slot_key = f'Lvl{level}'
-            if slot_key in spell_slots:
-                slots = spell_slots[slot_key]
-                pdf_level = 18 + level  # 19-27
-                char_info[f'SlotsTotal {pdf_level}'] = str(slots)
-                char_info[f'SlotsRemaining {pdf_level}'] = str(slots)
+        # Slot incantesimi per livello: totali e rimanenti
+        for (total_field, remaining_field), slots in zip(sheet_profile.spell_slots, spell_slots(data)):
+            if slots:
+                char_info[total_field] = str(slots)
+                char_info[remaining_field] = str(slots)
         
         # Organizza gli incantesimi per livello
         spells_by_level = {}
         for spell in spells:
-            level = spell.get('level', 0)
-            if level not in spells_by_level:
-                spells_by_level[level] = []
-            
-            spell_info = {
-                'name': spell.get('name', ''),
-                'prepared': spell.get('prepared', False),
-                'ritual': 'ritual' in spell.get('tags', [])
-            }
-            spells_by_level[level].append(spell_info)
-        
-        # Trucchetti (Cantrips - livello 0) - Non ci sono campi per cantrips nel PDF standard
-        # Gli incantesimi iniziano da livello 1
-        
-        # Incantesimi di livello 1-9
-        # Il PDF usa una numerazione strana: Spells 1014-1022 per livello 1, ecc.
-        spell_field_start = {
-            1: 1014,
-            2: 1023,
-            3: 1031,
-            4: 1039,
-            5: 1047,
-            6: 1055,
-            7: 1063,
-            8: 1071,
-            9: 1079
-        }
+            spells_by_level.setdefault(spell.get('level', 0), []).append(spell)
         
-        for level in range(1, 10):
-            if level in spells_by_level and level in spell_field_start:
-                start_num = spell_field_start[level]
-                for i, spell in enumerate(spells_by_level[level][:9], 0):  # Max 9 incantesimi per livello
-                    spell_name = spell['name']
-                    if spell['prepared']:
-                        spell_name = "✓ " + spell_name
-                    if spell['ritual']:
-                        spell_name = spell_name + " (R)"
-                    
-                    field_num = start_num + i
-                    char_info[f'Spells {field_num}'] = spell_name
-    
-    return char_info
-
-def fill_pdf(template_path, output_path, field_data):
-    """Compila il PDF sovrapponendo il testo alle coordinate dei campi"""
-    # 1. Crea il PDF con i testi usando ReportLab
-    packet = io.BytesIO()
-    c = canvas.Canvas(packet, pagesize=letter)
-    
-    reader = PdfReader(template_path)
-    
-    # print("Generazione overlay testo...")
-    
-    # Itera su ogni pagina del template per trovare i campi e le loro coordinate
-    for page_num, page in enumerate(reader.pages):
-        if "/Annots" in page:
-            for annot in page["/Annots"]:
-                obj = annot.get_object()
-                if "/T" in obj:
-                    field_name = obj["/T"]
-                    
-                    if field_name in field_data:
-                        text_to_draw = field_data[field_name]
-                        
-                        # Ottieni coordinate (Rect è [x1, y1, x2, y2])
-                        rect = obj.get("/Rect")
-                        if rect:
-                            x1 = float(rect[0])
-                            y1 = float(rect[1])
-                            x2 = float(rect[2])
-                            y2 = float(rect[3])
-                            
-                            # Calcola altezza e larghezza
-                            width = x2 - x1
-                            height = y2 - y1
-                            
-                            # Stima dimensione font (60% dell'altezza, max 10pt)
-                            font_size = min(height * 0.6, 10)
-                            
-                            # Posiziona il testo
-                            if field_name.startswith("Check Box"):
-                                # Per i checkbox, disegna un pallino pieno centrato
-                                c.setFont("Helvetica", 12)  # Dimensione fissa per il pallino
-                                text_width = c.stringWidth("•", "Helvetica", 12)
-                                text_x = x1 + (width - text_width) / 2
-                                text_y = y1 + (height - 12) / 2 + 2 # Aggiustamento verticale
-                                c.drawString(text_x, text_y, "•")
-                            else:
-                                # Per i campi di testo normali
-                                text_x = x1 + 2
-                                text_y = y1 + (height - font_size) / 2 + 1
-                                c.setFont("Helvetica", font_size)
-                                c.drawString(text_x, text_y, text_to_draw)
-        
-        # Passa alla prossima pagina nel canvas ReportLab
-        c.showPage()
-    
-    c.save()
-    packet.seek(0)
-    
-    # 2. Unisci il PDF originale con l'overlay
-    new_pdf = PdfReader(packet)
-    writer = PdfWriter()
-    
-    # print("Unione layer...")
+        # Trucchetti e livelli 1-9: quelli che non entrano nel riquadro del
+        # livello passano alle pagine di continuazione, nello stesso riquadro
+        continuation = []
+        for level, level_fields in sheet_profile.spells.items():
+            if not level_fields:
+                continue
+            for i, spell in enumerate(spells_by_level.get(level, ())):
+                spell_name = spell.get('name', '')
+                if spell.get('prepared', False):
+                    spell_name = "✓ " + spell_name
+                if 'ritual' in spell.get('tags', []):
+                    spell_name = spell_name + " (R)"
+                
+                page, row = divmod(i, len(level_fields))
+                if page == 0:
+                    char_info[level_fields[row]] = spell_name
+                    continue
+                while len(continuation) < page:
+                    continuation.append({name: char_info[name] for name in sheet_profile.spell_header
+                                         if name in char_info})
+                continuation[page - 1][level_fields[row]] = spell_name
+        if continuation:
+            char_info[SPELL_PAGES_FIELD] = continuation
     
-    # Copia le pagine originali e unisci l'overlay
-    for i, page in enumerate(reader.pages):
-        if i < len(new_pdf.pages):
-            overlay_page = new_pdf.pages[i]
-            page.merge_page(overlay_page)
-        
-        # Rimuoviamo i campi form originali per rendere il PDF "non editabile"
-        if "/Annots" in page:
-             del page["/Annots"]
-            
-        writer.add_page(page)
+    # Privilegi di classe e sottoclasse fino al livello raggiunto
+    features = features_text(character_features(data))
+    if features:
+        char_info[fields['features']] = features
     
-    # Rimuovi la struttura del form (AcroForm) dal root object se presente
-    if "/AcroForm" in writer._root_object:
-        del writer._root_object["/AcroForm"]
+    # Ritratto: il base64 resta com'è, lo decodifica il render solo se la
+    # miniatura non è già nella cache dei ritratti
+    if data.get('image'):
+        char_info[fields['portrait']] = data['image']
     
-    # Salva il risultato
-    with open(output_path, 'wb') as output_file:
-        writer.write(output_file)
+    char_info.pop(None, None)
+    return char_info
+
+def _import_numpy():
+    """NumPy è opzionale e serve solo alla derivazione in blocco: lo importa al primo uso"""
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+def _format_column(np, values, formatter):
+    """Formatta un array di interi passando da una tabella con un testo per valore"""
+    if values.size == 0:
+        return values.tolist()
+    low = int(values.min())
+    table = np.array([formatter(value) for value in range(low, int(values.max()) + 1)], dtype=object)
+    return table[values - low].tolist()
+
+def derive_roster_stats(columns):
+    """Calcola in blocco, con operazioni vettoriali NumPy, le statistiche di un roster
+
+    columns è la lista dei valori restituiti da _character_columns; il
+    risultato ha un array per statistica, una riga per personaggio.
+    """
+    np = _import_numpy()
+    if np is None:
+        raise ImportError("NumPy non installato: la derivazione in blocco richiede numpy")
+    total_level, scores, saves, skill_multipliers, has_perception, spell_ability = (
+        np.array(column, dtype=np.int64) for column in list(zip(*columns))[:6]
+    )
+    prof_bonus = 2 + (total_level - 1) // 4
+    modifiers = (scores - 10) // 2
+    skill_values = modifiers[:, SKILL_ABILITY_INDEX] + prof_bonus[:, None] * skill_multipliers
+    rows = np.arange(len(columns))
+    spell_mod = np.where(spell_ability >= 0, modifiers[rows, np.maximum(spell_ability, 0)], 0)
+    return {
+        'prof_bonus': prof_bonus,
+        'modifiers': modifiers,
+        'save_values': modifiers + prof_bonus[:, None] * saves,
+        'skill_values': skill_values,
+        'passive': 10 + np.where(has_perception, skill_values[:, PERCEPTION_INDEX], 0),
+        'spell_save_dc': 8 + prof_bonus + spell_mod,
+        'spell_attack_bonus': prof_bonus + spell_mod,
+    }
+
+def check_field_types(char_info, sheet_profile=None):
+    """Verifica che i valori estratti siano testo prima di passarli al render
+
+    Un .cah che è JSON valido ma con tipi sbagliati (es. "name": 5) solleva
+    qui ValueError invece di un TypeError a metà del disegno.
+    """
+    portrait_field = (sheet_profile or DEFAULT_PROFILE).fields.get('portrait')
+    for field, value in char_info.items():
+        if field == SPELL_PAGES_FIELD:
+            values = [(name, text) for page in value for name, text in page.items()]
+        elif field == portrait_field and isinstance(value, RawImage):
+            continue
+        else:
+            values = [(field, value)]
+        for name, text in values:
+            if not isinstance(text, str):
+                raise ValueError(f"Campo '{name}' non valido: atteso testo, trovato {type(text).__name__}")
+
+def extract_character_info_batch(characters, sheet_profile=None):
+    """Come extract_character_info, ma per un intero roster in una sola passata
+
+    Con NumPy installato le statistiche derivate sono calcolate e formattate in
+    blocco da derive_roster_stats; altrimenti (o se un valore non è intero) si
+    usa la versione scalare. I dizionari restituiti sono identici in entrambi i casi.
+    """
+    characters = list(characters)
+    sheet_profile = sheet_profile or DEFAULT_PROFILE
+    columns = [_character_columns(data) for data in characters]
+    np = _import_numpy()
+    vectorizable = np is not None and columns and all(
+        type(total_level) is int and all(type(score) is int for score in scores)
+        for total_level, scores, *_ in columns
+    )
+    if not vectorizable:
+        return [_build_character_info(data, row, _derive_stats(*row), sheet_profile)
+                for data, row in zip(characters, columns)]
     
-    # print(f"✓ File salvato con overlay grafico: {output_path.stat().st_size} bytes")
+    stats = derive_roster_stats(columns)
+    per_character = zip(
+        _format_column(np, stats['prof_bonus'], lambda value: f"+{value}"),
+        _format_column(np, stats['modifiers'], _signed),
+        _format_column(np, stats['save_values'], _signed),
+        _format_column(np, stats['skill_values'], _signed),
+        _format_column(np, stats['passive'], str),
+        _format_column(np, stats['spell_save_dc'], str),
+        _format_column(np, stats['spell_attack_bonus'], _signed),
+    )
+    return [_build_character_info(data, row, row_stats, sheet_profile)
+            for data, row, row_stats in zip(characters, columns, per_character)]
+
+# Esportazione delle sole statistiche (--stats-only): chiavi del .cah da
+# decodificare e colonne dell'output, nell'ordine in cui vengono scritte
+STATS_KEYS = frozenset({
+    'name', 'player', 'race', 'jobs', 'exp', 'xp', 'hp', 'baseAc', 'extraAC',
+    'strength', 'dexterity', 'constitution', 'intelligence', 'wisdom', 'charisma',
+    'skills', 'spellSlots',
+})
+STATS_FIELDS = (
+    ('file', 'name', 'player', 'class', 'level', 'race', 'xp', 'hp', 'ac', 'speed', 'proficiency_bonus')
+    + tuple(f'{ability}{suffix}' for ability in ABILITIES
+            for suffix in ('', '_mod', '_save', '_save_proficient'))
+    + tuple(skill_type.lower() for skill_type in SKILL_TYPES)
+    + ('passive_perception', 'spellcasting_ability', 'spell_save_dc', 'spell_attack_bonus')
+    + tuple(f'slots_{level}' for level in range(1, 10))
+)
+STATS_FORMATS = ("jsonl", "csv")
+# File per finestra con più processi: limita i risultati in attesa di scrittura
+STATS_WINDOW = 256
+
+def character_stats(data):
+    """Statistiche derivate di un personaggio come valori tipizzati (interi, bool, None)
+
+    Le chiavi sono quelle di STATS_FIELDS tranne 'file'; CD e bonus di attacco
+    degli incantesimi sono None se il personaggio non è un incantatore.
+    """
+    columns = _character_columns(data)
+    total_level, scores, saves, _, _, spell_ability, _ = columns
+    prof_bonus, modifiers, save_values, skill_values, passive, spell_dc, spell_attack = _derive_values(*columns)
+    jobs = data.get('jobs', [])
+    race_data = data.get('race', {})
+    record = {
+        'name': data.get('name', ''),
+        'player': data.get('player', ''),
+        'class': jobs[0].get('jobId', '') if jobs else '',
+        'level': total_level,
+        'race': race_data.get('raceId', ''),
+        'xp': experience(data),
+        'hp': data.get('hp', 0),
+        'ac': data.get('baseAc', 10) + data.get('extraAC', 0),
+        'speed': race_data.get('speed', {}).get('normal', 30),
+        'proficiency_bonus': prof_bonus,
+    }
+    for ability, score, modifier, save, save_value in zip(ABILITIES, scores, modifiers, saves, save_values):
+        record[ability] = score
+        record[f'{ability}_mod'] = modifier
+        record[f'{ability}_save'] = save_value
+        record[f'{ability}_save_proficient'] = bool(save)
+    for skill_type, value in zip(SKILL_TYPES, skill_values):
+        record[skill_type.lower()] = value
+    record['passive_perception'] = passive
+    caster = spell_ability >= 0
+    record['spellcasting_ability'] = ABILITIES[spell_ability] if caster else None
+    record['spell_save_dc'] = spell_dc if caster else None
+    record['spell_attack_bonus'] = spell_attack if caster else None
+    for level, slots in enumerate(spell_slots(data), 1):
+        record[f'slots_{level}'] = slots
+    return record
+
+def _file_stats(cah_file):
+    """Statistiche di un file come (record, errore): gira anche nei worker"""
+    try:
+        return character_stats(load_character_data(cah_file, keys=STATS_KEYS)), None
+    except Exception as e:
+        return None, e
+
+def iter_character_stats(files, jobs=1):
+    """Statistiche dei file .cah nell'ordine dato: (file, record, errore)
+
+    Decodifica solo le chiavi di STATS_KEYS, senza template né librerie PDF.
+    Con jobs > 1 i file sono letti da più processi a finestre di
+    STATS_WINDOW, così in memoria resta al più una finestra di risultati.
+    """
+    files = list(files)
+    if jobs <= 1 or len(files) <= 1:
+        for cah_file in files:
+            yield (cah_file, *_file_stats(cah_file))
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        for start in range(0, len(files), STATS_WINDOW):
+            window = files[start:start + STATS_WINDOW]
+            chunksize = max(1, len(window) // (jobs * 4))
+            for cah_file, result in zip(window, executor.map(_file_stats, window, chunksize=chunksize)):
+                yield (cah_file, *result)
+
+@contextlib.contextmanager
+def _open_text_output(output):
+    """Come _open_output ma in testo: un percorso, "-" per stdout o uno stream già aperto"""
+    if output == "-":
+        yield sys.stdout
+    elif hasattr(output, 'write'):
+        yield output
+    else:
+        with open(output, 'w', encoding='utf-8', newline='') as f:
+            yield f
+
+def write_character_stats(files, output="-", fmt="jsonl", on_error=None, jobs=1):
+    """Scrive le statistiche dei file in JSON Lines o CSV, una riga per personaggio
+
+    Le righe vengono scritte man mano che i file sono letti. I file che non
+    si riescono a leggere vengono saltati e passati a on_error(file, errore).
+    Restituisce (personaggi scritti, errori).
+    """
+    if fmt not in STATS_FORMATS:
+        raise ValueError(f"Formato sconosciuto: {fmt}")
+    written = errors = 0
+    with _open_text_output(output) as out:
+        if fmt == "csv":
+            import csv
+            writer = csv.DictWriter(out, fieldnames=STATS_FIELDS)
+            writer.writeheader()
+            write_row = writer.writerow
+        else:
+            encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+            write_row = lambda row: out.write(encoder.encode(row) + "\n")
+        for cah_file, record, error in iter_character_stats(files, jobs):
+            if error is not None:
+                errors += 1
+                if on_error is not None:
+                    on_error(cah_file, error)
+                continue
+            write_row({'file': Path(cah_file).name, **record})
+            written += 1
+    return written, errors
+
+def file_sha256(path):
+    """Calcola l'hash SHA-256 del contenuto di un file"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+# Motori di compilazione disponibili: il primo è quello predefinito
+FILL_ENGINES = ("overlay", "acroform")
+
+def _init_batch_worker(template_path, font=None, persist=True):
+    """Inizializza un processo worker caricando subito motore di render, template e font
+
+    Con persist=False l'indice del template non viene salvato su disco.
+    """
+    renderer = _import_renderer()
+    renderer.template_cache.get(template_path, persist)
+    renderer.get_text_font(font)
+
+# Fasi misurate da --profile, nell'ordine in cui avvengono
+PROFILE_STAGES = ("load", "extract", "cache", "template", "draw", "merge", "fields", "write")
+
+class StageProfiler:
+    """Raccoglie tempo wall e CPU per fase e i contatori di una conversione"""
+
+    def __init__(self, cprofile_stage=None):
+        self.stages = {}
+        self.counters = {}
+        # Con cprofile_stage la fase indicata viene anche profilata con cProfile
+        self.cprofile_stage = cprofile_stage
+        self._cprofile = None
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        cprofile = None
+        if name == self.cprofile_stage:
+            if self._cprofile is None:
+                import cProfile
+                self._cprofile = cProfile.Profile()
+            cprofile = self._cprofile
+            cprofile.enable()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+            if cprofile is not None:
+                cprofile.disable()
+            totals = self.stages.setdefault(name, [0.0, 0.0])
+            totals[0] += wall
+            totals[1] += cpu
+
+    def set(self, name, value):
+        self.counters[name] = value
 
-def process_cah_file(cah_file, output_dir):
-    """Logica core per processare un singolo file"""
+    def report(self):
+        """Riepilogo serializzabile in JSON (tempi in millisecondi)"""
+        report = {
+            'stages': {
+                name: {'wall_ms': round(wall * 1000, 3), 'cpu_ms': round(cpu * 1000, 3)}
+                for name, (wall, cpu) in self.stages.items()
+            },
+            'total_wall_ms': round(sum(wall for wall, _ in self.stages.values()) * 1000, 3),
+        }
+        report.update(self.counters)
+        if self._cprofile is not None:
+            import pstats
+            stream = io.StringIO()
+            pstats.Stats(self._cprofile, stream=stream).sort_stats("cumulative").print_stats(15)
+            report['cprofile'] = {'stage': self.cprofile_stage, 'stats': stream.getvalue()}
+        return report
+
+class _NullProfiler:
+    """Profiler spento: nessuna misura e costo trascurabile"""
+
+    _context = contextlib.nullcontext()
+
+    def stage(self, name):
+        return self._context
+
+    def set(self, name, value):
+        pass
+
+NULL_PROFILER = _NullProfiler()
+
+def format_profile_table(file_name, report):
+    """Tabella leggibile di un report di StageProfiler"""
+    lines = [f"  Profilo {file_name}:", f"    {'Fase':<10}{'Wall ms':>10}{'CPU ms':>10}"]
+    for name, stage in report['stages'].items():
+        lines.append(f"    {name:<10}{stage['wall_ms']:>10.1f}{stage['cpu_ms']:>10.1f}")
+    lines.append(f"    {'totale':<10}{report['total_wall_ms']:>10.1f}")
+    if 'bytes_read' in report:
+        lines.append(f"    Byte letti: {report['bytes_read']}")
+    if 'bytes_written' in report:
+        lines.append(f"    Byte scritti: {report['bytes_written']}")
+    if 'fields_per_page' in report:
+        lines.append(f"    Campi per pagina: {', '.join(str(n) for n in report['fields_per_page'])}")
+    if 'cache_hit' in report:
+        lines.append(f"    Cache: {'sì' if report['cache_hit'] else 'no'}")
+    if 'cprofile' in report:
+        lines.append(f"    cProfile della fase {report['cprofile']['stage']}:")
+        lines.append(report['cprofile']['stats'])
+    return "\n".join(lines)
+
+@contextlib.contextmanager
+def _open_output(output):
+    """Apre il percorso di output, oppure usa così com'è uno stream binario già aperto"""
+    if hasattr(output, 'write'):
+        yield output
+    else:
+        with open(output, 'wb') as output_file:
+            yield output_file
+
+def _output_size(output):
+    """Byte scritti sull'output, se si possono sapere"""
+    if not hasattr(output, 'write'):
+        return os.path.getsize(output)
+    try:
+        return output.tell()
+    except (OSError, ValueError):
+        return None
+
+# Versione del renderer: va incrementata quando cambia il modo in cui le schede
+# vengono disegnate, così i PDF in cache delle versioni precedenti non valgono più
+RENDERER_VERSION = 5
+
+# Cache dei render dentro la cartella di output, con i limiti per l'eviction
+RENDER_CACHE_DIR = ".render_cache"
+RENDER_CACHE_MAX_BYTES = 256 * 1024 * 1024
+RENDER_CACHE_MAX_AGE = 30 * 24 * 3600
+# Oltre il limite l'eviction scende al 90%, così non scatta a ogni nuova scheda;
+# il journal del manifest viene compattato quando supera questa dimensione
+RENDER_CACHE_EVICT_RATIO = 0.9
+RENDER_CACHE_JOURNAL_MAX_BYTES = 1024 * 1024
+
+_template_digests = {}
+_template_digests_lock = threading.Lock()
+
+def template_digest(template_path):
+    """Hash SHA-256 del template, ricalcolato solo se il file cambia"""
+    template_path = Path(template_path).resolve()
+    stat = os.stat(template_path)
+    stat_key = (template_path, stat.st_mtime_ns, stat.st_size)
+    with _template_digests_lock:
+        digest = _template_digests.get(stat_key)
+    if digest is None:
+        digest = file_sha256(template_path)
+        with _template_digests_lock:
+            _template_digests[stat_key] = digest
+    return digest
+
+_template_profiles = {}
+_template_profiles_lock = threading.Lock()
+
+def profile_for_template(template_pdf=None, persist=True):
+    """Profilo compilato del template, con la discovery solo al primo utilizzo
+
+    Il template incluso usa il profilo predefinito. Per gli altri si legge il
+    .profile.json accanto al template; se manca o è di una versione diversa
+    del template, il template viene registrato con register_template.
+    Con persist=False la discovery non scrive né profilo né indice.
+    """
+    template_path = resolve_template(template_pdf)
+    if template_pdf is None or template_path.resolve() == get_resource_path(DEFAULT_TEMPLATE).resolve():
+        return DEFAULT_PROFILE
+    template_path = template_path.resolve()
+    stat = os.stat(template_path)
+    stat_key = (template_path, stat.st_mtime_ns, stat.st_size)
+    with _template_profiles_lock:
+        sheet_profile = _template_profiles.get(stat_key)
+    if sheet_profile is None:
+        sheet_profile = sheet_profiles.load_profile(template_path, template_digest(template_path))
+        if sheet_profile is None:
+            sheet_profile = register_template(template_path, persist=persist)
+        else:
+            sheet_profiles.register_profile(sheet_profile)
+        with _template_profiles_lock:
+            _template_profiles[stat_key] = sheet_profile
+    return sheet_profile
+
+def register_template(template_pdf, name=None, persist=True):
+    """Discovery dei campi di un nuovo template: salva e registra il suo profilo
+
+    I nomi dei campi vengono dall'indice del template (carica il motore di
+    render). Il profilo proposto finisce in <template>.profile.json, dove
+    si può correggere a mano; gli slot senza campo sono in 'missing'.
+    """
+    template_path = Path(template_pdf).resolve()
+    index = _import_renderer().load_template_index(template_path, persist)
+    field_names = list(index['fields']) + list(index.get('images', {}))
+    sheet_profile = sheet_profiles.compile_profile(template_path, template_digest(template_path),
+                                                   field_names, name, persist)
+    return sheet_profiles.register_profile(sheet_profile)
+
+def font_digest(font=None):
+    """Font del testo nella chiave della cache: il nome dei font inclusi, l'hash di un .ttf esterno"""
+    font = font or DEFAULT_FONT
+    return font if font in TEXT_FONTS else template_digest(font)
+
+def _cache_key_value(value):
+    """Il ritratto grezzo entra nella chiave con il suo hash, senza decodificarlo"""
+    if isinstance(value, RawImage):
+        return f"sha256:{value.digest}"
+    raise TypeError(f"Valore non serializzabile nella chiave: {type(value).__name__}")
+
+def render_cache_key(char_info, template_hash, engine="overlay", flatten=False, font_hash=DEFAULT_FONT):
+    """Chiave della cache: dipende solo da ciò che finisce davvero nel PDF"""
+    payload = json.dumps(
+        [RENDERER_VERSION, template_hash, engine, bool(flatten), font_hash, char_info],
+        sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=_cache_key_value,
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class RenderCache:
+    """Cache su disco dei PDF già generati, indirizzata dalla chiave di render
+
+    I PDF sono salvati come <chiave>.pdf in output/.render_cache/; il file
+    manifest.json ne registra origine, dimensione e ultimo utilizzo. Ogni
+    processo legge il manifest una sola volta; le modifiche successive sono
+    righe aggiunte a manifest.journal, che viene riassorbito nel manifest
+    (scritto per intero con un rename atomico) quando cresce troppo o quando
+    serve l'eviction. Solo se il manifest manca o è illeggibile le voci
+    vengono ricostruite dai file presenti nella cartella.
+    """
+
+    MANIFEST_VERSION = 2
+    _lock = threading.Lock()
+    # Stato per cartella condiviso dalle istanze del processo: {root: {'entries', 'total'}}
+    _states = {}
+
+    def __init__(self, output_dir, max_bytes=RENDER_CACHE_MAX_BYTES, max_age=RENDER_CACHE_MAX_AGE):
+        self.root = (Path(output_dir) / RENDER_CACHE_DIR).resolve()
+        self.manifest_path = self.root / "manifest.json"
+        self.journal_path = self.root / "manifest.journal"
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+    def _blob_path(self, key):
+        return self.root / f"{key}.pdf"
+
+    def _read_manifest(self):
+        """Voci del manifest, o None se manca, è illeggibile o di un'altra versione"""
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest.get('version') != self.MANIFEST_VERSION:
+                return None
+            return dict(manifest['entries'])
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            return None
+
+    def _scan_blobs(self):
+        """Ricostruisce le voci dai PDF presenti nella cartella"""
+        entries = {}
+        if self.root.exists():
+            for entry in os.scandir(self.root):
+                if entry.name.endswith(".pdf") and entry.is_file():
+                    stat = entry.stat()
+                    entries[entry.name[:-4]] = {'size': stat.st_size, 'created': stat.st_mtime,
+                                                'used': stat.st_mtime}
+        return entries
+
+    def _replay(self, journal_path, entries):
+        """Applica alle voci le righe del journal (quelle troncate vengono ignorate)"""
+        try:
+            with open(journal_path, 'r', encoding='utf-8') as f:
+                lines = f.readlines()
+        except OSError:
+            return
+        for line in lines:
+            try:
+                record = json.loads(line)
+                key = record['key']
+                if 'entry' in record:
+                    entries[key] = record['entry']
+                elif key in entries:
+                    entries[key]['used'] = record['used']
+            except (ValueError, KeyError, TypeError):
+                continue
+
+    def _append(self, record):
+        """Aggiunge una riga al journal e ne restituisce la dimensione"""
+        try:
+            with open(self.journal_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record) + "\n")
+                return f.tell()
+        except OSError:
+            # Senza journal la voce resta in memoria; alla peggio la cartella viene riletta
+            return 0
+
+    def _compact(self):
+        """Riassorbe il journal nel manifest, applica l'eviction e riscrive il manifest
+
+        Il journal viene prima spostato da parte: le righe che altri processi
+        aggiungono nel frattempo finiscono in un journal nuovo.
+        """
+        old_journal = self.journal_path.with_name(f"manifest.journal.{os.getpid()}.old")
+        try:
+            os.replace(self.journal_path, old_journal)
+        except OSError:
+            old_journal = None
+        entries = self._read_manifest()
+        if entries is None:
+            entries = self._scan_blobs()
+        if old_journal is not None:
+            self._replay(old_journal, entries)
+        self._evict(entries, time.time())
+        try:
+            self.root.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.manifest_path.with_name(f"manifest.{os.getpid()}.tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'version': self.MANIFEST_VERSION, 'entries': entries}, f, indent=1)
+            os.replace(tmp_path, self.manifest_path)
+            if old_journal is not None:
+                os.remove(old_journal)
+        except OSError:
+            # Manifest non scrivibile: resta il journal spostato, riletto dalla prossima compattazione
+            pass
+        return self._set_state(entries)
+
+    def _set_state(self, entries):
+        state = self._states[self.root] = {
+            'entries': entries,
+            'total': sum(entry['size'] for entry in entries.values()),
+        }
+        return state
+
+    def _over_limits(self, entries, now):
+        return (sum(entry['size'] for entry in entries.values()) > self.max_bytes
+                or any(now - entry['used'] > self.max_age for entry in entries.values()))
+
+    def _state(self):
+        """Voci della cartella, lette dal disco solo al primo uso nel processo"""
+        state = self._states.get(self.root)
+        if state is None:
+            entries = self._read_manifest()
+            if entries is not None:
+                self._replay(self.journal_path, entries)
+            if entries is None or self._over_limits(entries, time.time()):
+                state = self._compact()
+            else:
+                state = self._set_state(entries)
+        return state
+
+    def _evict(self, entries, now):
+        """Rimuove le voci troppo vecchie e poi le meno usate oltre il limite di spazio"""
+        by_use = sorted(entries, key=lambda key: entries[key]['used'])
+        total = sum(entry['size'] for entry in entries.values())
+        target = self.max_bytes if total <= self.max_bytes else self.max_bytes * RENDER_CACHE_EVICT_RATIO
+        for key in by_use:
+            entry = entries[key]
+            if now - entry['used'] <= self.max_age and total <= target:
+                continue
+            try:
+                os.remove(self._blob_path(key))
+            except OSError:
+                pass
+            total -= entry['size']
+            del entries[key]
+
+    def fetch(self, key, output_path):
+        """Copia il PDF in cache su output_path; restituisce False se la chiave non c'è"""
+        blob_path = self._blob_path(key)
+        try:
+            shutil.copyfile(blob_path, output_path)
+        except FileNotFoundError:
+            with self._lock:
+                # Rimosso dall'eviction di un altro processo
+                state = self._states.get(self.root)
+                if state is not None and key in state['entries']:
+                    state['total'] -= state['entries'].pop(key)['size']
+            return False
+        now = time.time()
+        with self._lock:
+            entries = self._state()['entries']
+            if key in entries:
+                entries[key]['used'] = now
+                record = {'key': key, 'used': now}
+            else:
+                # PDF presente ma senza voce (scritto da un altro processo): la voce viene aggiunta
+                size = blob_path.stat().st_size
+                entries[key] = {'size': size, 'created': now, 'used': now}
+                self._states[self.root]['total'] += size
+                record = {'key': key, 'entry': entries[key]}
+            if self._append(record) > RENDER_CACHE_JOURNAL_MAX_BYTES:
+                self._compact()
+        return True
+
+    def store(self, key, output_path, source=None):
+        """Salva in cache il PDF appena generato e applica l'eviction se serve"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        blob_path = self._blob_path(key)
+        tmp_path = blob_path.with_name(f"{key}.{os.getpid()}.{threading.get_ident()}.tmp")
+        shutil.copyfile(output_path, tmp_path)
+        os.replace(tmp_path, blob_path)
+        now = time.time()
+        entry = {
+            'size': blob_path.stat().st_size,
+            'created': now,
+            'used': now,
+            'source': source,
+            'renderer': RENDERER_VERSION,
+        }
+        with self._lock:
+            state = self._state()
+            previous = state['entries'].get(key)
+            state['entries'][key] = entry
+            state['total'] += entry['size'] - (previous['size'] if previous else 0)
+            journal_size = self._append({'key': key, 'entry': entry})
+            if state['total'] > self.max_bytes or journal_size > RENDER_CACHE_JOURNAL_MAX_BYTES:
+                self._compact()
+
+def process_cah_file(cah_file, output_dir, engine="overlay", flatten=False, force=False,
+                     profile=False, profile_stage=None, template_pdf=None, font=None):
+    """Logica core per processare un singolo file
+
+    Con profile=True il risultato contiene anche 'profile', il report per fase
+    di StageProfiler; profile_stage attiva cProfile su una sola fase.
+    template_pdf sceglie un template diverso da quello incluso, font il
+    font del testo (vedi TEXT_FONTS).
+    """
     cah_file = Path(cah_file)
     output_dir = Path(output_dir)
+    profiler = StageProfiler(profile_stage) if profile or profile_stage else NULL_PROFILER
     
     # Template PDF
-    template_pdf = get_resource_path("5E_CharacterSheet_Fillable.pdf")
+    template_pdf = resolve_template(template_pdf)
     if not template_pdf.exists():
         raise FileNotFoundError(f"Template PDF non trovato: {template_pdf}")
+    sheet_profile = profile_for_template(template_pdf)
 
-    char_data = load_character_data(cah_file)
-    char_info = extract_character_info(char_data)
+    with profiler.stage("load"):
+        char_data = load_character_data(cah_file, keys=CHARACTER_KEYS)
+    profiler.set('bytes_read', os.path.getsize(cah_file))
+    with profiler.stage("extract"):
+        char_info = extract_character_info(char_data, sheet_profile)
     
     # File di output
     output_file = output_dir / f"{cah_file.stem}_sheet.pdf"
     
-    fill_pdf(template_pdf, output_file, char_info)
+    # Note o data di modifica non cambiano la scheda: se i campi
+    # derivati sono gli stessi il PDF viene ripreso dalla cache
+    with profiler.stage("cache"):
+        render_cache = RenderCache(output_dir)
+        cache_key = render_cache_key(char_info, template_digest(template_pdf), engine, flatten,
+                                     font_digest(font))
+        cached = not force and render_cache.fetch(cache_key, output_file)
+    profiler.set('cache_hit', cached)
+    if not cached:
+        # Le miniature dei ritratti stanno accanto alla cache dei render, nella cartella di output
+        renderer = _import_renderer()
+        renderer.fill_pdf(template_pdf, output_file, char_info, engine=engine, flatten=flatten,
+                          profiler=profiler, portraits=renderer.get_portrait_cache(output_dir), font=font)
+        with profiler.stage("cache"):
+            render_cache.store(cache_key, output_file, source=cah_file.name)
     
+    result = _sheet_result(output_file, char_info, sheet_profile, cached)
+    if profiler is not NULL_PROFILER:
+        result['profile'] = profiler.report()
+    return result
+
+def _sheet_result(output_file, char_info, sheet_profile, cached):
+    """Esito di una scheda: percorso, nome e classe del personaggio, cache"""
     return {
         'path': output_file,
-        'name': char_info.get('CharacterName', 'N/A'),
-        'class': char_info.get('ClassLevel', 'N/A')
+        'name': char_info.get(sheet_profile.fields['character_name'], 'N/A'),
+        'class': char_info.get(sheet_profile.fields['class_level'], 'N/A'),
+        'cached': cached,
     }
 
-class DndConverterApp:
-    def __init__(self, root):
-        self.root = root
-        self.root.title("D&D 5E Sheet Converter")
-        self.root.geometry("500x250")
-        self.root.resizable(False, False)
-
-        # Variabili
-        self.input_file = tk.StringVar()
-        self.output_dir = tk.StringVar()
-        self.status = tk.StringVar(value="Pronto")
-        
-        # Default output dir = current dir or output folder
-        default_out = Path.cwd() / "output"
-        if not default_out.exists():
-            default_out = Path.cwd()
-        self.output_dir.set(str(default_out))
-
-        self.create_widgets()
-
-    def create_widgets(self):
-        # Frame Input
-        input_frame = tk.Frame(self.root, padx=10, pady=10)
-        input_frame.pack(fill="x")
-        
-        tk.Label(input_frame, text="File .CAH:", width=10, anchor="w").pack(side="left")
-        tk.Entry(input_frame, textvariable=self.input_file, state="readonly", width=40).pack(side="left", padx=5)
-        tk.Button(input_frame, text="Scegli", command=self.browse_input).pack(side="left")
+def render_to(cah, output, engine="overlay", flatten=False, template_pdf=None, font=None):
+    """Compila la scheda da un .cah in memoria e la scrive su output
 
-        # Frame Output
-        output_frame = tk.Frame(self.root, padx=10, pady=5)
-        output_frame.pack(fill="x")
-        
-        tk.Label(output_frame, text="Output:", width=10, anchor="w").pack(side="left")
-        tk.Entry(output_frame, textvariable=self.output_dir, state="readonly", width=40).pack(side="left", padx=5)
-        tk.Button(output_frame, text="Scegli", command=self.browse_output).pack(side="left")
+    cah è il contenuto del file (bytes) o uno stream binario da cui
+    leggerlo; output un percorso o uno stream binario già aperto (anche
+    sys.stdout.buffer). Oltre all'output non viene scritto niente: niente
+    cache dei render né miniature dei ritratti su disco, e indice e profilo
+    di un template nuovo restano in memoria.
+    """
+    template_pdf = resolve_template(template_pdf)
+    if not template_pdf.exists():
+        raise FileNotFoundError(f"Template PDF non trovato: {template_pdf}")
+    data = cah.read() if hasattr(cah, 'read') else cah
+    if not data:
+        raise ValueError("Contenuto .cah vuoto")
+    try:
+        char_data = parse_character_data(data, keys=CHARACTER_KEYS)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Contenuto .cah non valido: {e}") from e
+    try:
+        sheet_profile = profile_for_template(template_pdf, persist=False)
+        char_info = extract_character_info(char_data, sheet_profile)
+    except (TypeError, KeyError, AttributeError, IndexError) as e:
+        # JSON valido ma non un personaggio (es. un numero dove serve un oggetto)
+        raise ValueError(f"Struttura .cah non valida: {e!r}") from e
+    check_field_types(char_info, sheet_profile)
+    renderer = _import_renderer()
+    # Template caricato qui senza salvarne l'indice: fill_pdf lo trova già in cache
+    renderer.template_cache.get(template_pdf, persist=False)
+    renderer.fill_pdf(template_pdf, output, char_info, engine=engine, flatten=flatten,
+                      portraits=renderer.memory_portrait_cache, font=font)
 
-        # Action Button
-        action_frame = tk.Frame(self.root, padx=10, pady=20)
-        action_frame.pack(fill="x")
-        
-        self.convert_btn = tk.Button(action_frame, text="CONVERTI IN PDF", command=self.start_conversion, 
-                                     bg="#4CAF50", fg="white", font=("Helvetica", 12, "bold"), height=2)
-        self.convert_btn.pack(fill="x")
-
-        # Status Bar
-        status_frame = tk.Frame(self.root, padx=5, pady=5, relief=tk.SUNKEN, bd=1)
-        status_frame.pack(side="bottom", fill="x")
-        tk.Label(status_frame, textvariable=self.status, anchor="w").pack(fill="x")
-
-    def browse_input(self):
-        file_path = filedialog.askopenfilename(filetypes=[("File CAH", "*.cah"), ("Tutti i file", "*.*")])
-        if file_path:
-            self.input_file.set(file_path)
-
-    def browse_output(self):
-        dir_path = filedialog.askdirectory()
-        if dir_path:
-            self.output_dir.set(dir_path)
-
-    def start_conversion(self):
-        inp = self.input_file.get()
-        out = self.output_dir.get()
-        
-        if not inp:
-            messagebox.showwarning("Attenzione", "Seleziona un file .cah di input")
-            return
+def render(cah, engine="overlay", flatten=False, template_pdf=None, font=None):
+    """Compila la scheda da un .cah (bytes o stream binario) e restituisce i byte del PDF"""
+    output = io.BytesIO()
+    render_to(cah, output, engine, flatten, template_pdf, font)
+    return output.getvalue()
+
+# Nome precedente di render, per chi lo usa già
+render_cah_bytes = render
+
+def render_sheet_bytes(char_info, engine="overlay", flatten=False, template_pdf=None, font=None, output_dir=None):
+    """Compila una scheda già estratta e restituisce il PDF in memoria
+
+    Con output_dir le miniature dei ritratti vanno nella sua cache su disco.
+    """
+    output = io.BytesIO()
+    renderer = _import_renderer()
+    portraits = renderer.get_portrait_cache(output_dir) if output_dir is not None else None
+    renderer.fill_pdf(resolve_template(template_pdf), output, char_info,
+                      engine=engine, flatten=flatten, portraits=portraits, font=font)
+    return output.getvalue()
+
+# Modalità --watch: ogni quanto controllare input/ e quanto deve restare
+# fermo un file prima di leggerlo (evita di leggere un salvataggio a metà)
+WATCH_POLL_INTERVAL = 0.1
+WATCH_DEBOUNCE = 0.3
+
+def _scan_cah_files(input_dir):
+    """Restituisce {percorso: (mtime_ns, dimensione)} dei file .cah nella cartella"""
+    snapshot = {}
+    for entry in os.scandir(input_dir):
+        if entry.name.endswith(".cah") and entry.is_file():
+            stat = entry.stat()
+            snapshot[Path(entry.path)] = (stat.st_mtime_ns, stat.st_size)
+    return snapshot
+
+def watch_input_dir(input_dir, output_dir, engine="overlay", flatten=False,
+                    interval=WATCH_POLL_INTERVAL, debounce=WATCH_DEBOUNCE, log=print, template_pdf=None,
+                    font=None):
+    """Rigenera le schede dei file .cah modificati in input_dir finché non viene interrotto"""
+    input_dir = Path(input_dir)
+    # Template e font restano caricati in memoria per tutta la sessione
+    _init_batch_worker(resolve_template(template_pdf), font)
+    
+    known = {}    # file -> stat dell'ultima versione già elaborata
+    pending = {}  # file -> (stat, primo rilevamento, ultima modifica vista)
+    first_scan = True
+    while True:
+        now = time.monotonic()
+        snapshot = _scan_cah_files(input_dir)
+        for path, stat in snapshot.items():
+            if known.get(path) == stat:
+                pending.pop(path, None)
+                continue
+            entry = pending.get(path)
+            if entry is None:
+                # Al primo giro i file non vanno attesi: sono già stabili
+                last_change = now - debounce if first_scan else now
+                pending[path] = (stat, now, last_change)
+            elif entry[0] != stat:
+                pending[path] = (stat, entry[1], now)
+        first_scan = False
+        for path in [path for path in known if path not in snapshot]:
+            del known[path]
+            log(f"[{time.strftime('%H:%M:%S')}] {path.name}: file rimosso")
+        for path in [path for path in pending if path not in snapshot]:
+            del pending[path]
         
-        if not out:
-            messagebox.showwarning("Attenzione", "Seleziona una cartella di destinazione")
-            return
-            
-        self.convert_btn.config(state="disabled")
-        self.status.set("Conversione in corso...")
+        for path, (stat, first_seen, last_change) in list(pending.items()):
+            if now - last_change < debounce:
+                continue
+            del pending[path]
+            # Anche se fallisce la versione è considerata elaborata: si riprova alla prossima modifica
+            known[path] = stat
+            render_start = time.monotonic()
+            try:
+                res = process_cah_file(path, output_dir, engine, flatten, template_pdf=template_pdf, font=font)
+            except Exception as e:
+                outcome = f"errore ({e})"
+            else:
+                outcome = "invariata (cache)" if res['cached'] else f"aggiornata -> {res['path'].name}"
+            done = time.monotonic()
+            log(f"[{time.strftime('%H:%M:%S')}] {path.name}: scheda {outcome} "
+                f"in {(done - render_start) * 1000:.0f} ms "
+                f"({(done - first_seen) * 1000:.0f} ms dal rilevamento)")
         
-        # Thread separato per non bloccare la GUI
-        threading.Thread(target=self.run_conversion_thread, args=(inp, out)).start()
+        time.sleep(interval)
+
+def iter_batch_results(files, output_dir, jobs=1, engine="overlay", flatten=False, force=False,
+                       profile=False, profile_stage=None, template_pdf=None, font=None):
+    """Processa i file e restituisce (file, risultato, errore) man mano che finiscono"""
+    if jobs <= 1 or len(files) <= 1:
+        for cah_file in files:
+            try:
+                res = process_cah_file(cah_file, output_dir, engine, flatten, force, profile, profile_stage,
+                                       template_pdf, font)
+            except Exception as e:
+                yield cah_file, None, e
+            else:
+                yield cah_file, res, None
+        return
+
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    # Ogni worker carica template e font una volta: i sottoinsiemi del font
+    # incorporato sono poi condivisi da tutte le schede che compila
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_batch_worker,
+                             initargs=(str(resolve_template(template_pdf)), font)) as executor:
+        futures = {executor.submit(process_cah_file, cah_file, output_dir, engine, flatten, force,
+                                   profile, profile_stage, template_pdf, font): cah_file
+                   for cah_file in files}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as e:
+                yield futures[future], None, e
 
-    def run_conversion_thread(self, inp, out):
+# Pipeline asyncio: fasi nell'ordine, ciascuna con la sua coda in ingresso
+PIPELINE_STAGES = ("read", "derive", "render", "write")
+PIPELINE_QUEUE_SIZE = 4
+PIPELINE_SAMPLE_INTERVAL = 0.005
+
+class PipelineStats:
+    """Profondità delle code e tempo di lavoro di ogni fase della pipeline
+
+    Una fase con la coda in ingresso sempre piena è il collo di bottiglia;
+    una con la coda sempre vuota aspetta quella precedente.
+    """
+
+    def __init__(self, queues, workers):
+        self.queues = queues
+        self.workers = workers
+        self.samples = {stage: [] for stage in queues}
+        self.busy_s = dict.fromkeys(PIPELINE_STAGES, 0.0)
+        self.items = dict.fromkeys(PIPELINE_STAGES, 0)
+        self.started = time.perf_counter()
+
+    def sample(self):
+        for stage, queue in self.queues.items():
+            self.samples[stage].append(queue.qsize())
+
+    @contextlib.contextmanager
+    def busy(self, stage):
+        start = time.perf_counter()
         try:
-            res = process_cah_file(inp, out)
-            self.status.set(f"Completato: {res['name']}")
-            messagebox.showinfo("Successo", f"Scheda creata con successo:\n{res['path']}")
-        except Exception as e:
-            self.status.set("Errore")
-            messagebox.showerror("Errore", str(e))
+            yield
         finally:
-            self.convert_btn.config(state="normal")
+            self.busy_s[stage] += time.perf_counter() - start
+            self.items[stage] += 1
 
-def main_cli():
-    # Template PDF check early
-    template_pdf = get_resource_path("5E_CharacterSheet_Fillable.pdf")
+    def report(self):
+        wall = time.perf_counter() - self.started
+        stages = {}
+        for stage in PIPELINE_STAGES:
+            entry = {
+                'workers': self.workers[stage],
+                'items': self.items[stage],
+                'busy_s': round(self.busy_s[stage], 4),
+                'utilization': round(self.busy_s[stage] / (wall * self.workers[stage]), 3) if wall else 0.0,
+            }
+            samples = self.samples.get(stage)
+            if samples:
+                maxsize = self.queues[stage].maxsize
+                entry['queue_mean'] = round(sum(samples) / len(samples), 2)
+                entry['queue_max'] = max(samples)
+                entry['queue_full_pct'] = round(100 * sum(depth >= maxsize for depth in samples) / len(samples), 1)
+            stages[stage] = entry
+        return {'wall_s': round(wall, 4), 'stages': stages}
+
+def format_pipeline_table(report):
+    """Tabella leggibile del report di PipelineStats"""
+    lines = [f"Pipeline completata in {report['wall_s']:.2f}s",
+             f"  {'fase':<8} {'worker':>6} {'file':>5} {'lavoro':>9} {'uso':>5} "
+             f"{'coda media':>10} {'max':>4} {'piena':>6}"]
+    for stage, entry in report['stages'].items():
+        if 'queue_mean' in entry:
+            queue = f"{entry['queue_mean']:>10.2f} {entry['queue_max']:>4} {entry['queue_full_pct']:>5.1f}%"
+        else:
+            queue = f"{'-':>10} {'-':>4} {'-':>6}"
+        lines.append(f"  {stage:<8} {entry['workers']:>6} {entry['items']:>5} {entry['busy_s']:>8.3f}s "
+                     f"{entry['utilization'] * 100:>4.0f}% {queue}")
+    return "\n".join(lines)
+
+def _derive_sheet(data, sheet_profile):
+    return extract_character_info(parse_character_data(data, keys=CHARACTER_KEYS), sheet_profile)
+
+def _write_sheet(output_file, pdf, render_cache, cache_key, source):
+    with open(output_file, 'wb') as f:
+        f.write(pdf)
+    render_cache.store(cache_key, output_file, source=source)
+
+async def run_batch_pipeline(files, output_dir, jobs=1, engine="overlay", flatten=False, force=False,
+                             on_result=None, queue_size=PIPELINE_QUEUE_SIZE,
+                             sample_interval=PIPELINE_SAMPLE_INTERVAL, template_pdf=None, font=None):
+    """Converte i file con le fasi di process_cah_file sovrapposte
+
+    Lettura, derivazione (con controllo della cache), render e scrittura
+    sono collegate da code di al massimo queue_size elementi: una fase lenta
+    ferma quella precedente invece di accumulare file in memoria. Lettura e
+    scrittura girano in thread, il render in un pool di jobs processi.
+    on_result(file, risultato, errore) è chiamata man mano che le schede
+    finiscono; restituisce il report di PipelineStats.
+    """
+    import asyncio
+    from concurrent.futures import ProcessPoolExecutor
+
+    output_dir = Path(output_dir)
+    template_pdf = resolve_template(template_pdf)
     if not template_pdf.exists():
+        raise FileNotFoundError(f"Template PDF non trovato: {template_pdf}")
+    template_hash = template_digest(template_pdf)
+    font_hash = font_digest(font)
+    sheet_profile = profile_for_template(template_pdf)
+    render_cache = RenderCache(output_dir)
+    if on_result is None:
+        on_result = lambda cah_file, res, error: None
+
+    loop = asyncio.get_running_loop()
+    queues = {stage: asyncio.Queue(queue_size) for stage in PIPELINE_STAGES[1:]}
+    workers = {'read': 1, 'derive': 1, 'render': jobs, 'write': 1}
+    stats = PipelineStats(queues, workers)
+
+    async def derive(item):
+        cah_file, data = item
+        char_info = await loop.run_in_executor(None, _derive_sheet, data, sheet_profile)
+        output_file = output_dir / f"{cah_file.stem}_sheet.pdf"
+        cache_key = render_cache_key(char_info, template_hash, engine, flatten, font_hash)
+        if not force and await loop.run_in_executor(None, render_cache.fetch, cache_key, output_file):
+            on_result(cah_file, _sheet_result(output_file, char_info, sheet_profile, True), None)
+            return None
+        return cah_file, char_info, output_file, cache_key
+
+    async def render(item):
+        cah_file, char_info, output_file, cache_key = item
+        pdf = await loop.run_in_executor(executor, render_sheet_bytes, char_info, engine, flatten, template_pdf,
+                                         font, output_dir)
+        return cah_file, char_info, output_file, cache_key, pdf
+
+    async def write(item):
+        cah_file, char_info, output_file, cache_key, pdf = item
+        await loop.run_in_executor(None, _write_sheet, output_file, pdf, render_cache, cache_key, cah_file.name)
+        on_result(cah_file, _sheet_result(output_file, char_info, sheet_profile, False), None)
+
+    async def close(stage):
+        # Un segnale di fine per ogni worker della fase successiva
+        for _ in range(workers[stage]):
+            await queues[stage].put(None)
+
+    async def read():
+        for cah_file in files:
+            cah_file = Path(cah_file)
+            try:
+                with stats.busy("read"):
+                    data = await loop.run_in_executor(None, cah_file.read_bytes)
+            except Exception as e:
+                on_result(cah_file, None, e)
+                continue
+            await queues["derive"].put((cah_file, data))
+        await close("derive")
+
+    async def worker(stage, handle, next_stage):
+        while True:
+            item = await queues[stage].get()
+            if item is None:
+                return
+            try:
+                with stats.busy(stage):
+                    item = await handle(item)
+            except Exception as e:
+                on_result(item[0], None, e)
+                continue
+            if item is not None and next_stage is not None:
+                await queues[next_stage].put(item)
+
+    async def run_stage(stage, handle, next_stage):
+        await asyncio.gather(*(worker(stage, handle, next_stage) for _ in range(workers[stage])))
+        if next_stage is not None:
+            await close(next_stage)
+
+    async def sample():
+        while True:
+            stats.sample()
+            await asyncio.sleep(sample_interval)
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_batch_worker,
+                             initargs=(str(template_pdf), font)) as executor:
+        sampler = asyncio.create_task(sample())
+        try:
+            await asyncio.gather(
+                read(),
+                run_stage("derive", derive, "render"),
+                run_stage("render", render, "write"),
+                run_stage("write", write, None),
+            )
+        finally:
+            sampler.cancel()
+    return stats.report()
+
+def write_party_bundle(files, template_path, bundle_path, font=None):
+    """Compila le schede dei file indicati in un unico PDF e riporta l'esito di ciascuna"""
+    start = time.perf_counter()
+    renderer = _import_renderer()
+    bundle = renderer.PartyBundle(template_path, font, renderer.get_portrait_cache(Path(bundle_path).parent))
+    sheet_profile = profile_for_template(template_path)
+    for cah_file in files:
+        print(f"{'='*50}")
+        print(f"Caricamento {cah_file.name}...")
+        try:
+            char_info = extract_character_info(load_character_data(cah_file, keys=CHARACTER_KEYS), sheet_profile)
+            res = _sheet_result(bundle_path, char_info, sheet_profile, False)
+            bundle.add_sheet(char_info, title=char_info.get(sheet_profile.fields['character_name']) or cah_file.stem)
+        except Exception as e:
+            print(f"✗ Errore: {e}")
+            print()
+            continue
+        print(f"✓ Scheda aggiunta al bundle")
+        print(f"  Personaggio: {res['name']}")
+        print(f"  Classe: {res['class']}")
+        print()
+    
+    if bundle.sheet_count == 0:
+        print("Nessuna scheda da scrivere nel bundle")
+        return
+    bundle.write(bundle_path)
+    elapsed = time.perf_counter() - start
+    print(f"{'='*50}")
+    print(f"✓ Bundle creato: {bundle_path} ({bundle.sheet_count} schede, "
+          f"{bundle_path.stat().st_size / 1024:.0f} KB) in {elapsed:.2f}s")
+
+# Moduli che l'avvio della CLI non deve caricare: --import-time riporta quali sono in memoria
+HEAVY_MODULES = ("tkinter", "pypdf", "reportlab", "PIL", "numpy", "asyncio", "http.server")
+
+def format_import_report():
+    """Tempi di import del modulo e dei moduli caricati su richiesta, con i moduli pesanti in memoria"""
+    lines = [f"{'='*50}", "Tempi di import:"]
+    for module_name, elapsed in IMPORT_TIMES.items():
+        lines.append(f"  {module_name:<16} {elapsed * 1000:8.1f} ms")
+    loaded = [module_name for module_name in HEAVY_MODULES if module_name in sys.modules]
+    lines.append(f"  {len(sys.modules)} moduli in memoria; pesanti: {', '.join(loaded) or 'nessuno'}")
+    return "\n".join(lines)
+
+def main_cli():
+    if len(sys.argv) > 1 and sys.argv[1] == "serve":
+        _import_timed("sheet_server").serve_main(sys.argv[2:])
+        return
+    parser = argparse.ArgumentParser(description="Compila schede D&D 5E partendo da file .cah")
+    parser.add_argument("cah_file", nargs="?",
+                        help="file .cah da convertire (o una cartella di file .cah); - lo legge dallo standard input")
+    parser.add_argument("--all", action="store_true", help="converte tutti i file .cah in input/")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="processi paralleli per --all (0 = tutti i core)")
+    parser.add_argument("--engine", choices=FILL_ENGINES, default=FILL_ENGINES[0],
+                        help="overlay: testo disegnato sopra il template; "
+                             "acroform: valori scritti nei campi del modulo")
+    parser.add_argument("--flatten", action="store_true",
+                        help="con --engine acroform rende i campi non modificabili")
+    parser.add_argument("--font", default=DEFAULT_FONT,
+                        help=f"font del testo: {', '.join(TEXT_FONTS)} (incluso, con accenti e simboli come ✓) "
+                             "o il percorso di un file .ttf da incorporare")
+    parser.add_argument("--force", action="store_true",
+                        help="rigenera i PDF anche se la scheda in cache è ancora valida")
+    parser.add_argument("--watch", action="store_true",
+                        help="resta in ascolto su input/ e rigenera le schede modificate")
+    parser.add_argument("--profile", action="store_true",
+                        help="mostra i tempi di ogni fase della conversione")
+    parser.add_argument("--profile-json", action="store_true",
+                        help="stampa solo una riga JSON per file con i tempi di ogni fase")
+    parser.add_argument("--profile-stage", choices=PROFILE_STAGES,
+                        help="esegue cProfile sulla fase indicata e ne riporta le statistiche")
+    parser.add_argument("--bundle", metavar="FILE.pdf",
+                        help="scrive tutte le schede in un unico PDF (in output/ se è solo un nome)")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="sovrappone lettura, render e scrittura dei file e riporta le code di ogni fase")
+    parser.add_argument("-o", "--output", metavar="FILE.pdf",
+                        help="PDF di una singola scheda, compilata in memoria senza cache; - per lo standard "
+                             "output (predefinito se il .cah arriva dallo standard input)")
+    parser.add_argument("--template", metavar="FILE.pdf",
+                        help="compila un template diverso da quello incluso; al primo uso i suoi campi "
+                             "vengono associati agli slot della scheda in FILE.pdf.profile.json")
+    parser.add_argument("--stats-only", action="store_true",
+                        help="esporta solo le statistiche derivate (JSON Lines o CSV), senza compilare PDF")
+    parser.add_argument("--stats-format", choices=STATS_FORMATS,
+                        help="formato di --stats-only (predefinito: csv se l'output finisce in .csv, altrimenti jsonl)")
+    parser.add_argument("--stats-output", metavar="FILE", default="-",
+                        help="file di --stats-only (predefinito: - per lo standard output)")
+    parser.add_argument("--import-time", action="store_true",
+                        help="riporta alla fine il costo di import del modulo e dei moduli caricati su richiesta")
+    args = parser.parse_args()
+    if not args.all and not args.cah_file and not args.watch:
+        parser.error("indica un file .cah, --all oppure --watch")
+    if args.font not in TEXT_FONTS and not Path(args.font).is_file():
+        parser.error(f"font sconosciuto: {args.font} (scegli tra {', '.join(TEXT_FONTS)} o indica un file .ttf)")
+    if args.pipeline and (args.profile or args.profile_json or args.profile_stage):
+        parser.error("--pipeline riporta già i tempi per fase: non si combina con --profile")
+    if args.bundle and args.jobs != 1:
+        parser.error("--bundle scrive tutte le schede in un solo PDF, in un solo processo: non si combina con --jobs")
+    if args.stats_only and (args.watch or args.bundle or args.pipeline):
+        parser.error("--stats-only non compila PDF: non si combina con --watch, --bundle o --pipeline")
+    if (args.cah_file == "-" or args.output is not None) and (
+            args.all or args.watch or args.bundle or args.pipeline or args.stats_only
+            or args.profile or args.profile_json or args.profile_stage):
+        parser.error("- e --output compilano una sola scheda: non si combinano con --all, --watch, --bundle, "
+                     "--pipeline, --stats-only o --profile")
+    try:
+        _run_cli(args)
+    finally:
+        if args.import_time:
+            print(format_import_report())
+
+def _find_cah_file(cah_arg, input_dir):
+    """Percorso del .cah indicato sulla riga di comando, cercato anche in input/"""
+    cah_file = Path(cah_arg)
+    if not cah_file.is_absolute() and not cah_file.exists():
+        cah_file = input_dir / cah_file.name
+    return cah_file
+
+def _render_stream_cli(args, input_dir):
+    """Una sola scheda compilata in memoria: - legge il .cah da stdin e scrive il PDF su stdout
+
+    Non crea output/ né cache: l'unica scrittura è il PDF indicato da --output.
+    """
+    if args.cah_file == "-":
+        source, name = sys.stdin.buffer, "stdin"
+    else:
+        source = _find_cah_file(args.cah_file, input_dir)
+        if not source.is_file():
+            print(f"Errore: File {source} non trovato!", file=sys.stderr)
+            sys.exit(1)
+        name = source.name
+        source = source.read_bytes()
+    output = args.output or "-"
+    start = time.perf_counter()
+    try:
+        render_to(source, sys.stdout.buffer if output == "-" else output, args.engine, args.flatten, args.template,
+                  args.font)
+        if output == "-":
+            sys.stdout.buffer.flush()
+    except BrokenPipeError:
+        # Il lettore ha chiuso lo stdout: niente altro da scrivere
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(1)
+    except Exception as e:
+        print(f"✗ {name}: {e}", file=sys.stderr)
+        sys.exit(1)
+    target = "standard output" if output == "-" else output
+    print(f"✓ {name} -> {target} in {(time.perf_counter() - start) * 1000:.0f} ms", file=sys.stderr)
+
+def _run_cli(args):
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+
+    # Template PDF check early (--stats-only non lo usa)
+    template_pdf = resolve_template(args.template)
+    if not args.stats_only and not template_pdf.exists():
         print(f"Errore: Template PDF non trovato: {template_pdf}")
         return
+    # Con il PDF sullo standard output i messaggi vanno su stderr
+    streaming = args.cah_file == "-" or args.output is not None
+    console = sys.stderr if streaming else sys.stdout
+    if not args.stats_only:
+        # La discovery di un nuovo template avviene una volta qui, non nei worker;
+        # in streaming il profilo resta in memoria
+        sheet_profile = profile_for_template(args.template, persist=not streaming)
+        if sheet_profile.discovered and streaming:
+            print(f"Template registrato: profilo '{sheet_profile.name}' (solo in memoria)", file=console)
+        elif sheet_profile.discovered:
+            print(f"Template registrato: profilo '{sheet_profile.name}' salvato in "
+                  f"{sheet_profiles.get_profile_path(template_pdf)}", file=console)
+            if sheet_profile.missing:
+                print(f"  Slot senza campo nel template: {', '.join(sheet_profile.missing)}", file=console)
 
     input_dir = Path("input")
     output_dir = Path("output")
-    output_dir.mkdir(exist_ok=True)
+    if streaming:
+        _render_stream_cli(args, input_dir)
+        return
+    if not args.stats_only:
+        output_dir.mkdir(exist_ok=True)
+    
+    if args.watch:
+        if not input_dir.exists():
+            print(f"Errore: Cartella {input_dir} non trovata!")
+            return
+        print(f"In ascolto su {input_dir}/ (Ctrl+C per terminare)...")
+        try:
+            watch_input_dir(input_dir, output_dir, args.engine, args.flatten, template_pdf=args.template,
+                            font=args.font)
+        except KeyboardInterrupt:
+            print("Watch terminato.")
+        return
     
     files_to_process = []
     
-    if sys.argv[1] == "--all":
+    if args.all:
         if not input_dir.exists():
             print(f"Errore: Cartella {input_dir} non trovata!")
             return
         files_to_process = list(input_dir.glob("*.cah"))
     else:
-        cah_file = Path(sys.argv[1])
-        if not cah_file.is_absolute() and not cah_file.exists():
-            cah_file = input_dir / cah_file.name
+        cah_file = _find_cah_file(args.cah_file, input_dir)
         if not cah_file.exists():
             print(f"Errore: File {cah_file} non trovato!")
             return
-        files_to_process = [cah_file]
+        files_to_process = sorted(cah_file.glob("*.cah")) if cah_file.is_dir() else [cah_file]
     
-    for cah_file in files_to_process:
+    if args.stats_only:
+        # Il riepilogo va su stderr: lo standard output resta solo dati
+        fmt = args.stats_format or ("csv" if args.stats_output.lower().endswith(".csv") else "jsonl")
+        report_error = lambda cah_file, error: print(f"✗ {cah_file.name}: {error}", file=sys.stderr)
+        start = time.perf_counter()
         try:
-            print(f"{'='*50}")
-            print(f"Caricamento {cah_file.name}...")
-            
-            res = process_cah_file(cah_file, output_dir)
-            
-            print(f"✓ Scheda creata: {res['path']}")
-            print(f"  Personaggio: {res['name']}")
-            print(f"  Classe: {res['class']}")
-            print()
-            
-        except Exception as e:
-            print(f"✗ Errore: {e}")
+            written, errors = write_character_stats(sorted(files_to_process), args.stats_output, fmt,
+                                                    on_error=report_error, jobs=jobs)
+        except BrokenPipeError:
+            # Il lettore ha chiuso lo stdout (es. | head): niente altro da scrivere
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+            return
+        elapsed = time.perf_counter() - start
+        print(f"Statistiche di {written}/{len(files_to_process)} personaggi in {elapsed:.2f}s "
+              f"({written / elapsed if elapsed else 0:.0f} personaggi/s, {errors} errori)", file=sys.stderr)
+        return
+    
+    if args.bundle:
+        if args.engine != "overlay":
+            print("Errore: --bundle è disponibile solo con --engine overlay")
+            return
+        bundle_path = Path(args.bundle)
+        if not bundle_path.is_absolute() and bundle_path.parent == Path("."):
+            bundle_path = output_dir / bundle_path
+        write_party_bundle(sorted(files_to_process), template_pdf, bundle_path, args.font)
+        return
+    
+    start = time.perf_counter()
+    errors = 0
+    cached = 0
+    
+    def report(cah_file, res, error):
+        nonlocal errors, cached
+        if args.profile_json:
+            # Una riga per file, senza altro output, per poterle elaborare a valle
+            line = {'file': cah_file.name}
+            if error is not None:
+                errors += 1
+                line['error'] = str(error)
+            else:
+                line.update(res['profile'], cached=res['cached'])
+            print(json.dumps(line))
+            return
+        
+        print(f"{'='*50}")
+        print(f"Caricamento {cah_file.name}...")
+        if error is not None:
+            errors += 1
+            print(f"✗ Errore: {error}")
             print()
+            return
+        
+        if res['cached']:
+            cached += 1
+            print(f"✓ Scheda invariata, ripresa dalla cache: {res['path']}")
+        else:
+            print(f"✓ Scheda creata: {res['path']}")
+        print(f"  Personaggio: {res['name']}")
+        print(f"  Classe: {res['class']}")
+        if 'profile' in res:
+            print(format_profile_table(cah_file.name, res['profile']))
+        print()
+    
+    pipeline_report = None
+    if args.pipeline:
+        import asyncio
+        pipeline_report = asyncio.run(run_batch_pipeline(files_to_process, output_dir, jobs, args.engine,
+                                                         args.flatten, args.force, on_result=report,
+                                                         template_pdf=args.template, font=args.font))
+    else:
+        profile = args.profile or args.profile_json
+        for cah_file, res, error in iter_batch_results(files_to_process, output_dir, jobs, args.engine,
+                                                       args.flatten, args.force, profile, args.profile_stage,
+                                                       args.template, args.font):
+            report(cah_file, res, error)
+    
+    if len(files_to_process) > 1 and not args.profile_json:
+        elapsed = time.perf_counter() - start
+        done = len(files_to_process) - errors
+        print(f"{'='*50}")
+        print(f"Completate {done}/{len(files_to_process)} schede in {elapsed:.2f}s "
+              f"({done / elapsed:.1f} schede/s, {jobs} processi, {cached} dalla cache)")
+    if pipeline_report is not None:
+        print(format_pipeline_table(pipeline_report))
 
 def main():
+    sys.excepthook = global_exception_handler
     if len(sys.argv) > 1:
         # Modalità CLI
         try:
@@ -583,10 +2044,14 @@ def main():
             if getattr(sys, 'frozen', False):
                 input("\nPremi INVIO per uscire...")
     else:
-        # Modalità GUI
-        root = tk.Tk()
-        app = DndConverterApp(root)
-        root.mainloop()
+        # Modalità GUI: tkinter viene caricato solo qui
+        _import_timed("sheet_gui").run_gui()
+
+IMPORT_TIMES['fill_dnd_sheet'] = time.perf_counter() - _IMPORT_START
 
 if __name__ == "__main__":
+    # Necessario per il pool di processi nell'eseguibile PyInstaller
+    if getattr(sys, 'frozen', False):
+        import multiprocessing
+        multiprocessing.freeze_support()
     main()
@@ -1,40 +1,102 @@
 import sys
+import argparse
+import glob
 import json
-import re
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-from PyPDF2 import PdfReader
+from pypdf import PdfReader
 
-def parse_pdf_to_cah(pdf_path, output_path):
-    if not Path(pdf_path).exists():
-        print(f"Error: File {pdf_path} not found.")
-        return
+# Map Checkbox Field Name -> JSON Type Name
+SKILL_CHECKBOXES = {
+    'Check Box 23': 'ACROBATICS',
+    'Check Box 24': 'ANIMAL_HANDLING',
+    'Check Box 25': 'ARCANA',
+    'Check Box 26': 'ATHLETICS',
+    'Check Box 27': 'DECEPTION',
+    'Check Box 28': 'HISTORY',
+    'Check Box 29': 'INSIGHT',
+    'Check Box 30': 'INTIMIDATION',
+    'Check Box 31': 'INVESTIGATION',
+    'Check Box 32': 'MEDICINE',
+    'Check Box 33': 'NATURE',
+    'Check Box 34': 'PERCEPTION',
+    'Check Box 35': 'PERFORMANCE',
+    'Check Box 36': 'PERSUASION',
+    'Check Box 37': 'RELIGION',
+    'Check Box 38': 'SLEIGHT_OF_HAND',
+    'Check Box 39': 'STEALTH',
+    'Check Box 40': 'SURVIVAL'
+}
+
+# Stats and Saves
+STATS_MAP = {
+    "strength": {"score": "STR", "save_check": "Check Box 11"},
+    "dexterity": {"score": "DEX", "save_check": "Check Box 18"},
+    "constitution": {"score": "CON", "save_check": "Check Box 19"},
+    "intelligence": {"score": "INT", "save_check": "Check Box 20"},
+    "wisdom": {"score": "WIS", "save_check": "Check Box 21"},
+    "charisma": {"score": "CHA", "save_check": "Check Box 22"}
+}
+
+def _field_value(val):
+    """Converte il /V grezzo di un campo nel valore usato dal .cah"""
+    val = val.get_object()
+    if val == '/Yes': return True
+    if val == '/On': return True
+    if val == '/Off': return False
+    if isinstance(val, str) and val.startswith('/'): return val[1:] # e.g. /Choice
+    return str(val)
 
+def read_form_values(pdf_path):
+    """Legge i valori dei campi dal solo dizionario AcroForm
+
+    A differenza di get_fields() non costruisce la descrizione completa di
+    ogni campo e non tocca le pagine: il reader risolve solo gli oggetti
+    dei campi, e ogni /V viene convertito una volta sola.
+    """
     reader = PdfReader(pdf_path)
-    fields = reader.get_fields()
-    
-    if not fields:
-        print("Error: No form fields found. This PDF might be flattened or not a form.")
-        return
+    root = reader.trailer["/Root"]
+    if "/AcroForm" not in root:
+        return {}
+    acroform = root["/AcroForm"]
+    fields = acroform["/Fields"] if "/Fields" in acroform else []
+    values = {}
+    # Visita iterativa dell'albero: (campo, nome del padre, /V ereditato)
+    stack = [(field, "", None) for field in reversed(fields)]
+    while stack:
+        field, parent_name, inherited = stack.pop()
+        field = field.get_object()
+        name = parent_name
+        if "/T" in field:
+            name = f"{parent_name}.{field['/T']}" if parent_name else str(field["/T"])
+        value = field.get("/V", inherited)
+        kids = field["/Kids"] if "/Kids" in field else None
+        # I widget senza nome condividono il valore del campo padre
+        if kids and any("/T" in kid.get_object() for kid in kids):
+            stack.extend((kid, name, value) for kid in reversed(kids))
+        elif name and value is not None and name not in values:
+            values[name] = _field_value(value)
+    return values
+
+def _int_val(values, key, default):
+    val = values.get(key, "")
+    return int(val) if isinstance(val, str) and val.isdigit() else default
 
-    # Helper to get value safely
+def build_cah_data(values):
+    """Ricostruisce la struttura .cah dai valori dei campi"""
     def get_val(key, default=""):
-        f = fields.get(key, {})
-        if f and '/V' in f:
-            val = f['/V']
-            if val == '/Yes': return True
-            if val == '/On': return True
-            if val == '/Off': return False
-            if isinstance(val, str) and val.startswith('/'): return val[1:] # e.g. /Choice
-            return val
-        return default
+        return values.get(key, default)
 
     # Initialize basic CAH structure
+    speed = get_val("Speed")
     cah_data = {
         "name": get_val("CharacterName"),
         "player": get_val("PlayerName"),
-        "xp": int(get_val("XP", 0)) if get_val("XP", "0").isdigit() else 0,
-        "hp": int(get_val("HPMax", 0)) if get_val("HPMax", "0").isdigit() else 0,
-        "baseAc": int(get_val("AC", 10)) if get_val("AC", "10").isdigit() else 10,
+        "xp": _int_val(values, "XP", 0),
+        "hp": _int_val(values, "HPMax", 0),
+        "baseAc": _int_val(values, "AC", 10),
         "alignmentName": get_val("Alignment").replace(" ", "_").upper(),
         "background": {
             "backgroundId": get_val("Background").replace(" ", "_").lower(),
@@ -44,12 +106,12 @@ def parse_pdf_to_cah(pdf_path, output_path):
         "race": {
             "raceId": get_val("Race ").replace(" ", "_").lower(), # Note space in field name 'Race '
             "speed": {
-                "normal": int(get_val("Speed", "30").split()[0]) if get_val("Speed") else 30
+                "normal": int(speed.split()[0]) if speed and speed.split()[0].isdigit() else 30
             }
         },
         "jobs": [],
         "skills": [],
-        "spells": [] 
+        "spells": []
     }
 
     # Parse Class and Level
@@ -57,37 +119,25 @@ def parse_pdf_to_cah(pdf_path, output_path):
     if class_level_str:
         parts = class_level_str.split()
         level = 1
-        job_name = "class"
-        
+
         # Try to find the number
         for part in parts:
             if part.isdigit():
                 level = int(part)
                 break
-        
+
         # Everything else is the name
         job_name = " ".join([p for p in parts if not p.isdigit()])
-        
+
         cah_data["jobs"].append({
             "jobId": job_name.lower(),
             "level": level
         })
 
-    # Stats and Saves
-    stats_map = {
-        "strength": {"score": "STR", "save_check": "Check Box 11"},
-        "dexterity": {"score": "DEX", "save_check": "Check Box 18"},
-        "constitution": {"score": "CON", "save_check": "Check Box 19"},
-        "intelligence": {"score": "INT", "save_check": "Check Box 20"},
-        "wisdom": {"score": "WIS", "save_check": "Check Box 21"},
-        "charisma": {"score": "CHA", "save_check": "Check Box 22"}
-    }
-
-    for stat_key, map_data in stats_map.items():
-        score_val = get_val(map_data["score"], "10")
-        score = int(score_val) if score_val.isdigit() else 10
+    for stat_key, map_data in STATS_MAP.items():
+        score = _int_val(values, map_data["score"], 10)
         save = get_val(map_data["save_check"]) == True
-        
+
         cah_data[stat_key] = {
             "score": score,
             "save": save,
@@ -95,49 +145,114 @@ def parse_pdf_to_cah(pdf_path, output_path):
         }
 
     # Skills
-    # Map Checkbox Field Name -> JSON Type Name
-    skill_checkboxes = {
-        'Check Box 23': 'ACROBATICS',
-        'Check Box 24': 'ANIMAL_HANDLING',
-        'Check Box 25': 'ARCANA',
-        'Check Box 26': 'ATHLETICS',
-        'Check Box 27': 'DECEPTION',
-        'Check Box 28': 'HISTORY',
-        'Check Box 29': 'INSIGHT',
-        'Check Box 30': 'INTIMIDATION',
-        'Check Box 31': 'INVESTIGATION',
-        'Check Box 32': 'MEDICINE',
-        'Check Box 33': 'NATURE',
-        'Check Box 34': 'PERCEPTION',
-        'Check Box 35': 'PERFORMANCE',
-        'Check Box 36': 'PERSUASION',
-        'Check Box 37': 'RELIGION',
-        'Check Box 38': 'SLEIGHT_OF_HAND',
-        'Check Box 39': 'STEALTH',
-        'Check Box 40': 'SURVIVAL'
-    }
-
-    for cb_field, type_name in skill_checkboxes.items():
+    for cb_field, type_name in SKILL_CHECKBOXES.items():
         if get_val(cb_field) == True:
             cah_data["skills"].append({
                 "typeName": type_name,
                 "proficiencyName": "FULL"
             })
+    return cah_data
+
+def convert_pdf(pdf_path, output_path):
+    """Converte un PDF compilato in .cah; solleva ValueError se non ha campi"""
+    values = read_form_values(pdf_path)
+    if not values:
+        raise ValueError("No form fields found. This PDF might be flattened or not a form.")
+    cah_data = build_cah_data(values)
 
     # Save to file
     with open(output_path, 'w', encoding='utf-8') as f:
         json.dump(cah_data, f, indent=2)
-    
+    return {'path': Path(output_path), 'name': cah_data['name'], 'fields': len(values)}
+
+def parse_pdf_to_cah(pdf_path, output_path):
+    if not Path(pdf_path).exists():
+        print(f"Error: File {pdf_path} not found.")
+        return
+
+    try:
+        convert_pdf(pdf_path, output_path)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return
+
     print(f"Successfully converted {pdf_path} to {output_path}")
 
-if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python pdf_to_cah.py <input.pdf> [output.cah]")
-    else:
-        input_pdf = Path(sys.argv[1])
-        
-        if len(sys.argv) > 2:
-            output_cah = Path(sys.argv[2])
+def collect_pdfs(sources):
+    """Espande cartelle e pattern glob nella lista ordinata dei PDF da convertire"""
+    pdfs = set()
+    for source in sources:
+        path = Path(source)
+        if path.is_dir():
+            pdfs.update(path.glob("*.pdf"))
+        elif glob.has_magic(source):
+            pdfs.update(Path(p) for p in glob.glob(source, recursive=True) if p.lower().endswith(".pdf"))
+        else:
+            pdfs.add(path)
+    return sorted(pdfs)
+
+def iter_batch_conversions(pdfs, output_dir, jobs=1):
+    """Converte i PDF e restituisce (pdf, risultato, errore) man mano che finiscono"""
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    targets = {pdf: output_dir / (pdf.stem + ".cah") for pdf in pdfs}
+    if jobs <= 1 or len(pdfs) <= 1:
+        for pdf in pdfs:
+            try:
+                yield pdf, convert_pdf(pdf, targets[pdf]), None
+            except Exception as e:
+                yield pdf, None, e
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(convert_pdf, pdf, targets[pdf]): pdf for pdf in pdfs}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as e:
+                yield futures[future], None, e
+
+def convert_batch(sources, output_dir, jobs=1):
+    """Modalità batch: converte in parallelo e stampa il riepilogo; restituisce gli errori"""
+    pdfs = collect_pdfs(sources)
+    if not pdfs:
+        print("Error: No PDF files found.")
+        return []
+
+    start = time.perf_counter()
+    failures = []
+    for pdf, res, error in iter_batch_conversions(pdfs, output_dir, jobs):
+        if error is not None:
+            failures.append((pdf, error))
+            print(f"✗ {pdf.name}: {error}")
+        else:
+            print(f"✓ {pdf.name} -> {res['path']} ({res['fields']} campi)")
+
+    elapsed = time.perf_counter() - start
+    done = len(pdfs) - len(failures)
+    print(f"{'='*50}")
+    print(f"Convertiti {done}/{len(pdfs)} PDF in {elapsed:.2f}s "
+          f"({len(pdfs) / elapsed:.1f} PDF/s, {jobs} processi, {len(failures)} errori)")
+    for pdf, error in failures:
+        print(f"  ✗ {pdf}: {error}")
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description="Converte schede PDF compilate in file .cah")
+    parser.add_argument("inputs", nargs="+",
+                        help="PDF da convertire; con una cartella o un pattern glob (es. 'schede/*.pdf') "
+                             "converte tutti i PDF in batch")
+    parser.add_argument("-o", "--output-dir", help="cartella dei .cah in modalità batch (predefinita: output)")
+    parser.add_argument("-j", "--jobs", type=int, default=0,
+                        help="processi paralleli in modalità batch (0 = tutti i core)")
+    args = parser.parse_args()
+
+    input_pdf = Path(args.inputs[0])
+    single = len(args.inputs) <= 2 and not input_pdf.is_dir() and not glob.has_magic(args.inputs[0]) \
+        and args.output_dir is None and (len(args.inputs) == 1 or args.inputs[1].lower().endswith(".cah"))
+    if single:
+        if len(args.inputs) > 1:
+            output_cah = Path(args.inputs[1])
         else:
             # Se il PDF è in input/, scrivi il CAH in output/
             if "input" in input_pdf.parts:
@@ -146,5 +261,14 @@ if __name__ == "__main__":
                 output_cah = output_dir / (input_pdf.stem + ".cah")
             else:
                 output_cah = Path(input_pdf.stem + ".cah")
-        
+
         parse_pdf_to_cah(input_pdf, output_cah)
+        return
+
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    failures = convert_batch(args.inputs, args.output_dir or "output", jobs)
+    if failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
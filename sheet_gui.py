@@ -0,0 +1,264 @@
+"""Interfaccia grafica Tkinter di fill_dnd_sheet, caricata solo quando si avvia senza argomenti"""
+import os
+import queue
+import threading
+import time
+import tkinter as tk
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from tkinter import filedialog, messagebox, ttk
+
+from fill_dnd_sheet import _init_batch_worker, process_cah_file, resolve_template
+
+# GUI: processi del pool di conversione (come --jobs 0, uno per core: le
+# conversioni usano la CPU e in thread il GIL le serializzerebbe) e intervallo
+# con cui il main loop di Tk legge i risultati dalla coda
+GUI_WORKERS = os.cpu_count() or 1
+GUI_POLL_MS = 50
+
+def make_executor(workers=GUI_WORKERS):
+    """Pool di processi come quello di --jobs: ogni worker carica template e font una volta"""
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker,
+                               initargs=(str(resolve_template()),))
+
+def convert_timed(cah_file, output_dir, engine="overlay", flatten=False):
+    """process_cah_file eseguita in un worker: restituisce (risultato, secondi)"""
+    start = time.perf_counter()
+    res = process_cah_file(cah_file, output_dir, engine, flatten)
+    return res, time.perf_counter() - start
+
+class BatchCancelled(Exception):
+    """File saltato perché il lotto è stato annullato"""
+
+    def __str__(self):
+        return "annullato"
+
+class GuiBatch:
+    """Lotto di conversioni lanciato dalla GUI
+
+    I file vanno al pool di processi (vedi make_executor); ogni file produce
+    esattamente un messaggio (file, risultato, errore, secondi) sulla coda
+    results, che il main loop di Tk legge con after(). Le callback dei
+    future non toccano mai Tk. Con cancel() i file non ancora iniziati
+    vengono saltati con errore BatchCancelled, quelli in corso finiscono
+    normalmente.
+    """
+
+    def __init__(self, executor, files, output_dir, engine="overlay", flatten=False):
+        self.files = list(files)
+        self.results = queue.Queue()
+        self._cancelled = threading.Event()
+        self._futures = []
+        for cah_file in self.files:
+            future = executor.submit(convert_timed, cah_file, Path(output_dir), engine, flatten)
+            self._futures.append(future)
+            future.add_done_callback(lambda future, cah_file=cah_file: self._finished(cah_file, future))
+
+    def _finished(self, cah_file, future):
+        if future.cancelled():
+            self.results.put((cah_file, None, BatchCancelled(), 0.0))
+        elif future.exception() is not None:
+            self.results.put((cah_file, None, future.exception(), 0.0))
+        else:
+            res, elapsed = future.result()
+            self.results.put((cah_file, res, None, elapsed))
+
+    def cancel(self):
+        self._cancelled.set()
+        for future in self._futures:
+            future.cancel()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+class DndConverterApp:
+    def __init__(self, root):
+        self.root = root
+        self.root.title("D&D 5E Sheet Converter")
+        self.root.geometry("560x460")
+        self.root.minsize(480, 400)
+
+        # Variabili
+        self.input_files = []
+        self.input_label = tk.StringVar()
+        self.output_dir = tk.StringVar()
+        self.status = tk.StringVar(value="Pronto")
+        
+        # Default output dir = current dir or output folder
+        default_out = Path.cwd() / "output"
+        if not default_out.exists():
+            default_out = Path.cwd()
+        self.output_dir.set(str(default_out))
+
+        # Un solo pool per tutta la vita della finestra: il template resta caldo tra un lotto e l'altro
+        self.executor = make_executor()
+        # Avvia subito i worker: motore di render e template si caricano mentre l'utente sceglie i file
+        self.executor.submit(_init_batch_worker, str(resolve_template()))
+        self.batch = None
+        self.done = 0
+        self.errors = 0
+        self.batch_start = 0.0
+
+        self.create_widgets()
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
+
+    def create_widgets(self):
+        # Frame Input
+        input_frame = tk.Frame(self.root, padx=10, pady=10)
+        input_frame.pack(fill="x")
+        
+        tk.Label(input_frame, text="File .CAH:", width=10, anchor="w").pack(side="left")
+        tk.Entry(input_frame, textvariable=self.input_label, state="readonly").pack(side="left", fill="x", expand=True, padx=5)
+        tk.Button(input_frame, text="File", command=self.browse_input).pack(side="left")
+        tk.Button(input_frame, text="Cartella", command=self.browse_input_dir).pack(side="left", padx=(5, 0))
+
+        # Frame Output
+        output_frame = tk.Frame(self.root, padx=10, pady=5)
+        output_frame.pack(fill="x")
+        
+        tk.Label(output_frame, text="Output:", width=10, anchor="w").pack(side="left")
+        tk.Entry(output_frame, textvariable=self.output_dir, state="readonly").pack(side="left", fill="x", expand=True, padx=5)
+        tk.Button(output_frame, text="Scegli", command=self.browse_output).pack(side="left")
+
+        # Action Buttons
+        action_frame = tk.Frame(self.root, padx=10, pady=10)
+        action_frame.pack(fill="x")
+        
+        self.convert_btn = tk.Button(action_frame, text="CONVERTI IN PDF", command=self.start_conversion, 
+                                     bg="#4CAF50", fg="white", font=("Helvetica", 12, "bold"), height=2)
+        self.convert_btn.pack(side="left", fill="x", expand=True)
+        self.cancel_btn = tk.Button(action_frame, text="Annulla", command=self.cancel_conversion,
+                                    state="disabled", height=2)
+        self.cancel_btn.pack(side="left", padx=(5, 0))
+
+        # Avanzamento e tempi per file
+        progress_frame = tk.Frame(self.root, padx=10)
+        progress_frame.pack(fill="both", expand=True)
+        self.progress = ttk.Progressbar(progress_frame, mode="determinate")
+        self.progress.pack(fill="x", pady=(0, 5))
+        self.log = tk.Listbox(progress_frame, height=10)
+        scrollbar = tk.Scrollbar(progress_frame, command=self.log.yview)
+        self.log.config(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side="right", fill="y")
+        self.log.pack(side="left", fill="both", expand=True)
+
+        # Status Bar
+        status_frame = tk.Frame(self.root, padx=5, pady=5, relief=tk.SUNKEN, bd=1)
+        status_frame.pack(side="bottom", fill="x")
+        tk.Label(status_frame, textvariable=self.status, anchor="w").pack(fill="x")
+
+    def set_input_files(self, files, label):
+        self.input_files = sorted(Path(f) for f in files)
+        self.input_label.set(label)
+
+    def browse_input(self):
+        file_paths = filedialog.askopenfilenames(filetypes=[("File CAH", "*.cah"), ("Tutti i file", "*.*")])
+        if file_paths:
+            label = file_paths[0] if len(file_paths) == 1 else f"{len(file_paths)} file selezionati"
+            self.set_input_files(file_paths, label)
+
+    def browse_input_dir(self):
+        dir_path = filedialog.askdirectory()
+        if dir_path:
+            files = list(Path(dir_path).glob("*.cah"))
+            self.set_input_files(files, f"{dir_path} ({len(files)} file)")
+
+    def browse_output(self):
+        dir_path = filedialog.askdirectory()
+        if dir_path:
+            self.output_dir.set(dir_path)
+
+    def start_conversion(self):
+        files = self.input_files
+        out = self.output_dir.get()
+        
+        if not files:
+            messagebox.showwarning("Attenzione", "Seleziona uno o più file .cah, o una cartella che li contenga")
+            return
+        
+        if not out:
+            messagebox.showwarning("Attenzione", "Seleziona una cartella di destinazione")
+            return
+            
+        self.convert_btn.config(state="disabled")
+        self.cancel_btn.config(state="normal")
+        self.log.delete(0, tk.END)
+        self.progress.config(maximum=len(files), value=0)
+        self.done = 0
+        self.errors = 0
+        self.batch_start = time.perf_counter()
+        self.status.set(f"Conversione di {len(files)} file in corso...")
+        
+        # Il lavoro va al pool; i risultati tornano al main loop tramite la coda
+        Path(out).mkdir(parents=True, exist_ok=True)
+        try:
+            self.batch = GuiBatch(self.executor, files, out)
+        except BrokenProcessPool:
+            # Un worker è terminato in modo anomalo in un lotto precedente: pool nuovo
+            self.executor = make_executor()
+            self.batch = GuiBatch(self.executor, files, out)
+        self.root.after(GUI_POLL_MS, self.poll_results)
+
+    def cancel_conversion(self):
+        if self.batch is not None:
+            self.batch.cancel()
+            self.cancel_btn.config(state="disabled")
+            self.status.set("Annullamento: si attende la fine dei file già in corso...")
+
+    def poll_results(self):
+        """Legge dal main loop di Tk i risultati arrivati dal pool"""
+        batch = self.batch
+        if batch is None:
+            return
+        while True:
+            try:
+                cah_file, res, error, elapsed = batch.results.get_nowait()
+            except queue.Empty:
+                break
+            self.done += 1
+            if error is None:
+                self.log.insert(tk.END, f"✓ {cah_file.name}  {elapsed:.2f}s" + ("  (cache)" if res['cached'] else ""))
+            else:
+                self.errors += 1
+                self.log.insert(tk.END, f"✗ {cah_file.name}: {error}")
+            self.log.see(tk.END)
+        self.progress.config(value=self.done)
+
+        total = len(batch.files)
+        if self.done < total:
+            if not batch.cancelled:
+                self.status.set(f"Convertiti {self.done}/{total} file...")
+            self.root.after(GUI_POLL_MS, self.poll_results)
+            return
+        self.finish_batch(batch)
+
+    def finish_batch(self, batch):
+        self.batch = None
+        self.convert_btn.config(state="normal")
+        self.cancel_btn.config(state="disabled")
+        elapsed = time.perf_counter() - self.batch_start
+        total = len(batch.files)
+        ok = total - self.errors
+        summary = f"Completati {ok}/{total} file in {elapsed:.1f}s"
+        if batch.cancelled:
+            self.status.set(f"Annullato: {summary.lower()}")
+        elif self.errors:
+            self.status.set(f"{summary}, {self.errors} errori")
+            messagebox.showerror("Errore", f"{summary}.\n{self.errors} file non convertiti: vedi l'elenco.")
+        else:
+            self.status.set(summary)
+            messagebox.showinfo("Successo", f"{summary}.\nSchede salvate in:\n{self.output_dir.get()}")
+
+    def close(self):
+        if self.batch is not None:
+            self.batch.cancel()
+        self.executor.shutdown(wait=False)
+        self.root.destroy()
+
+def run_gui():
+    """Apre la finestra principale e ne esegue il main loop"""
+    root = tk.Tk()
+    DndConverterApp(root)
+    root.mainloop()
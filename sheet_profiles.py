@@ -0,0 +1,302 @@
+"""Profili dei template: slot logici della scheda -> nomi dei campi del PDF
+
+Ogni template (quello incluso, una versione italiana, una da stampa...)
+ha i suoi nomi di campo. Un profilo li associa agli slot logici che
+compila fill_dnd_sheet ('character_name', 'strength_mod', 'spells_3'...).
+Quando un template viene registrato, una passata di discovery propone la
+mappatura confrontando i nomi dei suoi campi con quelli del template
+incluso e con alcuni alias italiani; il risultato viene salvato accanto al
+template come <template>.profile.json, versionato e legato all'hash del
+template, e può essere corretto a mano. Al render il profilo è già
+compilato in tabelle lette solo per indice.
+
+Solo libreria standard: il modulo viene caricato all'avvio della CLI.
+"""
+import json
+import os
+import re
+import threading
+import unicodedata
+from pathlib import Path
+
+# Se cambia la struttura del file .profile.json va incrementata la versione
+PROFILE_VERSION = 1
+DEFAULT_PROFILE_NAME = "5e"
+
+ABILITIES = ('strength', 'dexterity', 'constitution', 'intelligence', 'wisdom', 'charisma')
+
+# Tipi di abilità del .cah, nell'ordine in cui fill_dnd_sheet le calcola
+SKILL_TYPES = (
+    'ACROBATICS', 'ANIMAL_HANDLING', 'ARCANA', 'ATHLETICS', 'DECEPTION', 'HISTORY',
+    'INSIGHT', 'INTIMIDATION', 'INVESTIGATION', 'MEDICINE', 'NATURE', 'PERCEPTION',
+    'PERFORMANCE', 'PERSUASION', 'RELIGION', 'SLEIGHT_OF_HAND', 'STEALTH', 'SURVIVAL',
+)
+
+SPELL_LEVELS = range(10)
+
+# Campi del template incluso (5E_CharacterSheet_Fillable.pdf), stranezze
+# comprese: spazi finali, 'CHamod', il doppio spazio di 'SpellSaveDC  2'
+_ABILITY_FIELDS = (
+    ('STR', 'STRmod', 'ST Strength', 'Check Box 11'),
+    ('DEX', 'DEXmod ', 'ST Dexterity', 'Check Box 18'),
+    ('CON', 'CONmod', 'ST Constitution', 'Check Box 19'),
+    ('INT', 'INTmod', 'ST Intelligence', 'Check Box 20'),
+    ('WIS', 'WISmod', 'ST Wisdom', 'Check Box 21'),
+    ('CHA', 'CHamod', 'ST Charisma', 'Check Box 22'),
+)
+_SKILL_FIELDS = (
+    ('Acrobatics', 'Check Box 23'), ('Animal', 'Check Box 24'), ('Arcana', 'Check Box 25'),
+    ('Athletics', 'Check Box 26'), ('Deception ', 'Check Box 27'), ('History ', 'Check Box 28'),
+    ('Insight', 'Check Box 29'), ('Intimidation', 'Check Box 30'), ('Investigation ', 'Check Box 31'),
+    ('Medicine', 'Check Box 32'), ('Nature', 'Check Box 33'), ('Perception ', 'Check Box 34'),
+    ('Performance', 'Check Box 35'), ('Persuasion', 'Check Box 36'), ('Religion', 'Check Box 37'),
+    ('SleightofHand', 'Check Box 38'), ('Stealth ', 'Check Box 39'), ('Survival', 'Check Box 40'),
+)
+# Incantesimi per livello (0 = trucchetti), dall'alto in basso: il PDF usa
+# una numerazione strana e il primo campo di ogni riquadro è fuori sequenza
+_SPELL_NUMBERS = {
+    0: (1014, *range(1016, 1023)),
+    1: (1015, *range(1023, 1034)),
+    2: (1046, *range(1034, 1046)),
+    3: (1048, 1047, *range(1049, 1060)),
+    4: (1061, 1060, *range(1062, 1073)),
+    5: (1074, 1073, *range(1075, 1082)),
+    6: (1083, 1082, *range(1084, 1091)),
+    7: (1092, 1091, *range(1093, 1100)),
+    8: (10101, 10100, *range(10102, 10107)),
+    9: (10108, 10107, 10109, *range(101010, 101014)),
+}
+
+DEFAULT_FIELDS = {
+    'character_name': 'CharacterName',
+    'player_name': 'PlayerName',
+    'background': 'Background',
+    'race': 'Race ',
+    'class_level': 'ClassLevel',
+    'alignment': 'Alignment',
+    'xp': 'XP',
+    'hp_max': 'HPMax',
+    'hp_current': 'HPCurrent',
+    'ac': 'AC',
+    'speed': 'Speed',
+    'proficiency_bonus': 'ProfBonus',
+    'initiative': 'Initiative',
+    'passive_perception': 'Passive',
+    'features': 'Features and Traits',
+    'portrait': 'CHARACTER IMAGE',
+    'spellcasting_class': 'Spellcasting Class 2',
+    'spellcasting_ability': 'SpellcastingAbility 2',
+    'spell_save_dc': 'SpellSaveDC  2',
+    'spell_attack_bonus': 'SpellAtkBonus 2',
+}
+for _ability, (_score, _mod, _save, _check) in zip(ABILITIES, _ABILITY_FIELDS):
+    DEFAULT_FIELDS.update({f'{_ability}_score': _score, f'{_ability}_mod': _mod,
+                           f'{_ability}_save': _save, f'{_ability}_save_check': _check})
+for _skill_type, (_field, _check) in zip(SKILL_TYPES, _SKILL_FIELDS):
+    DEFAULT_FIELDS.update({f'skill_{_skill_type.lower()}': _field, f'skill_{_skill_type.lower()}_check': _check})
+for _level in range(1, 10):
+    # Il PDF numera i riquadri degli slot da 19 (livello 1) a 27 (livello 9)
+    DEFAULT_FIELDS.update({f'slots_total_{_level}': f'SlotsTotal {18 + _level}',
+                           f'slots_remaining_{_level}': f'SlotsRemaining {18 + _level}'})
+for _level, _numbers in _SPELL_NUMBERS.items():
+    DEFAULT_FIELDS[f'spells_{_level}'] = [f'Spells {num}' for num in _numbers]
+
+# Nomi alternativi proposti dalla discovery, confrontati senza maiuscole,
+# spazi, punteggiatura e accenti: coprono le schede italiane più diffuse
+_ITALIAN_ABILITIES = {
+    'strength': ('FOR', 'Forza'), 'dexterity': ('DES', 'Destrezza'),
+    'constitution': ('COS', 'Costituzione'), 'intelligence': ('INT', 'Intelligenza'),
+    'wisdom': ('SAG', 'Saggezza'), 'charisma': ('CAR', 'Carisma'),
+}
+_ITALIAN_SKILLS = (
+    'Acrobazia', 'Addestrare Animali', 'Arcano', 'Atletica', 'Inganno', 'Storia',
+    'Intuizione', 'Intimidire', 'Indagare', 'Medicina', 'Natura', 'Percezione',
+    'Intrattenere', 'Persuasione', 'Religione', 'Rapidita di Mano', 'Furtivita', 'Sopravvivenza',
+)
+FIELD_ALIASES = {
+    'character_name': ('NomePersonaggio', 'Nome'),
+    'player_name': ('NomeGiocatore', 'Giocatore'),
+    'background': ('Retroscena', 'Passato'),
+    'race': ('Razza',),
+    'class_level': ('ClasseLivello', 'Classe e Livello'),
+    'alignment': ('Allineamento',),
+    'xp': ('PE', 'PuntiEsperienza'),
+    'hp_max': ('PFMax', 'PuntiFeritaMassimi'),
+    'hp_current': ('PFAttuali', 'PuntiFeritaAttuali'),
+    'ac': ('CA', 'ClasseArmatura'),
+    'speed': ('Velocita',),
+    'proficiency_bonus': ('BonusCompetenza', 'Competenza'),
+    'initiative': ('Iniziativa',),
+    'passive_perception': ('SaggezzaPassiva', 'PercezionePassiva'),
+    'features': ('Privilegi e Tratti', 'Privilegi'),
+    'portrait': ('Ritratto', 'Immagine Personaggio'),
+    'spellcasting_class': ('Classe Incantatore',),
+    'spellcasting_ability': ('Caratteristica da Incantatore',),
+    'spell_save_dc': ('CD Tiro Salvezza Incantesimi', 'CD Incantesimi'),
+    'spell_attack_bonus': ('Bonus Attacco Incantesimi',),
+}
+for _ability, (_abbr, _name) in _ITALIAN_ABILITIES.items():
+    FIELD_ALIASES.update({f'{_ability}_score': (_abbr, _name), f'{_ability}_mod': (f'{_abbr}mod', f'Mod{_abbr}'),
+                          f'{_ability}_save': (f'TS {_name}', f'TS{_abbr}')})
+for _skill_type, _name in zip(SKILL_TYPES, _ITALIAN_SKILLS):
+    FIELD_ALIASES[f'skill_{_skill_type.lower()}'] = (_name,)
+
+def _normalize(name):
+    """Nome di campo senza maiuscole, accenti, spazi e punteggiatura, per la discovery"""
+    name = unicodedata.normalize('NFKD', name)
+    return re.sub(r'[\W_]+', '', ''.join(c for c in name if not unicodedata.combining(c)).lower())
+
+def discover_fields(field_names, previous=None):
+    """Propone la mappatura slot -> campo per un template con i campi indicati
+
+    Per ogni slot prova, in ordine, il campo della mappatura precedente dello
+    stesso template, quello del template incluso e gli alias: prima per nome
+    esatto, poi per nome normalizzato. Un campo viene assegnato a un solo
+    slot. Restituisce (mappatura, slot non trovati).
+    """
+    exact = set(field_names)
+    normalized = {}
+    for name in field_names:
+        normalized.setdefault(_normalize(name), name)
+    previous = previous or {}
+    used = set()
+
+    def match(candidates):
+        for candidate in candidates:
+            if candidate in exact and candidate not in used:
+                return candidate
+        for candidate in candidates:
+            name = normalized.get(_normalize(candidate))
+            if name is not None and name not in used:
+                return name
+        return None
+
+    fields = {}
+    missing = []
+    for slot, default in DEFAULT_FIELDS.items():
+        if isinstance(default, list):
+            # Righe degli incantesimi: una per campo, nell'ordine del riquadro
+            rows = [match([row]) for row in previous.get(slot) or default]
+            rows = [row for row in rows if row is not None]
+            used.update(rows)
+            fields[slot] = rows
+            if not rows:
+                missing.append(slot)
+            continue
+        candidates = ([previous[slot]] if previous.get(slot) else []) + [default, *FIELD_ALIASES.get(slot, ())]
+        name = match(candidates)
+        if name is None:
+            missing.append(slot)
+        else:
+            used.add(name)
+        fields[slot] = name
+    return fields, missing
+
+class TemplateProfile:
+    """Profilo compilato: per ogni slot il campo del template, o None se manca
+
+    Le tabelle usate dalla compilazione della scheda (caratteristiche,
+    abilità, slot e righe degli incantesimi) vengono costruite qui una
+    volta sola.
+    """
+
+    def __init__(self, name, fields, template=None, template_sha256=None, missing=()):
+        self.name = name
+        self.template = template
+        self.template_sha256 = template_sha256
+        self.missing = tuple(missing)
+        # True solo per il profilo appena proposto dalla discovery
+        self.discovered = False
+        self.fields = {slot: fields.get(slot) or None for slot in DEFAULT_FIELDS}
+        field = self.fields.get
+        self.abilities = tuple((field(f'{ability}_score'), field(f'{ability}_mod'),
+                                field(f'{ability}_save'), field(f'{ability}_save_check'))
+                               for ability in ABILITIES)
+        self.skills = tuple((field(f'skill_{skill_type.lower()}'), field(f'skill_{skill_type.lower()}_check'))
+                            for skill_type in SKILL_TYPES)
+        self.spell_slots = tuple((field(f'slots_total_{level}'), field(f'slots_remaining_{level}'))
+                                 for level in range(1, 10))
+        self.spells = {level: tuple(field(f'spells_{level}') or ()) for level in SPELL_LEVELS}
+        # Intestazione della pagina incantesimi, ripetuta sulle pagine di continuazione
+        self.spell_header = tuple(name for name in (field('spellcasting_class'), field('spellcasting_ability'),
+                                                    field('spell_save_dc'), field('spell_attack_bonus')) if name)
+
+    def to_json(self):
+        return {
+            'version': PROFILE_VERSION,
+            'name': self.name,
+            'template': self.template,
+            'template_sha256': self.template_sha256,
+            'fields': self.fields,
+            'missing': list(self.missing),
+        }
+
+DEFAULT_PROFILE = TemplateProfile(DEFAULT_PROFILE_NAME, DEFAULT_FIELDS)
+
+def get_profile_path(template_path):
+    """Percorso del profilo compilato associato al template"""
+    template_path = Path(template_path)
+    return template_path.with_name(template_path.name + ".profile.json")
+
+def read_profile_artifact(template_path):
+    """Contenuto del .profile.json del template, o None se manca o è di un'altra versione"""
+    try:
+        with open(get_profile_path(template_path), 'r', encoding='utf-8') as f:
+            artifact = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return artifact if artifact.get('version') == PROFILE_VERSION else None
+
+def load_profile(template_path, template_hash):
+    """Profilo compilato del template, se il suo .profile.json è aggiornato"""
+    artifact = read_profile_artifact(template_path)
+    if artifact is None or artifact.get('template_sha256') != template_hash:
+        return None
+    return TemplateProfile(artifact.get('name') or Path(template_path).stem, artifact.get('fields', {}),
+                           artifact.get('template'), template_hash, artifact.get('missing', ()))
+
+def compile_profile(template_path, template_hash, field_names, name=None, persist=True):
+    """Discovery dei campi del template e salvataggio del profilo compilato
+
+    Se il template aveva già un profilo (anche di una sua versione
+    precedente) le associazioni ancora valide, correzioni a mano comprese,
+    vengono mantenute. Con persist=False il profilo non viene salvato.
+    """
+    template_path = Path(template_path)
+    previous = read_profile_artifact(template_path) or {}
+    fields, missing = discover_fields(field_names, previous.get('fields'))
+    profile = TemplateProfile(name or previous.get('name') or template_path.stem, fields,
+                              template_path.name, template_hash, missing)
+    profile.discovered = True
+    if not persist:
+        return profile
+    profile_path = get_profile_path(template_path)
+    try:
+        tmp_path = profile_path.with_name(f"{profile_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(profile.to_json(), f, indent=1, ensure_ascii=False)
+        os.replace(tmp_path, profile_path)
+    except OSError:
+        # Cartella del template in sola lettura: il profilo resta solo in memoria
+        pass
+    return profile
+
+# Registro dei profili per nome: il profilo del template incluso c'è sempre
+_registry = {DEFAULT_PROFILE_NAME: DEFAULT_PROFILE}
+_registry_lock = threading.Lock()
+
+def register_profile(profile):
+    """Aggiunge (o sostituisce) un profilo nel registro e lo restituisce"""
+    with _registry_lock:
+        _registry[profile.name] = profile
+    return profile
+
+def get_profile(name):
+    """Profilo registrato con il nome indicato; KeyError se non c'è"""
+    with _registry_lock:
+        return _registry[name]
+
+def registered_profiles():
+    """Nomi dei profili registrati"""
+    with _registry_lock:
+        return sorted(_registry)
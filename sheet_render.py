@@ -0,0 +1,1354 @@
+"""Motore di render delle schede: indice del template, overlay del testo e aggiornamenti pypdf
+
+Importato da fill_dnd_sheet solo al primo render, così la CLI, il watch
+e le esportazioni che non producono PDF non caricano pypdf e ReportLab.
+"""
+import base64
+import functools
+import hashlib
+import io
+import json
+import math
+import os
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from pypdf import PdfReader, PdfWriter, PageObject
+from pypdf.generic import (
+    NameObject, DictionaryObject, ArrayObject, FloatObject,
+    DecodedStreamObject, IndirectObject, NumberObject, TextStringObject,
+    encode_pdfdocencoding,
+)
+from reportlab.pdfbase.pdfmetrics import getFont, registerFont, stringWidth, unicode2T1
+from reportlab.pdfbase.ttfonts import FF_NONSYMBOLIC, FF_SYMBOLIC, SUBSETN, TTFont, makeToUnicodeCMap
+
+from fill_dnd_sheet import (
+    NULL_PROFILER, SPELL_PAGES_FIELD, RawImage,
+    _open_output, _output_size, file_sha256, resolve_font,
+)
+
+# Indice precompilato della geometria dei campi, salvato accanto al template.
+# Se cambia la struttura dell'indice va incrementata la versione.
+TEMPLATE_INDEX_VERSION = 3
+
+def get_template_index_path(template_path):
+    """Percorso del file indice associato al template"""
+    template_path = Path(template_path)
+    return template_path.with_name(template_path.name + ".index.json")
+
+def build_template_index(template_path):
+    """Percorre le annotazioni del template e ne estrae la geometria dei campi"""
+    reader = PdfReader(template_path)
+    fields = {}
+    images = {}
+    for page_num, page in enumerate(reader.pages):
+        if "/Annots" not in page:
+            continue
+        for annot in page["/Annots"]:
+            obj = annot.get_object()
+            if "/T" not in obj:
+                # Pulsanti immagine: widget senza nome, con /IF (adattamento icona) nel /MK
+                parent = obj.get("/Parent", {}).get_object() if "/Parent" in obj else {}
+                if "/T" in parent and "/IF" in obj.get("/MK", {}) and str(parent["/T"]) not in images:
+                    images[str(parent["/T"])] = {
+                        'page': page_num,
+                        'rect': [float(v) for v in obj["/Rect"][:4]],
+                    }
+                continue
+            # Ottieni coordinate (Rect è [x1, y1, x2, y2])
+            rect = obj.get("/Rect")
+            if not rect:
+                continue
+            x1, y1, x2, y2 = (float(v) for v in rect[:4])
+            field_type = obj.get("/FT") or obj.get("/Parent", {}).get("/FT", "")
+            fields[str(obj["/T"])] = {
+                'page': page_num,
+                'rect': [x1, y1, x2, y2],
+                'type': str(field_type),
+                # Stima dimensione font (60% dell'altezza, max 10pt)
+                'font_size': min((y2 - y1) * 0.6, 10),
+                # Flag 13 di /Ff: il campo va a capo
+                'multiline': bool(int(obj.get("/Ff", 0)) & 4096),
+            }
+    return {
+        'version': TEMPLATE_INDEX_VERSION,
+        'page_count': len(reader.pages),
+        'fields': fields,
+        'images': images,
+    }
+
+def load_template_index(template_path, persist=True):
+    """Restituisce l'indice dei campi, ricompilandolo se il template è cambiato
+
+    Con persist=False l'indice ricompilato resta solo in memoria.
+    """
+    template_hash = file_sha256(template_path)
+    index_path = get_template_index_path(template_path)
+    try:
+        with open(index_path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        if index.get('version') == TEMPLATE_INDEX_VERSION and index.get('template_sha256') == template_hash:
+            return index
+    except (OSError, ValueError):
+        pass
+
+    index = build_template_index(template_path)
+    index['template_sha256'] = template_hash
+    if not persist:
+        return index
+    try:
+        # Nome unico per processo e thread: worker di --jobs e del server scrivono lo stesso indice
+        tmp_path = index_path.with_name(f"{index_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, index_path)
+    except OSError:
+        # Cartella del template in sola lettura: l'indice resta solo in memoria
+        pass
+    return index
+
+class CachedTemplate:
+    """Template PDF analizzato una sola volta: indice dei campi e pagine decodificate"""
+
+    def __init__(self, template_path, stat, persist=True):
+        self.path = Path(template_path)
+        self.stat_key = (stat.st_mtime_ns, stat.st_size)
+        self.index = load_template_index(self.path, persist)
+        self.reader = PdfReader(self.path)
+        # Pagine statiche senza campi form, con tutti gli oggetti già in memoria:
+        # da qui i render copiano senza toccare più il file
+        self._static_pages = PdfWriter()
+        for page in self.reader.pages:
+            static_page = self._static_pages.add_page(page, excluded_keys=("/Annots",))
+            # Un solo stream di contenuto: il merge lo sostituisce senza lasciare
+            # nel file di output gli stream originali orfani
+            static_page[NameObject("/Contents")] = self._static_pages._add_object(static_page.get_contents())
+        self._base_lock = threading.Lock()
+        self._form_base = None
+        self._overlay_base = None
+
+    @property
+    def page_count(self):
+        return len(self._static_pages.pages)
+
+    def overlay_base(self):
+        """Restituisce le pagine statiche serializzate per il motore overlay, preparate al primo uso"""
+        with self._base_lock:
+            if self._overlay_base is None:
+                self._overlay_base = OverlayBase(self._static_pages)
+            return self._overlay_base
+
+    def form_base(self):
+        """Restituisce il template con i campi form serializzato, preparato al primo uso"""
+        with self._base_lock:
+            if self._form_base is None:
+                self._form_base = FormBase(self.reader)
+            return self._form_base
+
+class TemplateCache:
+    """Cache in memoria dei template già analizzati, condivisa tra i thread"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get(self, template_path, persist=True):
+        """Restituisce il template analizzato, ricaricandolo se il file è cambiato
+
+        persist=False non salva l'indice accanto al template (vedi load_template_index).
+        """
+        template_path = Path(template_path)
+        key = template_path.resolve()
+        stat = os.stat(key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.stat_key != (stat.st_mtime_ns, stat.st_size):
+                entry = CachedTemplate(template_path, stat, persist)
+                self._entries[key] = entry
+            return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+template_cache = TemplateCache()
+
+def _import_pil():
+    """Pillow serve solo a ridurre i ritratti: lo importa al primo uso"""
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    return Image
+
+# Cache dei ritratti: miniature JPEG alla risoluzione di stampa del riquadro
+PORTRAIT_CACHE_DIR = ".portrait_cache"
+PORTRAIT_CACHE_MAX_BYTES = 32 * 1024 * 1024
+PORTRAIT_MEMORY_ITEMS = 64
+PORTRAIT_DPI = 150
+PORTRAIT_QUALITY = 85
+# Da incrementare quando cambia il modo in cui vengono prodotte le miniature
+PORTRAIT_VERSION = 1
+
+class Portrait:
+    """Miniatura JPEG pronta da incorporare nel PDF così com'è (DCTDecode)"""
+
+    __slots__ = ('key', 'data', 'width', 'height')
+
+    def __init__(self, key, data, width, height):
+        self.key = key
+        self.data = data
+        self.width = width
+        self.height = height
+
+    def fit(self, rect):
+        """Posizione e dimensioni (x, y, w, h) del ritratto centrato nel riquadro, senza deformarlo"""
+        x1, y1, x2, y2 = rect
+        scale = min((x2 - x1) / self.width, (y2 - y1) / self.height)
+        width = self.width * scale
+        height = self.height * scale
+        return x1 + (x2 - x1 - width) / 2, y1 + (y2 - y1 - height) / 2, width, height
+
+    def xobject(self):
+        """Image XObject con i byte JPEG della miniatura, senza ricodificarli"""
+        image = DecodedStreamObject()
+        image.update({
+            NameObject("/Type"): NameObject("/XObject"),
+            NameObject("/Subtype"): NameObject("/Image"),
+            NameObject("/Width"): NumberObject(self.width),
+            NameObject("/Height"): NumberObject(self.height),
+            NameObject("/ColorSpace"): NameObject("/DeviceRGB"),
+            NameObject("/BitsPerComponent"): NumberObject(8),
+            NameObject("/Filter"): NameObject("/DCTDecode"),
+        })
+        image._data = self.data
+        return image
+
+class PortraitCache:
+    """Ritratti già decodificati e ridotti alla dimensione del riquadro
+
+    La chiave è l'hash del base64 e del riquadro, così un ritratto invariato
+    non viene mai decodificato di nuovo. Le miniature stanno su disco come
+    <chiave>.jpg con eviction LRU (la data di modifica segna l'ultimo uso)
+    e le più recenti anche in memoria. Un ritratto illeggibile lascia un
+    marcatore <chiave>.bad e non viene più decodificato. Con root=None la
+    cache resta solo in memoria e non scrive niente su disco.
+    """
+
+    def __init__(self, root, max_bytes=PORTRAIT_CACHE_MAX_BYTES, memory_items=PORTRAIT_MEMORY_ITEMS):
+        self.root = Path(root) if root is not None else None
+        self.max_bytes = max_bytes
+        self.memory_items = memory_items
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+
+    def key(self, source, box_size):
+        digest = hashlib.sha256(f"{PORTRAIT_VERSION}:{box_size[0]:.2f}x{box_size[1]:.2f}:".encode('ascii'))
+        if isinstance(source, RawImage):
+            # Ritratto grezzo dal .cah: basta il suo hash, senza decodificarlo
+            digest.update(f"sha256:{source.digest}".encode('ascii'))
+        else:
+            digest.update(source.encode('ascii', 'ignore'))
+        return digest.hexdigest()
+
+    def get(self, source, box_size):
+        """Restituisce il Portrait per il riquadro (larghezza, altezza in punti), o None se illeggibile
+
+        source è il base64 del ritratto, come stringa o come RawImage.
+        """
+        Image = _import_pil()
+        if Image is None:
+            return None
+        key = self.key(source, box_size)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+
+        path = self.root / f"{key}.jpg" if self.root is not None else None
+        data = None
+        if path is not None:
+            try:
+                data = path.read_bytes()
+                os.utime(path)
+            except OSError:
+                pass
+        if data is None and path is not None and path.with_suffix(".bad").exists():
+            # Già risultato illeggibile in un render precedente
+            self._remember(key, None)
+            return None
+        if data is None:
+            data = self._make_thumbnail(Image, source, box_size)
+            if data is None:
+                # Il fallimento va in cache come la miniatura: niente nuova decodifica
+                self._remember(key, None)
+                if path is not None:
+                    self._store(path.with_suffix(".bad"), b"")
+                return None
+            if path is not None:
+                self._store(path, data)
+        # Solo l'intestazione JPEG: le dimensioni senza decodificare i pixel
+        with Image.open(io.BytesIO(data)) as thumbnail:
+            width, height = thumbnail.size
+        portrait = Portrait(key, data, width, height)
+        self._remember(key, portrait)
+        return portrait
+
+    def _remember(self, key, portrait):
+        """Tiene in memoria la miniatura (o None per un ritratto illeggibile)"""
+        with self._lock:
+            self._memory[key] = portrait
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+    def _make_thumbnail(self, Image, source, box_size):
+        try:
+            image_b64 = source.base64() if isinstance(source, RawImage) else source
+            with Image.open(io.BytesIO(base64.b64decode(image_b64))) as image:
+                image = image.convert("RGB")
+                image.thumbnail((round(box_size[0] * PORTRAIT_DPI / 72), round(box_size[1] * PORTRAIT_DPI / 72)),
+                                Image.LANCZOS)
+                output = io.BytesIO()
+                image.save(output, "JPEG", quality=PORTRAIT_QUALITY, optimize=True)
+        except (ValueError, OSError):
+            # Base64 o immagine non validi: la scheda viene comunque compilata
+            return None
+        return output.getvalue()
+
+    def _store(self, path, data):
+        try:
+            self.root.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_name(f"{path.stem}.{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, path)
+            self._evict()
+        except OSError:
+            # Cartella non scrivibile: la miniatura resta solo in memoria
+            pass
+
+    def _evict(self):
+        """Rimuove le miniature usate meno di recente oltre il limite di spazio
+
+        I marcatori .bad dei ritratti illeggibili sono vuoti e seguono lo stesso ordine LRU.
+        """
+        entries = []
+        for entry in os.scandir(self.root):
+            if entry.name.endswith((".jpg", ".bad")) and entry.is_file():
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry_path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(entry_path)
+            except OSError:
+                pass
+            total -= size
+
+# Per i render in memoria (render, server) e per chi non indica una cartella
+# di output: nessuna scrittura oltre al PDF
+memory_portrait_cache = PortraitCache(None)
+
+_portrait_caches = {}
+_portrait_caches_lock = threading.Lock()
+
+def get_portrait_cache(output_dir):
+    """Cache delle miniature in <output_dir>/.portrait_cache, una per cartella e per processo"""
+    root = (Path(output_dir) / PORTRAIT_CACHE_DIR).resolve()
+    with _portrait_caches_lock:
+        cache = _portrait_caches.get(root)
+        if cache is None:
+            cache = _portrait_caches[root] = PortraitCache(root)
+        return cache
+
+def _portrait_field(index, field_data):
+    """Nome del campo immagine del template compilato in field_data, se c'è"""
+    for field_name in index.get('images', {}):
+        if field_data.get(field_name):
+            return field_name
+    return None
+
+def _portrait_for(index, field_data, portraits=None):
+    """Restituisce (nome, campo, Portrait) del ritratto da disegnare, se c'è"""
+    field_name = _portrait_field(index, field_data)
+    if field_name is None:
+        return None
+    field = index['images'][field_name]
+    x1, y1, x2, y2 = field['rect']
+    portrait = (portraits or memory_portrait_cache).get(field_data[field_name], (x2 - x1, y2 - y1))
+    if portrait is None:
+        return None
+    return field_name, field, portrait
+
+def _content_refs(contents):
+    """Riferimenti agli stream di /Contents, che sia uno stream o un array (anche indiretto)"""
+    if isinstance(contents, IndirectObject) and isinstance(contents.get_object(), ArrayObject):
+        contents = contents.get_object()
+    return list(contents) if isinstance(contents, ArrayObject) else [contents]
+
+def _portrait_operations(portrait, rect, origin=(0, 0), name="/Portrait"):
+    """Operatori che disegnano il ritratto nel riquadro, relativi all'origine indicata"""
+    x, y, width, height = portrait.fit(rect)
+    return b"q %.3f 0 0 %.3f %.3f %.3f cm %s Do Q\n" % (
+        width, height, x - origin[0], y - origin[1], name.encode('ascii'))
+
+# Auto-adattamento del testo: il corpo stimato dall'indice è il massimo,
+# poi il testo si rimpicciolisce (o va a capo nei campi multilinea)
+AUTOFIT_FONT = "Helvetica"
+AUTOFIT_MIN_SIZE = 4
+AUTOFIT_STEP = 0.5
+AUTOFIT_PADDING = 2
+AUTOFIT_LEADING = 1.15
+
+_font_widths = {}
+
+def font_widths(font_name):
+    """Larghezze dei glifi Latin-1 del font a corpo 1, calcolate una volta per processo"""
+    widths = _font_widths.get(font_name)
+    if widths is None:
+        widths = {chr(code): stringWidth(chr(code), font_name, 1) for code in range(32, 256)}
+        _font_widths[font_name] = widths
+    return widths
+
+@functools.lru_cache(maxsize=32768)
+def text_width(text, font_name=AUTOFIT_FONT):
+    """Larghezza del testo a corpo 1: per un altro corpo basta moltiplicare"""
+    widths = font_widths(font_name)
+    try:
+        return sum(widths[char] for char in text)
+    except KeyError:
+        # Caratteri fuori dalla tabella (es. ✓): misurati uno a uno
+        return sum(widths[char] if char in widths else stringWidth(char, font_name, 1) for char in text)
+
+def _wrap_text(text, max_width, font_name):
+    """Divide il testo in righe larghe al massimo max_width (a corpo 1)"""
+    space = text_width(" ", font_name)
+    lines = []
+    for paragraph in text.split("\n"):
+        line = ""
+        line_width = 0.0
+        for word in paragraph.split(" "):
+            word_width = text_width(word, font_name)
+            if line and line_width + space + word_width <= max_width:
+                line += " " + word
+                line_width += space + word_width
+                continue
+            if line:
+                lines.append(line)
+            # Parole più lunghe della riga: spezzate carattere per carattere
+            while word_width > max_width and len(word) > 1:
+                cut = len(word) - 1
+                while cut > 1 and text_width(word[:cut], font_name) > max_width:
+                    cut -= 1
+                lines.append(word[:cut])
+                word = word[cut:]
+                word_width = text_width(word, font_name)
+            line, line_width = word, word_width
+        lines.append(line)
+    return lines
+
+@functools.lru_cache(maxsize=32768)
+def fit_text(text, width, height, font_size, multiline=False, font_name=AUTOFIT_FONT):
+    """Corpo e righe con cui il testo entra in un campo di width x height punti
+
+    I campi su una riga riducono il corpo fino a far entrare il testo (non
+    sotto AUTOFIT_MIN_SIZE); quelli multilinea vanno a capo e riducono il
+    corpo solo se le righe non ci stanno in altezza. Restituisce
+    (corpo, righe): le righe oltre il fondo del campo vengono scartate.
+    """
+    available = width - 2 * AUTOFIT_PADDING
+    if not multiline:
+        text_units = text_width(text, font_name)
+        if text_units * font_size <= available:
+            return font_size, (text,)
+        size = math.floor(available / text_units * 10) / 10
+        return max(size, AUTOFIT_MIN_SIZE), (text,)
+
+    available_height = height - 2 * AUTOFIT_PADDING
+    size = font_size
+    while True:
+        lines = _wrap_text(text, available / size, font_name)
+        if len(lines) * size * AUTOFIT_LEADING <= available_height or size <= AUTOFIT_MIN_SIZE:
+            break
+        size = max(size - AUTOFIT_STEP, AUTOFIT_MIN_SIZE)
+    max_lines = max(1, int(available_height // (size * AUTOFIT_LEADING)))
+    return size, tuple(lines[:max_lines])
+
+def _layout_lines(field_width, field_height, size, lines, alignment=0, font_name=AUTOFIT_FONT):
+    """Posizioni (x, y, riga) relative all'angolo del campo; una riga sola resta centrata in verticale"""
+    placed = []
+    for i, line in enumerate(lines):
+        if alignment == 1:
+            x = (field_width - text_width(line, font_name) * size) / 2
+        elif alignment == 2:
+            x = field_width - AUTOFIT_PADDING - text_width(line, font_name) * size
+        else:
+            x = AUTOFIT_PADDING
+        if len(lines) == 1:
+            y = (field_height - size) / 2 + 1
+        else:
+            y = field_height - AUTOFIT_PADDING - size * (1 + i * AUTOFIT_LEADING)
+        placed.append((x, y, line))
+    return placed
+
+def _pdf_text_bytes(text):
+    """Codifica il testo per una stringa PDF con font Helvetica standard"""
+    encoded = bytearray()
+    for char in text:
+        try:
+            encoded += encode_pdfdocencoding(char)
+        except UnicodeEncodeError:
+            encoded += b"?"
+    return bytes(encoded).replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+
+class _SerializedBase:
+    """PDF serializzato una volta sola, base degli aggiornamenti incrementali (_PdfUpdate)"""
+
+    def _serialize(self, writer):
+        """Scrive il writer e ne risolve trailer e pagine; restituisce il reader dei byte scritti"""
+        buffer = io.BytesIO()
+        writer.write(buffer)
+        self.data = buffer.getvalue()
+        self.startxref = int(re.search(rb"startxref\s+(\d+)\s+%%EOF\s*$", self.data).group(1))
+
+        # Tutto ciò che serve ai render viene risolto qui: dopo la costruzione
+        # il reader non viene più letto e l'oggetto è condivisibile tra thread
+        base = PdfReader(io.BytesIO(self.data))
+        trailer = base.trailer
+        self.size = int(trailer["/Size"])
+        self.root_ref = trailer.raw_get("/Root")
+        self.info_ref = trailer.raw_get("/Info")
+        self.root = DictionaryObject(trailer["/Root"])
+        self.pages_ref = self.root.raw_get("/Pages")
+        self.pages_tree = DictionaryObject(self.root["/Pages"])
+        self.pages = []
+        for page in base.pages:
+            resources = page["/Resources"].get_object()
+            xobjects = resources["/XObject"].get_object() if "/XObject" in resources else DictionaryObject()
+            fonts = resources["/Font"].get_object() if "/Font" in resources else DictionaryObject()
+            self.pages.append({
+                'ref': page.indirect_reference,
+                'dict': DictionaryObject(page),
+                'resources': DictionaryObject(resources),
+                'xobjects': DictionaryObject(xobjects),
+                'fonts': DictionaryObject(fonts),
+            })
+        return base
+
+class OverlayBase(_SerializedBase):
+    """Pagine del template senza campi form, serializzate una volta sola
+
+    Le pagine senza niente da disegnare finiscono nell'output come questi
+    byte; le altre vengono sostituite da un aggiornamento incrementale che
+    aggiunge solo lo stream dell'overlay, senza merge_page.
+    """
+
+    def __init__(self, static_pages):
+        writer = PdfWriter()
+        for page in static_pages.pages:
+            writer.add_page(page)
+        # Il contenuto del template viene compresso una volta qui, al posto
+        # dell'oggetto originale perché non resti orfano nel file
+        for page in writer.pages:
+            contents_ref = page.raw_get("/Contents")
+            encoded = contents_ref.get_object().flate_encode()
+            encoded.indirect_reference = contents_ref
+            writer._objects[contents_ref.idnum - 1] = encoded
+        self._serialize(writer)
+
+class FormBase(_SerializedBase):
+    """Template con pagine, widget e AcroForm serializzato una volta sola
+
+    Ogni render riscrive questi byte così come sono e vi accoda un
+    aggiornamento incrementale con i soli oggetti modificati, invece di
+    clonare e riserializzare le migliaia di oggetti del modulo.
+    """
+
+    def __init__(self, reader):
+        writer = PdfWriter()
+        for page in reader.pages:
+            writer.add_page(page)
+        # /Fields punta ai widget appena copiati con le pagine
+        acroform = reader.trailer["/Root"]["/AcroForm"].clone(writer)
+        if "/NeedAppearances" in acroform:
+            del acroform["/NeedAppearances"]
+        writer._root_object[NameObject("/AcroForm")] = acroform.indirect_reference or acroform
+        base = self._serialize(writer)
+        self.font_ref = self.root["/AcroForm"]["/DR"]["/Font"].raw_get("/Helv")
+        self.widgets = {}
+        self.images = {}
+        parents = {}
+        for field_ref in self.root["/AcroForm"]["/Fields"]:
+            field = field_ref.get_object()
+            for kid in field.get("/Kids", ()):
+                parents[kid.idnum] = (str(field.get("/T", "")), field_ref)
+        for page_num, page in enumerate(base.pages):
+            for annot in page.get("/Annots", ArrayObject()).get_object():
+                widget = annot.get_object()
+                if "/T" not in widget:
+                    # Widget dei pulsanti immagine: la copia delle pagine perde il
+                    # /Parent col nome, che si ritrova dai /Kids del campo
+                    parent = parents.get(annot.idnum)
+                    if parent is not None and "/IF" in widget.get("/MK", {}):
+                        name, parent_ref = parent
+                        self.images.setdefault(name, []).append({
+                            'page': page_num, 'ref': annot, 'parent': parent_ref,
+                            'dict': DictionaryObject(widget),
+                        })
+                    continue
+                entry = {'page': page_num, 'ref': annot, 'dict': DictionaryObject(widget)}
+                if widget.get("/FT") == "/Btn" and "/AP" in widget:
+                    normal = widget["/AP"]["/N"]
+                    entry['on_state'] = next(state for state in normal if state != "/Off")
+                    entry['on_appearance'] = normal.raw_get(entry['on_state'])
+                self.widgets[str(widget["/T"])] = entry
+
+class _PdfUpdate:
+    """Oggetti nuovi o sostituiti da accodare a una base serializzata (FormBase o OverlayBase)"""
+
+    def __init__(self, base):
+        self.base = base
+        self.objects = {}
+        self._next_idnum = base.size
+        # Font del testo: i dizionari vengono aggiunti solo in write()
+        self.fonts = _FontRefs(self.add, self.replace)
+
+    def add(self, obj):
+        """Aggiunge un nuovo oggetto e ne restituisce il riferimento"""
+        idnum = self._next_idnum
+        self._next_idnum += 1
+        self.objects[idnum] = obj
+        return IndirectObject(idnum, 0, None)
+
+    def replace(self, ref, obj):
+        """Sostituisce un oggetto esistente del PDF base"""
+        self.objects[ref.idnum] = obj
+
+    def write(self, stream):
+        """Scrive il PDF base seguito dalla sezione di aggiornamento"""
+        self.fonts.finish()
+        out = io.BytesIO()
+        offsets = {}
+        for idnum in sorted(self.objects):
+            offsets[idnum] = len(self.base.data) + out.tell()
+            out.write(b"%d 0 obj\n" % idnum)
+            self.objects[idnum].write_to_stream(out)
+            out.write(b"\nendobj\n")
+
+        xref_offset = len(self.base.data) + out.tell()
+        # La voce libera dell'oggetto 0 rende la sezione indicizzata da zero
+        out.write(b"xref\n0 1\n0000000000 65535 f \n")
+        idnums = sorted(offsets)
+        run_start = 0
+        for i in range(1, len(idnums) + 1):
+            # Una sottosezione per ogni gruppo di numeri consecutivi
+            if i == len(idnums) or idnums[i] != idnums[i - 1] + 1:
+                out.write(b"%d %d\n" % (idnums[run_start], i - run_start))
+                for idnum in idnums[run_start:i]:
+                    out.write(b"%010d 00000 n \n" % offsets[idnum])
+                run_start = i
+
+        trailer = DictionaryObject({
+            NameObject("/Size"): NumberObject(max(self.base.size, self._next_idnum)),
+            NameObject("/Root"): self.base.root_ref,
+            NameObject("/Prev"): NumberObject(self.base.startxref),
+        })
+        if self.base.info_ref is not None:
+            trailer[NameObject("/Info")] = self.base.info_ref
+        out.write(b"trailer\n")
+        trailer.write_to_stream(out)
+        out.write(b"\nstartxref\n%d\n%%%%EOF\n" % xref_offset)
+
+        stream.write(self.base.data)
+        stream.write(out.getvalue())
+
+def _text_field_appearance(widget, text, font_size, font_ref, multiline=False, update=None, text_font=None):
+    """Genera l'aspetto (/AP /N) di un campo di testo compilato
+
+    Senza text_font il testo usa la /Helv del modulo (font_ref); con un
+    font incorporato usa i suoi sottoinsiemi, aggiunti a update.fonts.
+    """
+    x1, y1, x2, y2 = (float(v) for v in widget["/Rect"])
+    width = x2 - x1
+    height = y2 - y1
+    font_name = text_font.name if text_font is not None else AUTOFIT_FONT
+    
+    # Allineamento del campo (/Q): 0 sinistra, 1 centro, 2 destra
+    alignment = widget.get("/Q", 0)
+    font_size, lines = fit_text(text, width, height, font_size, multiline, font_name)
+    
+    fonts = DictionaryObject()
+    if text_font is None:
+        fonts[NameObject("/Helv")] = font_ref
+        operations = [b"/Tx BMC q BT /Helv %.2f Tf 0 g" % font_size]
+    else:
+        operations = [b"/Tx BMC q BT 0 g"]
+    previous_x, previous_y = 0.0, 0.0
+    for text_x, text_y, line in _layout_lines(width, height, font_size, lines, alignment, font_name):
+        # Td è relativo all'inizio della riga precedente
+        if text_font is None:
+            operations.append(b"%.2f %.2f Td (%s) Tj" % (text_x - previous_x, text_y - previous_y,
+                                                         _pdf_text_bytes(line)))
+        else:
+            operations.append(b"%.2f %.2f Td" % (text_x - previous_x, text_y - previous_y))
+            for resource_name, encoded in text_font.encode(line):
+                fonts[NameObject(resource_name)] = update.fonts.ref(resource_name, text_font)
+                operations.append(b"%s %.2f Tf (%s) Tj" % (resource_name.encode('ascii'), font_size,
+                                                           _escape_pdf_string(encoded)))
+        previous_x, previous_y = text_x, text_y
+    operations.append(b"ET Q EMC")
+    
+    appearance = DecodedStreamObject()
+    appearance.update({
+        NameObject("/Type"): NameObject("/XObject"),
+        NameObject("/Subtype"): NameObject("/Form"),
+        NameObject("/BBox"): ArrayObject([FloatObject(0), FloatObject(0), FloatObject(width), FloatObject(height)]),
+        NameObject("/Resources"): DictionaryObject({NameObject("/Font"): fonts}),
+    })
+    appearance.set_data(b" ".join(operations))
+    return appearance
+
+def _image_field_appearance(update, widget, portrait):
+    """Genera l'aspetto (/AP /N) di un pulsante immagine con il ritratto"""
+    x1, y1, x2, y2 = (float(v) for v in widget["/Rect"])
+    appearance = DecodedStreamObject()
+    appearance.update({
+        NameObject("/Type"): NameObject("/XObject"),
+        NameObject("/Subtype"): NameObject("/Form"),
+        NameObject("/BBox"): ArrayObject([FloatObject(0), FloatObject(0), FloatObject(x2 - x1), FloatObject(y2 - y1)]),
+        NameObject("/Resources"): DictionaryObject({
+            NameObject("/XObject"): DictionaryObject({NameObject("/Portrait"): update.add(portrait.xobject())})
+        }),
+    })
+    appearance.set_data(_portrait_operations(portrait, (x1, y1, x2, y2), origin=(x1, y1)))
+    return appearance
+
+def _flatten_form_page(update, page, page_num, placed):
+    """Sostituisce la pagina con una copia senza widget che disegna gli aspetti compilati"""
+    xobjects = DictionaryObject(page['xobjects'])
+    operations = []
+    for i, (widget, appearance_ref) in enumerate(placed):
+        name = f"/FlatP{page_num}F{i}"
+        xobjects[NameObject(name)] = appearance_ref
+        x1, y1 = float(widget["/Rect"][0]), float(widget["/Rect"][1])
+        operations.append(f"q 1 0 0 1 {x1:.3f} {y1:.3f} cm {name} Do Q")
+    resources = DictionaryObject(page['resources'])
+    resources[NameObject("/XObject")] = xobjects
+    
+    # Il contenuto originale resta compresso, racchiuso in q/Q
+    contents = _content_refs(page['dict'].raw_get("/Contents"))
+    before = DecodedStreamObject()
+    before.set_data(b"q\n")
+    after = DecodedStreamObject()
+    after.set_data(("Q\n" + "\n".join(operations) + "\n").encode("ascii"))
+    
+    flat_page = DictionaryObject(page['dict'])
+    del flat_page["/Annots"]
+    flat_page[NameObject("/Resources")] = resources
+    flat_page[NameObject("/Contents")] = ArrayObject([update.add(before)] + contents + [update.add(after)])
+    update.replace(page['ref'], flat_page)
+
+def fill_form_fields(template_path, output_path, field_data, flatten=False, profiler=None, portraits=None,
+                     font=None):
+    """Compila direttamente i campi AcroForm del template, senza overlay né merge
+
+    Con il font standard (font=None) i campi usano la Helvetica del modulo;
+    con un font incorporato (vedi get_text_font) i suoi sottoinsiemi.
+    """
+    text_font = get_text_font(font)
+    profiler = profiler or NULL_PROFILER
+    with profiler.stage("template"):
+        template = template_cache.get(template_path)
+        fields = template.index['fields']
+        form = template.form_base()
+    
+    with profiler.stage("fields"):
+        portrait = _portrait_for(template.index, field_data, portraits)
+        update, placed_by_page = _fill_form_update(form, fields, field_data, flatten,
+                                                   portrait[::2] if portrait else None,
+                                                   text_font if isinstance(text_font, EmbeddedFont) else None)
+        if field_data.get(SPELL_PAGES_FIELD):
+            # Le continuazioni non hanno widget: il testo è disegnato come nell'overlay
+            overlay_pages, _ = _draw_overlay(template.index, field_data, pages=(), text_font=text_font)
+            _append_spell_pages(update, form, spell_page(template.index, field_data), overlay_pages, {})
+    profiler.set('fields_per_page', [len(placed_by_page.get(i, ())) for i in range(len(form.pages))])
+    
+    with profiler.stage("write"):
+        with _open_output(output_path) as output_file:
+            update.write(output_file)
+    profiler.set('bytes_written', _output_size(output_path))
+
+def _fill_form_update(form, fields, field_data, flatten, portrait=None, text_font=None):
+    """Prepara l'aggiornamento incrementale con i campi compilati
+
+    portrait è la coppia (nome del pulsante, Portrait) del ritratto, se c'è;
+    text_font l'eventuale EmbeddedFont al posto della Helvetica del modulo.
+    """
+    update = _PdfUpdate(form)
+    placed_by_page = {}
+    if portrait is not None:
+        # Widget sovrapposti dello stesso pulsante: un solo aspetto condiviso
+        portrait_name, portrait = portrait
+        entries = form.images.get(portrait_name, [])
+        if entries:
+            appearance_ref = update.add(_image_field_appearance(update, entries[0]['dict'], portrait))
+            for entry in entries:
+                widget = DictionaryObject(entry['dict'])
+                widget[NameObject("/Parent")] = entry['parent']
+                widget[NameObject("/AP")] = DictionaryObject({NameObject("/N"): appearance_ref})
+                update.replace(entry['ref'], widget)
+            placed_by_page.setdefault(entries[0]['page'], []).append((entries[0]['dict'], appearance_ref))
+    for field_name, text in field_data.items():
+        entry = form.widgets.get(field_name)
+        if entry is None:
+            continue
+        # Solo i campi compilati ricevono valore e nuovo aspetto
+        widget = DictionaryObject(entry['dict'])
+        if 'on_state' in entry:
+            widget[NameObject("/V")] = NameObject(entry['on_state'])
+            widget[NameObject("/AS")] = NameObject(entry['on_state'])
+            appearance_ref = entry['on_appearance']
+        else:
+            field = fields[field_name]
+            appearance = _text_field_appearance(widget, text, field['font_size'], form.font_ref,
+                                                field.get('multiline', False), update, text_font)
+            appearance_ref = update.add(appearance)
+            widget[NameObject("/V")] = TextStringObject(text)
+            widget[NameObject("/AP")] = DictionaryObject({NameObject("/N"): appearance_ref})
+        update.replace(entry['ref'], widget)
+        placed_by_page.setdefault(entry['page'], []).append((widget, appearance_ref))
+    
+    if flatten:
+        # Le pagine non referenziano più i widget e il catalogo perde l'AcroForm
+        for page_num, page in enumerate(form.pages):
+            _flatten_form_page(update, page, page_num, placed_by_page.get(page_num, []))
+        root = DictionaryObject(form.root)
+        del root["/AcroForm"]
+        update.replace(form.root_ref, root)
+    return update, placed_by_page
+
+def render_plan(index, field_data):
+    """Pagine del template su cui c'è qualcosa da disegnare, in ordine
+
+    Le altre pagine vengono copiate così come sono, senza overlay né merge.
+    """
+    fields = index['fields']
+    pages = {fields[field_name]['page'] for field_name in field_data if field_name in fields}
+    image_name = _portrait_field(index, field_data)
+    if image_name is not None:
+        pages.add(index['images'][image_name]['page'])
+    return sorted(pages)
+
+def spell_page(index, field_data):
+    """Pagina del template con i riquadri degli incantesimi, clonata per le continuazioni
+
+    È la pagina dei campi scritti sulla prima continuazione: il nome dei
+    campi dipende dal profilo del template.
+    """
+    fields = index['fields']
+    for continuation in field_data.get(SPELL_PAGES_FIELD) or ():
+        for field_name in continuation:
+            if field_name in fields:
+                return fields[field_name]['page']
+    return None
+
+class OverlayPage:
+    """Pagina dell'overlay ancora in memoria: operatori di disegno e font usati
+
+    Gli operatori finiscono direttamente negli stream dell'aggiornamento
+    (o del bundle), senza passare da un PDF intermedio da rileggere.
+    """
+
+    __slots__ = ('content', 'fonts')
+
+    def __init__(self):
+        self.content = bytearray()
+        self.fonts = {}
+
+    def draw_text(self, x, y, text, text_font, font_size):
+        """Scrive il testo con il font del testo indicato (StandardFont o EmbeddedFont)"""
+        self.content += b"BT 1 0 0 1 %.3f %.3f Tm" % (x, y)
+        for resource_name, encoded in text_font.encode(text):
+            self.fonts[resource_name] = text_font
+            self.content += b" %s %.2f Tf (%s) Tj" % (resource_name.encode('ascii'), font_size, _escape_pdf_string(encoded))
+        self.content += b" ET\n"
+
+_PDF_STRING_SPECIAL = re.compile(rb'[^ -~]|[()\\]')
+
+def _escape_pdf_string(data):
+    """Stringa letterale PDF: parentesi e barre escapate, byte non stampabili in ottale"""
+    return _PDF_STRING_SPECIAL.sub(lambda match: b"\\%03o" % match.group()[0], data)
+
+class PdfFont:
+    """Oggetti PDF di un font del testo, preparati una volta e riusati da tutti i PDF
+
+    I font standard sono il solo dizionario; quelli incorporati hanno anche
+    descrittore, programma del font e CMap ToUnicode, già compressi.
+    """
+
+    __slots__ = ('font', 'descriptor', 'font_file', 'to_unicode')
+
+    def __init__(self, font, descriptor=None, font_file=None, to_unicode=None):
+        self.font = font
+        self.descriptor = descriptor
+        self.font_file = font_file
+        self.to_unicode = to_unicode
+
+    def font_dict(self, add):
+        """Dizionario del font per un PDF: add aggiunge al PDF gli oggetti a cui rimanda"""
+        font = DictionaryObject(self.font)
+        if self.descriptor is not None:
+            descriptor = DictionaryObject(self.descriptor)
+            descriptor[NameObject("/FontFile2")] = add(self.font_file)
+            font[NameObject("/FontDescriptor")] = add(descriptor)
+            font[NameObject("/ToUnicode")] = add(self.to_unicode)
+        return font
+
+class StandardFont:
+    """Font standard PDF del testo, non incorporato
+
+    I glifi che non ha (✓, simboli...) passano ai font di sostituzione di
+    ReportLab. Il nome delle risorse è lo stesso in tutte le schede.
+    """
+
+    def __init__(self, font_name):
+        self.name = font_name
+        font = getFont(font_name)
+        self._fonts = [font] + list(font.substitutionFonts)
+        self._resources = {}
+        self._pdf_fonts = {}
+        for i, standard_font in enumerate(self._fonts, 1):
+            font_dict = DictionaryObject({
+                NameObject("/Type"): NameObject("/Font"),
+                NameObject("/Subtype"): NameObject("/Type1"),
+                NameObject("/BaseFont"): NameObject("/" + standard_font.face.name),
+            })
+            if standard_font.encName == "WinAnsiEncoding":
+                # Symbol e ZapfDingbats usano la codifica incorporata nel font
+                font_dict[NameObject("/Encoding")] = NameObject("/WinAnsiEncoding")
+            self._resources[standard_font.fontName] = f"/Ov{i}"
+            self._pdf_fonts[f"/Ov{i}"] = PdfFont(font_dict)
+
+    def encode(self, text):
+        """Divide il testo in tratti dello stesso font: [(risorsa, byte)]"""
+        return [(self._resources[font.fontName], encoded) for font, encoded in unicode2T1(text, self._fonts)]
+
+    def pdf_font(self, resource_name):
+        return self._pdf_fonts[resource_name]
+
+# Caratteri che ricevono un codice appena il font incorporato viene caricato,
+# insieme all'ASCII: accentate italiane e simboli delle schede. Gli altri
+# si aggiungono al primo uso; tenerli fuori dal sottoinsieme iniziale
+# risparmia qualche KB in ogni scheda
+EMBEDDED_BASE_CHARS = "àèéìíòóùúÀÈÉÌÒÙ✓•‘’“”–—…€«»°"
+EMBEDDED_SUBSET_SIZE = 256
+
+class EmbeddedFont:
+    """Font TrueType incorporato nei PDF a sottoinsiemi di al massimo 256 glifi
+
+    Il file viene letto una volta per processo e ogni carattere riceve un
+    codice (sottoinsieme, byte) che non cambia più, così tutte le schede di
+    un batch o di un bundle usano gli stessi sottoinsiemi. Il programma di
+    un sottoinsieme viene estratto e compresso una volta sola, e rifatto
+    solo se nel frattempo gli si sono aggiunti caratteri.
+    """
+
+    def __init__(self, path):
+        self.name = str(path)
+        font = TTFont(self.name, path)
+        # Registrato per stringWidth: adattamento e allineamento misurano questo font
+        registerFont(font)
+        self.face = font.face
+        self._lock = threading.Lock()
+        self._subsets = [list(range(128))]
+        self._codes = {chr(code): (0, code) for code in range(128)}
+        self._pdf_fonts = {}
+        self._assign(EMBEDDED_BASE_CHARS)
+        # Lo spazio non separabile usa il glifo dello spazio
+        self._codes["\xa0"] = self._codes[" "]
+
+    def _assign(self, chars):
+        """Dà un codice ai caratteri che non lo hanno ancora (con il lock preso)"""
+        for char in chars:
+            if char in self._codes:
+                continue
+            if len(self._subsets[-1]) == EMBEDDED_SUBSET_SIZE:
+                self._subsets.append([])
+            self._subsets[-1].append(ord(char))
+            self._codes[char] = (len(self._subsets) - 1, len(self._subsets[-1]) - 1)
+
+    def encode(self, text):
+        """Divide il testo in tratti dello stesso sottoinsieme: [(risorsa, byte)]"""
+        codes = self._codes
+        if not all(char in codes for char in text):
+            with self._lock:
+                self._assign(text)
+        runs = []
+        current, encoded = None, bytearray()
+        for char in text:
+            subset, code = codes[char]
+            if subset != current:
+                if encoded:
+                    runs.append((f"/OvE{current}", bytes(encoded)))
+                current, encoded = subset, bytearray()
+            encoded.append(code)
+        if encoded:
+            runs.append((f"/OvE{current}", bytes(encoded)))
+        return runs
+
+    def pdf_font(self, resource_name):
+        """Oggetti PDF del sottoinsieme della risorsa, con tutti i caratteri assegnati finora"""
+        n = int(resource_name[len("/OvE"):])
+        with self._lock:
+            subset = self._subsets[n]
+            cached = self._pdf_fonts.get(n)
+            if cached is None or cached[0] != len(subset):
+                cached = (len(subset), self._make_pdf_font(n, list(subset)))
+                self._pdf_fonts[n] = cached
+        return cached[1]
+
+    def _make_pdf_font(self, n, subset):
+        face = self.face
+        base_font = "%s+%s" % (SUBSETN(n).decode('ascii'), face.name.decode('latin-1'))
+        font_file = DecodedStreamObject()
+        font_file.set_data(face.makeSubset(subset))
+        font_file[NameObject("/Length1")] = NumberObject(len(font_file.get_data()))
+        to_unicode = DecodedStreamObject()
+        to_unicode.set_data(makeToUnicodeCMap(base_font, subset).encode('ascii'))
+        descriptor = DictionaryObject({
+            NameObject("/Type"): NameObject("/FontDescriptor"),
+            NameObject("/Ascent"): FloatObject(face.ascent),
+            NameObject("/CapHeight"): FloatObject(face.capHeight),
+            NameObject("/Descent"): FloatObject(face.descent),
+            # Codici propri del sottoinsieme, non una codifica standard
+            NameObject("/Flags"): NumberObject(face.flags & ~FF_NONSYMBOLIC | FF_SYMBOLIC),
+            NameObject("/FontBBox"): ArrayObject(FloatObject(v) for v in face.bbox),
+            NameObject("/FontName"): NameObject("/" + base_font),
+            NameObject("/ItalicAngle"): FloatObject(face.italicAngle),
+            NameObject("/StemV"): NumberObject(face.stemV),
+        })
+        font = DictionaryObject({
+            NameObject("/Type"): NameObject("/Font"),
+            NameObject("/Subtype"): NameObject("/TrueType"),
+            NameObject("/BaseFont"): NameObject("/" + base_font),
+            NameObject("/FirstChar"): NumberObject(0),
+            NameObject("/LastChar"): NumberObject(len(subset) - 1),
+            NameObject("/Widths"): ArrayObject(FloatObject(face.getCharWidth(code)) for code in subset),
+        })
+        return PdfFont(font, descriptor, font_file.flate_encode(), to_unicode.flate_encode())
+
+_text_fonts = {}
+_text_fonts_lock = threading.Lock()
+
+def get_text_font(font=None):
+    """Font del testo delle schede, caricato una volta per processo
+
+    font è None o "helvetica" per il font standard, il nome di un font
+    incluso (TEXT_FONTS) o il percorso di un file .ttf.
+    """
+    path = resolve_font(font)
+    key = path.resolve() if path is not None else None
+    with _text_fonts_lock:
+        text_font = _text_fonts.get(key)
+        if text_font is None:
+            text_font = StandardFont(AUTOFIT_FONT) if key is None else EmbeddedFont(key)
+            _text_fonts[key] = text_font
+    return text_font
+
+class _FontRefs:
+    """Riferimenti ai font del testo di un PDF, con i dizionari scritti alla fine
+
+    Il riferimento di ogni risorsa viene riservato al primo uso; i
+    dizionari arrivano con finish(), quando i sottoinsiemi dei font
+    incorporati contengono già tutti i caratteri disegnati nel PDF.
+    """
+
+    def __init__(self, add, replace):
+        self._add = add
+        self._replace = replace
+        self._refs = {}
+        self._pending = []
+
+    def ref(self, resource_name, text_font):
+        ref = self._refs.get(resource_name)
+        if ref is None:
+            ref = self._refs[resource_name] = self._add(DictionaryObject())
+            self._pending.append((ref, resource_name, text_font))
+        return ref
+
+    def finish(self):
+        for ref, resource_name, text_font in self._pending:
+            self._replace(ref, text_font.pdf_font(resource_name).font_dict(self._add))
+        self._pending = []
+
+def _draw_fields(page, page_fields, text_font):
+    """Disegna su una OverlayPage i campi di una pagina: (nome, geometria, testo)"""
+    for field_name, field, text_to_draw in page_fields:
+        x1, y1, x2, y2 = field['rect']
+        
+        # Calcola altezza e larghezza
+        width = x2 - x1
+        height = y2 - y1
+        font_size = field['font_size']
+        
+        # Posiziona il testo
+        if field_name.startswith("Check Box"):
+            # Per i checkbox, disegna un pallino pieno centrato
+            bullet_width = text_width("•", text_font.name) * 12  # Dimensione fissa per il pallino
+            text_x = x1 + (width - bullet_width) / 2
+            text_y = y1 + (height - 12) / 2 + 2 # Aggiustamento verticale
+            page.draw_text(text_x, text_y, "•", text_font, 12)
+        else:
+            # Per i campi di testo: corpo ridotto o a capo finché il testo entra
+            font_size, lines = fit_text(text_to_draw, width, height, font_size, field.get('multiline', False),
+                                        text_font.name)
+            for text_x, text_y, line in _layout_lines(width, height, font_size, lines, font_name=text_font.name):
+                page.draw_text(x1 + text_x, y1 + text_y, line, text_font, font_size)
+
+def _draw_overlay(index, field_data, pages=None, text_font=None):
+    """Disegna i testi delle pagine, restituendo le OverlayPage con i campi disegnati per pagina
+
+    Con pages ci sono solo le pagine indicate (vedi render_plan), nell'ordine dato.
+    In coda seguono sempre le pagine di continuazione degli incantesimi.
+    text_font è il font del testo (predefinito: Helvetica standard).
+    """
+    text_font = text_font or get_text_font()
+    # Le coordinate dei campi arrivano dall'indice precompilato del template
+    fields = index['fields']  # in ordine di annotazione, come nel template
+    fields_by_page = [[] for _ in range(index['page_count'])]
+    for field_name, field in fields.items():
+        if field_name in field_data:
+            fields_by_page[field['page']].append((field_name, field, field_data[field_name]))
+    
+    overlay_pages = []
+    for page_num in (range(index['page_count']) if pages is None else pages):
+        page = OverlayPage()
+        _draw_fields(page, fields_by_page[page_num], text_font)
+        overlay_pages.append(page)
+    
+    fields_per_page = [len(page_fields) for page_fields in fields_by_page]
+    for page_data in field_data.get(SPELL_PAGES_FIELD, ()):
+        page_fields = [(field_name, fields[field_name], text) for field_name, text in page_data.items()
+                       if field_name in fields]
+        page = OverlayPage()
+        _draw_fields(page, page_fields, text_font)
+        overlay_pages.append(page)
+        fields_per_page.append(len(page_fields))
+    
+    return overlay_pages, fields_per_page
+
+def _overlay_page(update, page, overlay_page, shared):
+    """Copia della pagina base con lo stream dell'overlay sopra il contenuto del template
+
+    shared contiene gli stream q/Q già aggiunti all'aggiornamento, riusati
+    da tutte le pagine; anche i font sono un oggetto solo (update.fonts).
+    """
+    if not shared:
+        for name, data in (('save', b"q\n"), ('restore', b"Q\n")):
+            stream = DecodedStreamObject()
+            stream.set_data(data)
+            shared[name] = update.add(stream)
+    fonts = DictionaryObject(page['fonts'])
+    for name, text_font in overlay_page.fonts.items():
+        fonts[NameObject(name)] = update.fonts.ref(name, text_font)
+    resources = DictionaryObject(page['resources'])
+    resources[NameObject("/Font")] = fonts
+    
+    # Lo stream dell'overlay viene compresso una volta, direttamente dagli operatori
+    overlay_content = DecodedStreamObject()
+    overlay_content.set_data(bytes(overlay_page.content))
+    contents = [shared['save']] + _content_refs(page['dict'].raw_get("/Contents")) + [shared['restore']]
+    contents.append(update.add(overlay_content.flate_encode()))
+    new_page = DictionaryObject(page['dict'])
+    new_page[NameObject("/Resources")] = resources
+    new_page[NameObject("/Contents")] = ArrayObject(contents)
+    return new_page
+
+def _append_spell_pages(update, base, page_num, overlay_pages, shared):
+    """Accoda le pagine di continuazione come cloni della pagina incantesimi vuota
+
+    Ogni clone è un piccolo dizionario che riusa contenuto e risorse già
+    serializzati nella base: l'unico stream nuovo è quello dell'overlay.
+    """
+    if not overlay_pages:
+        return
+    kids = ArrayObject(base.pages_tree["/Kids"])
+    for overlay_page in overlay_pages:
+        new_page = _overlay_page(update, base.pages[page_num], overlay_page, shared)
+        if "/Annots" in new_page:
+            # Nessun widget: i campi del modulo restano solo sulla pagina originale
+            del new_page["/Annots"]
+        kids.append(update.add(new_page))
+    pages_tree = DictionaryObject(base.pages_tree)
+    pages_tree[NameObject("/Kids")] = kids
+    pages_tree[NameObject("/Count")] = NumberObject(len(kids))
+    update.replace(base.pages_ref, pages_tree)
+
+def _overlay_update(base, overlay_pages, pages, portrait=None, spell_page_num=None):
+    """Aggiornamento incrementale che sovrappone l'overlay alle sole pagine del piano"""
+    update = _PdfUpdate(base)
+    shared = {}
+    for page_num, overlay_page in zip(pages, overlay_pages):
+        page = base.pages[page_num]
+        new_page = _overlay_page(update, page, overlay_page, shared)
+        if portrait is not None and portrait[0]['page'] == page_num:
+            field, image = portrait
+            xobjects = DictionaryObject(page['xobjects'])
+            xobjects[NameObject("/Portrait")] = update.add(image.xobject())
+            new_page["/Resources"][NameObject("/XObject")] = xobjects
+            portrait_content = DecodedStreamObject()
+            portrait_content.set_data(_portrait_operations(image, field['rect']))
+            new_page["/Contents"].append(update.add(portrait_content))
+        update.replace(page['ref'], new_page)
+    _append_spell_pages(update, base, spell_page_num, overlay_pages[len(pages):], shared)
+    return update
+
+def fill_pdf(template_path, output_path, field_data, engine="overlay", flatten=False, profiler=None,
+             portraits=None, font=None):
+    """Compila il PDF sovrapponendo il testo alle coordinate dei campi
+
+    Con engine="acroform" i valori vengono invece scritti nei campi del modulo
+    (vedi fill_form_fields); flatten li rende non modificabili. output_path
+    può essere anche uno stream binario aperto. portraits è la PortraitCache
+    da usare (vedi get_portrait_cache; predefinita: solo in memoria). font è il font del
+    testo (vedi get_text_font): il predefinito è Helvetica, non incorporata.
+    """
+    if engine == "acroform":
+        return fill_form_fields(template_path, output_path, field_data, flatten=flatten, profiler=profiler,
+                                portraits=portraits, font=font)
+    if engine != "overlay":
+        raise ValueError(f"Motore di compilazione sconosciuto: {engine}")
+    profiler = profiler or NULL_PROFILER
+    
+    with profiler.stage("template"):
+        template = template_cache.get(template_path)
+        index = template.index
+        base = template.overlay_base()
+        text_font = get_text_font(font)
+    
+    # 1. Prepara gli operatori dei testi, solo per le pagine che ne hanno
+    pages = render_plan(index, field_data)
+    with profiler.stage("draw"):
+        overlay_pages, fields_per_page = _draw_overlay(index, field_data, pages, text_font)
+    
+    # 2. Sovrappone l'overlay alle pagine del piano: le altre restano i byte
+    # già serializzati del template, che non ha più campi form né AcroForm
+    with profiler.stage("merge"):
+        portrait = _portrait_for(index, field_data, portraits)
+        update = _overlay_update(base, overlay_pages, pages, portrait[1:] if portrait else None,
+                                 spell_page(index, field_data))
+    
+    # Salva il risultato
+    with profiler.stage("write"):
+        with _open_output(output_path) as output_file:
+            update.write(output_file)
+    
+    profiler.set('fields_per_page', fields_per_page)
+    profiler.set('pages_drawn', len(pages))
+    profiler.set('bytes_written', _output_size(output_path))
+
+class PartyBundle:
+    """PDF unico con le schede di più personaggi, per stampare un intero party
+
+    Contenuto, font, immagini e miniature del template vengono copiati una
+    sola volta e tutte le pagine li usano per riferimento; di ogni scheda
+    resta separato solo lo stream compresso dell'overlay. Anche i font del
+    testo sono un oggetto solo per bundle: un font incorporato viene scritto
+    alla fine, con un sottoinsieme che serve tutte le schede.
+    """
+
+    def __init__(self, template_path, font=None, portraits=None):
+        template = template_cache.get(template_path)
+        self.index = template.index
+        self.text_font = get_text_font(font)
+        self.portraits = portraits
+        self.writer = PdfWriter()
+        self.sheet_count = 0
+        self._fonts = _FontRefs(self.writer._add_object, self.writer._replace_object)
+        self._page_resources = {}
+        self._portraits = {}
+        
+        # Apre il q/Q che isola il contenuto del template da quello dell'overlay
+        self._save_state = self._add_stream(b"q\n")
+        self._template_pages = []
+        for page in template._static_pages.pages:
+            content = DecodedStreamObject()
+            content.set_data(page.get_contents().get_data())
+            items = {
+                NameObject(key): value.clone(self.writer)
+                for key, value in page.items()
+                if key not in ("/Contents", "/Resources", "/Parent")
+            }
+            self._template_pages.append({
+                'items': items,
+                'content': self.writer._add_object(content.flate_encode()),
+                'resources': page['/Resources'].clone(self.writer),
+            })
+
+    def _add_stream(self, data):
+        stream = DecodedStreamObject()
+        stream.set_data(data)
+        return self.writer._add_object(stream.flate_encode())
+
+    def _resources_for(self, page_num, fonts):
+        """Risorse del template unite ai font dell'overlay, condivise tra le schede uguali"""
+        overlay_fonts = tuple(sorted(
+            (name, self._fonts.ref(name, text_font)) for name, text_font in fonts.items()
+        ))
+        key = (page_num, tuple(name for name, _ in overlay_fonts))
+        ref = self._page_resources.get(key)
+        if ref is None:
+            resources = DictionaryObject(self._template_pages[page_num]['resources'])
+            merged_fonts = DictionaryObject(resources.get("/Font", DictionaryObject()).get_object())
+            for name, font_ref in overlay_fonts:
+                merged_fonts[NameObject(name)] = font_ref
+            resources[NameObject("/Font")] = merged_fonts
+            ref = self.writer._add_object(resources)
+            self._page_resources[key] = ref
+        return ref
+
+    def _with_portrait(self, resources_ref, portrait):
+        """Risorse della pagina con il ritratto, incorporato una volta sola per bundle"""
+        image_ref = self._portraits.get(portrait.key)
+        if image_ref is None:
+            image_ref = self.writer._add_object(portrait.xobject())
+            self._portraits[portrait.key] = image_ref
+        resources = DictionaryObject(resources_ref.get_object())
+        xobjects = DictionaryObject(resources.get("/XObject", DictionaryObject()).get_object())
+        xobjects[NameObject("/Portrait")] = image_ref
+        resources[NameObject("/XObject")] = xobjects
+        return self.writer._add_object(resources)
+
+    def add_sheet(self, field_data, title=None):
+        """Aggiunge al bundle le pagine di una scheda compilata"""
+        overlay_pages, _ = _draw_overlay(self.index, field_data, text_font=self.text_font)
+        portrait = _portrait_for(self.index, field_data, self.portraits)
+        first_page = len(self.writer.pages)
+        # Dopo le pagine del template, le continuazioni clonano la pagina incantesimi
+        page_nums = list(range(len(self._template_pages)))
+        page_nums += [spell_page(self.index, field_data)] * (len(overlay_pages) - len(page_nums))
+        for i, (page_num, overlay_page) in enumerate(zip(page_nums, overlay_pages)):
+            template_page = self._template_pages[page_num]
+            overlay_content = self._add_stream(b"Q\n" + bytes(overlay_page.content))
+            resources = self._resources_for(page_num, overlay_page.fonts)
+            contents = [self._save_state, template_page['content'], overlay_content]
+            if portrait is not None and portrait[1]['page'] == i:
+                resources = self._with_portrait(resources, portrait[2])
+                contents.append(self._add_stream(_portrait_operations(portrait[2], portrait[1]['rect'])))
+            page = PageObject(self.writer)
+            page.update(template_page['items'])
+            page[NameObject("/Resources")] = resources
+            page[NameObject("/Contents")] = ArrayObject(contents)
+            self.writer.add_page(page)
+        if title:
+            self.writer.add_outline_item(title, first_page)
+        self.sheet_count += 1
+
+    def write(self, output_path):
+        self._fonts.finish()
+        with _open_output(output_path) as output_file:
+            self.writer.write(output_file)
+
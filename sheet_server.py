@@ -0,0 +1,235 @@
+"""Modalità `serve`: server HTTP locale che compila le schede su richiesta
+
+Caricato da fill_dnd_sheet solo con `fill_dnd_sheet.py serve`.
+"""
+import argparse
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from fill_dnd_sheet import (
+    DEFAULT_FONT, FILL_ENGINES, TEXT_FONTS, _init_batch_worker, render_cah_bytes, resolve_template,
+)
+
+# Server HTTP locale: limiti predefiniti di `serve`
+SERVE_MAX_BODY = 16 * 1024 * 1024
+SERVE_LATENCY_WINDOW = 1024
+SERVE_PERCENTILES = (50, 90, 95, 99)
+
+def _percentiles(samples):
+    """Percentili (nearest rank) di una serie di durate in secondi, restituiti in ms"""
+    ordered = sorted(samples)
+    if not ordered:
+        return {f"p{p}": None for p in SERVE_PERCENTILES}
+    return {f"p{p}": round(ordered[max(0, -(-p * len(ordered) // 100) - 1)] * 1000, 2)
+            for p in SERVE_PERCENTILES}
+
+class RenderMetrics:
+    """Contatori e latenze delle richieste del server, condivisi tra i thread"""
+
+    def __init__(self, window=SERVE_LATENCY_WINDOW):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.requests = 0
+        self.by_status = {}
+        self.in_flight = 0
+        self.rejected = 0
+        # Solo le ultime richieste: i percentili seguono il carico attuale
+        self._latency = deque(maxlen=window)
+        self._render = deque(maxlen=window)
+
+    def begin(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def end(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def record(self, status, elapsed, render_elapsed=None):
+        with self._lock:
+            self.requests += 1
+            self.by_status[status] = self.by_status.get(status, 0) + 1
+            if status == 503:
+                self.rejected += 1
+            self._latency.append(elapsed)
+            if render_elapsed is not None:
+                self._render.append(render_elapsed)
+
+    def snapshot(self):
+        with self._lock:
+            latency = list(self._latency)
+            render = list(self._render)
+            return {
+                'uptime_s': round(time.time() - self.started, 1),
+                'requests': self.requests,
+                'by_status': {str(status): count for status, count in sorted(self.by_status.items())},
+                'in_flight': self.in_flight,
+                'rejected': self.rejected,
+                'latency_ms': dict(_percentiles(latency), samples=len(latency)),
+                'render_ms': dict(_percentiles(render), samples=len(render)),
+            }
+
+def _init_server_worker(template_path):
+    """Worker del server: Ctrl+C lo gestisce solo il processo principale
+
+    Come render, il server non scrive l'indice del template su disco.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _init_batch_worker(template_path, persist=False)
+
+class RenderServer(ThreadingHTTPServer):
+    """Server HTTP che compila le schede in un pool di processi di dimensione fissa
+
+    Oltre ai render in corso ne accetta al massimo queue_limit in attesa: le
+    richieste successive ricevono subito 503 invece di accumularsi.
+    """
+    daemon_threads = True
+
+    def __init__(self, address, workers=1, queue_limit=8, max_body=SERVE_MAX_BODY):
+        super().__init__(address, RenderRequestHandler)
+        template_pdf = resolve_template()
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.max_body = max_body
+        self.metrics = RenderMetrics()
+        self._slots = threading.BoundedSemaphore(workers + queue_limit)
+        self.executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_server_worker,
+                                            initargs=(str(template_pdf),))
+
+    def render(self, data, engine, flatten, font=None):
+        """Compila nel pool, o restituisce None se pool e coda sono pieni"""
+        if not self._slots.acquire(blocking=False):
+            return None
+        try:
+            return self.executor.submit(render_cah_bytes, data, engine, flatten, None, font).result()
+        finally:
+            self._slots.release()
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=False)
+
+class RenderRequestHandler(BaseHTTPRequestHandler):
+    """POST /render con il file .cah nel corpo, GET /metrics e GET /health"""
+    server_version = "DndSheetServer/1"
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == "/metrics":
+            self._send_json(200, self.server.metrics.snapshot())
+        elif path == "/health":
+            self._send_json(200, {'status': 'ok'})
+        else:
+            self._send_json(404, {'error': f"Percorso sconosciuto: {path}"})
+
+    def do_POST(self):
+        start = time.perf_counter()
+        self.server.metrics.begin()
+        try:
+            status, render_elapsed = self._handle_render()
+        finally:
+            self.server.metrics.end()
+        self.server.metrics.record(status, time.perf_counter() - start, render_elapsed)
+
+    def _handle_render(self):
+        url = urlsplit(self.path)
+        if url.path != "/render":
+            return self._send_json(404, {'error': f"Percorso sconosciuto: {url.path}"}), None
+        length = self.headers.get('Content-Length')
+        if length is None:
+            return self._send_json(411, {'error': "Content-Length mancante"}), None
+        try:
+            length = int(length)
+        except ValueError:
+            return self._send_json(400, {'error': "Content-Length non valido"}), None
+        if length < 0:
+            self.close_connection = True
+            return self._send_json(400, {'error': "Content-Length non valido"}), None
+        if length > self.server.max_body:
+            self.close_connection = True
+            return self._send_json(413, {'error': f"File oltre {self.server.max_body} byte"}), None
+        data = self.rfile.read(length)
+
+        # Il corpo viene letto prima di rispondere, anche con un errore: il
+        # client che sta ancora inviando il .cah non riceve un broken pipe
+        query = parse_qs(url.query)
+        engine = query.get('engine', [FILL_ENGINES[0]])[-1]
+        flatten = query.get('flatten', ['0'])[-1].lower() in ("1", "true", "yes")
+        # Solo i font inclusi: il client non sceglie file sul server
+        font = query.get('font', [DEFAULT_FONT])[-1]
+        if engine not in FILL_ENGINES:
+            return self._send_json(400, {'error': f"Motore sconosciuto: {engine}"}), None
+        if font not in TEXT_FONTS:
+            return self._send_json(400, {'error': f"Font sconosciuto: {font}"}), None
+
+        render_start = time.perf_counter()
+        try:
+            pdf = self.server.render(data, engine, flatten, font)
+        except ValueError as e:
+            return self._send_json(400, {'error': str(e)}), None
+        except Exception as e:
+            return self._send_json(500, {'error': str(e)}), None
+        if pdf is None:
+            self.send_response(503)
+            self.send_header('Retry-After', '1')
+            return self._send_json(503, {'error': "Server occupato, riprova"}, started=True), None
+        render_elapsed = time.perf_counter() - render_start
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/pdf')
+        self.send_header('Content-Length', str(len(pdf)))
+        self.end_headers()
+        self.wfile.write(pdf)
+        return 200, render_elapsed
+
+    def _send_json(self, status, payload, started=False):
+        body = json.dumps(payload).encode('utf-8')
+        if not started:
+            self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        return status
+
+    def log_message(self, format, *args):
+        # Una riga per richiesta su stderr, senza la data del modulo http.server
+        print(f"{self.address_string()} {format % args}", file=sys.stderr)
+
+def serve_main(argv):
+    """Entry point di `fill_dnd_sheet.py serve`"""
+    parser = argparse.ArgumentParser(prog="fill_dnd_sheet.py serve",
+                                     description="Server HTTP locale che compila schede da file .cah")
+    parser.add_argument("--host", default="127.0.0.1", help="indirizzo di ascolto")
+    parser.add_argument("--port", type=int, default=8765, help="porta di ascolto")
+    parser.add_argument("-j", "--workers", type=int, default=0,
+                        help="processi che compilano le schede (0 = tutti i core)")
+    parser.add_argument("--queue", type=int, default=8,
+                        help="richieste in attesa oltre ai render in corso, poi 503")
+    args = parser.parse_args(argv)
+    workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+
+    template_pdf = resolve_template()
+    if not template_pdf.exists():
+        print(f"Errore: Template PDF non trovato: {template_pdf}")
+        return
+
+    server = RenderServer((args.host, args.port), workers, max(args.queue, 0))
+    host, port = server.server_address[:2]
+    print(f"In ascolto su http://{host}:{port} ({workers} processi, coda {args.queue}) "
+          f"- POST /render, GET /metrics (Ctrl+C per terminare)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Server terminato.")
+    finally:
+        server.server_close()
+
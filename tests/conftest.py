@@ -0,0 +1,22 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# I moduli stanno nella radice del repository, senza pacchetto da installare
+REPO_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_DIR))
+
+@pytest.fixture
+def repo_dir():
+    return REPO_DIR
+
+@pytest.fixture
+def sample_cah_files():
+    """I personaggi di esempio in input/"""
+    return sorted((REPO_DIR / "input").glob("*.cah"))
+
+@pytest.fixture
+def template_pdf():
+    """Il template incluso"""
+    return REPO_DIR / "5E_CharacterSheet_Fillable.pdf"
@@ -0,0 +1,41 @@
+"""Motore acroform: valori nei campi del modulo e flatten"""
+import io
+
+import pytest
+from pypdf import PdfReader
+
+import sheet_render
+from fill_dnd_sheet import extract_character_info, load_character_data
+
+@pytest.fixture
+def field_data(sample_cah_files):
+    path = next(path for path in sample_cah_files if path.stem == "Arkan")
+    return extract_character_info(load_character_data(path))
+
+def render(template_pdf, field_data, **options):
+    output = io.BytesIO()
+    sheet_render.fill_pdf(template_pdf, output, field_data, engine="acroform", **options)
+    return PdfReader(io.BytesIO(output.getvalue()))
+
+def test_values_are_written_into_the_form(template_pdf, field_data):
+    reader = render(template_pdf, field_data)
+    fields = reader.get_fields()
+    assert "/AcroForm" in reader.trailer["/Root"]
+    for name in ('CharacterName', 'XP', 'ClassLevel', 'SlotsTotal 19'):
+        assert fields[name].get('/V') == field_data[name]
+    # Ogni campo compilato ha un aspetto proprio: si vede anche senza NeedAppearances
+    widget = next(annot.get_object() for annot in reader.pages[0]["/Annots"]
+                  if annot.get_object().get("/T") == "CharacterName")
+    assert "/AP" in widget
+
+def test_flatten_removes_the_form(template_pdf, field_data):
+    reader = render(template_pdf, field_data, flatten=True)
+    assert "/AcroForm" not in reader.trailer["/Root"]
+    for page in reader.pages:
+        widgets = [annot for annot in page.get("/Annots", ()) if annot.get_object().get("/Subtype") == "/Widget"]
+        assert not widgets
+    assert field_data['CharacterName'] in reader.pages[0].extract_text()
+
+def test_unknown_engine_is_rejected(template_pdf, field_data):
+    with pytest.raises(ValueError):
+        sheet_render.fill_pdf(template_pdf, io.BytesIO(), field_data, engine="nope")
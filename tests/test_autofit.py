@@ -0,0 +1,42 @@
+"""Auto-adattamento del testo ai campi"""
+from reportlab.pdfbase.pdfmetrics import stringWidth
+
+from sheet_render import AUTOFIT_LEADING, AUTOFIT_MIN_SIZE, AUTOFIT_PADDING, fit_text, text_width
+
+def test_text_width_matches_reportlab():
+    for text in ("Arkan", "Élodie l'Ardita", "Incantesimi ✓"):
+        assert abs(text_width(text) - stringWidth(text, "Helvetica", 1)) < 1e-9
+
+def test_short_text_keeps_size():
+    assert fit_text("Mago 5", 100, 14, 10) == (10, ("Mago 5",))
+
+def test_long_single_line_shrinks_to_fit():
+    text = "Guerriero 3 / Ladro 2 / Chierico 1"
+    size, lines = fit_text(text, 80, 14, 10)
+    assert lines == (text,)
+    assert AUTOFIT_MIN_SIZE < size < 10
+    assert text_width(text) * size <= 80 - 2 * AUTOFIT_PADDING
+
+def test_single_line_never_below_minimum():
+    size, _ = fit_text("x" * 500, 40, 14, 10)
+    assert size == AUTOFIT_MIN_SIZE
+
+def test_multiline_wraps_within_width_and_height():
+    text = " ".join(["Competenza nelle armature leggere e medie, negli scudi"] * 6)
+    width, height = 150, 120
+    size, lines = fit_text(text, width, height, 10, multiline=True)
+    assert len(lines) > 1
+    assert " ".join(lines) == text
+    assert all(text_width(line) * size <= width - 2 * AUTOFIT_PADDING for line in lines)
+    assert len(lines) * size * AUTOFIT_LEADING <= height - 2 * AUTOFIT_PADDING
+
+def test_multiline_keeps_paragraphs_and_splits_long_words():
+    size, lines = fit_text("Prima riga\nSeconda riga", 200, 100, 10, multiline=True)
+    assert (size, lines) == (10, ("Prima riga", "Seconda riga"))
+    _, lines = fit_text("a" * 200, 60, 200, 10, multiline=True)
+    assert len(lines) > 1 and "".join(lines) == "a" * 200
+
+def test_overflowing_lines_are_dropped():
+    size, lines = fit_text("parola " * 2000, 100, 30, 10, multiline=True)
+    assert size == AUTOFIT_MIN_SIZE
+    assert len(lines) == int((30 - 2 * AUTOFIT_PADDING) // (size * AUTOFIT_LEADING))
@@ -0,0 +1,26 @@
+"""--all con --jobs: conversione in parallelo"""
+from fill_dnd_sheet import iter_batch_results
+
+def run(files, output_dir, jobs, template_pdf):
+    output_dir.mkdir()
+    results = {}
+    for cah_file, res, error in iter_batch_results(files, output_dir, jobs=jobs, template_pdf=template_pdf):
+        assert error is None
+        results[cah_file.name] = res['path'].read_bytes()
+    return results
+
+def test_parallel_output_matches_sequential(sample_cah_files, tmp_path, template_pdf):
+    sequential = run(sample_cah_files, tmp_path / "seq", 1, template_pdf)
+    parallel = run(sample_cah_files, tmp_path / "par", 2, template_pdf)
+    assert sorted(sequential) == sorted(path.name for path in sample_cah_files)
+    assert parallel == sequential
+
+def test_errors_are_reported_per_file(sample_cah_files, tmp_path, template_pdf):
+    broken = tmp_path / "broken.cah"
+    broken.write_bytes(b'{"name": ')
+    (tmp_path / "out").mkdir()
+    results = list(iter_batch_results([broken, *sample_cah_files], tmp_path / "out", jobs=2,
+                                      template_pdf=template_pdf))
+    errors = {cah_file.name: error for cah_file, _, error in results}
+    assert errors.pop("broken.cah") is not None
+    assert set(errors.values()) == {None}
@@ -0,0 +1,50 @@
+"""--bundle: tutte le schede in un unico PDF con le risorse del template condivise"""
+import sys
+
+import pytest
+from pypdf import PdfReader
+
+import fill_dnd_sheet
+from fill_dnd_sheet import process_cah_file, write_party_bundle
+
+def test_bundle_pages_outline_and_shared_resources(sample_cah_files, tmp_path, template_pdf):
+    sheets_dir = tmp_path / "sheets"
+    sheets_dir.mkdir()
+    sheet_pages = []
+    sheets_size = 0
+    for cah_file in sample_cah_files:
+        result = process_cah_file(cah_file, sheets_dir, template_pdf=template_pdf)
+        sheet_pages.append(len(PdfReader(result['path']).pages))
+        sheets_size += result['path'].stat().st_size
+
+    bundle_path = tmp_path / "party.pdf"
+    write_party_bundle(sample_cah_files, template_pdf, bundle_path)
+    reader = PdfReader(bundle_path)
+    # Le stesse pagine delle schede singole, continuazioni comprese
+    assert len(reader.pages) == sum(sheet_pages)
+    assert len(reader.outline) == len(sample_cah_files)
+    starts = [sum(sheet_pages[:i]) for i in range(len(sheet_pages))]
+    assert [reader.get_destination_page_number(item) for item in reader.outline] == starts
+
+    # Contenuto del template: un solo oggetto per pagina, usato da ogni scheda
+    for page_num in range(3):
+        template_contents = {reader.pages[start + page_num]['/Contents'][1].idnum for start in starts}
+        assert len(template_contents) == 1
+    overlays = {reader.pages[start]['/Contents'][2].idnum for start in starts}
+    assert len(overlays) == len(starts)
+    assert bundle_path.stat().st_size < sheets_size
+
+def test_bundle_skips_broken_files(sample_cah_files, tmp_path, template_pdf, capsys):
+    broken = tmp_path / "broken.cah"
+    broken.write_bytes(b"{non json")
+    bundle_path = tmp_path / "party.pdf"
+    write_party_bundle([broken, sample_cah_files[0]], template_pdf, bundle_path)
+    assert "✗ Errore" in capsys.readouterr().out
+    assert len(PdfReader(bundle_path).outline) == 1
+
+def test_bundle_rejects_jobs(monkeypatch, capsys):
+    monkeypatch.setattr(sys, "argv", ["fill_dnd_sheet.py", "--all", "--bundle", "party.pdf", "-j", "2"])
+    with pytest.raises(SystemExit) as excinfo:
+        fill_dnd_sheet.main_cli()
+    assert excinfo.value.code == 2
+    assert "--bundle" in capsys.readouterr().err
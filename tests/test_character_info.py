@@ -0,0 +1,30 @@
+"""Campi della scheda derivati dal .cah"""
+import json
+
+import fill_dnd_sheet
+from fill_dnd_sheet import extract_character_info, render_cache_key, spell_slots
+
+def load(sample_cah_files, name):
+    path = next(path for path in sample_cah_files if path.stem == name)
+    return json.loads(path.read_bytes())
+
+def test_xp_comes_from_exp_or_xp(sample_cah_files):
+    data = load(sample_cah_files, "Arkan")
+    assert extract_character_info(data)['XP'] == "48000"
+    # I .cah ricostruiti da pdf_to_cah usano 'xp'
+    data['xp'] = data.pop('exp')
+    assert extract_character_info(data)['XP'] == "48000"
+
+def test_spell_slots_use_app_keys(sample_cah_files):
+    data = load(sample_cah_files, "Arkan")
+    info = extract_character_info(data)
+    assert [info.get(f'SlotsTotal {18 + level}') for level in range(1, 6)] == ["4", "3", "3", "3", "1"]
+    assert 'SlotsTotal 24' not in info
+    assert spell_slots({'spellSlots': {'Lvl2': 3}}) == [0, 3, 0, 0, 0, 0, 0, 0, 0]
+
+def test_renderer_version_is_part_of_the_cache_key(sample_cah_files, monkeypatch):
+    info = extract_character_info(load(sample_cah_files, "Valadurg"))
+    key = render_cache_key(info, "template")
+    assert render_cache_key(info, "template") == key
+    monkeypatch.setattr(fill_dnd_sheet, 'RENDERER_VERSION', fill_dnd_sheet.RENDERER_VERSION + 1)
+    assert render_cache_key(info, "template") != key
@@ -0,0 +1,59 @@
+"""Features & Traits: privilegi di classe e sottoclasse fino al livello raggiunto"""
+import copy
+
+import pytest
+
+from fill_dnd_sheet import (
+    CHARACTER_KEYS, DEFAULT_PROFILE, ClassDefinitionCache, character_features, extract_character_info,
+    features_text, load_character_data,
+)
+
+@pytest.fixture
+def arkan(sample_cah_files):
+    return {path.stem: path for path in sample_cah_files}['Arkan']
+
+def test_features_up_to_class_level(arkan):
+    data = load_character_data(arkan)
+    features = dict(character_features(data, ClassDefinitionCache()))
+    levels = {job['jobId']: job['level'] for job in data['jobs']}
+    assert set(features) == {"Cleric", "Sorcerer"}
+    for class_name, unlocked in features.items():
+        feature_levels = [level for level, _, _ in unlocked]
+        assert feature_levels == sorted(feature_levels)
+        assert max(feature_levels) <= levels[class_name.lower()]
+    # Anche i privilegi della sottoclasse scelta
+    assert "Wrath of the Storm" in [name for _, name, _ in features["Cleric"]]
+
+def test_raw_and_decoded_classes_give_same_features(arkan):
+    full = load_character_data(arkan)
+    selective = load_character_data(arkan, keys=CHARACTER_KEYS)
+    assert isinstance(selective['allRequiredClasses'], bytes)
+    assert character_features(selective, ClassDefinitionCache()) == character_features(full, ClassDefinitionCache())
+
+def test_definitions_decoded_once(arkan):
+    cache = ClassDefinitionCache()
+    data = load_character_data(arkan, keys=CHARACTER_KEYS)
+    first = character_features(data, cache)
+    assert cache.decoded == 2
+    # Un altro personaggio con le stesse classi: nessuna nuova decodifica
+    other = load_character_data(arkan, keys=CHARACTER_KEYS)
+    assert character_features(other, cache) == first
+    assert cache.decoded == 2
+
+def test_features_field_filled_and_grows_with_level(arkan):
+    data = load_character_data(arkan, keys=CHARACTER_KEYS)
+    field = DEFAULT_PROFILE.fields['features']
+    text = extract_character_info(data)[field]
+    assert text == features_text(character_features(data))
+    assert "Wrath of the Storm (Cleric 1)" in text
+
+    higher = copy.deepcopy(data)
+    for job in higher['jobs']:
+        job['level'] += 3
+    assert len(extract_character_info(higher)[field].splitlines()) > len(text.splitlines())
+
+def test_no_class_definitions_no_field(arkan):
+    data = load_character_data(arkan)
+    del data['allRequiredClasses']
+    assert character_features(data) == []
+    assert DEFAULT_PROFILE.fields['features'] not in extract_character_info(data)
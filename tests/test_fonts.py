@@ -0,0 +1,81 @@
+"""--font: DejaVu Sans incorporato a sottoinsiemi, con i caratteri fuori dal Latin-1"""
+import copy
+import io
+
+import pytest
+from pypdf import PdfReader
+from pypdf.generic import ArrayObject, DictionaryObject
+
+import sheet_render
+from fill_dnd_sheet import (
+    DEFAULT_PROFILE, extract_character_info, font_digest, load_character_data, render_cache_key,
+)
+
+NAME = "Łucja Żółć"
+
+@pytest.fixture
+def char_info(sample_cah_files):
+    data = copy.deepcopy(load_character_data(sample_cah_files[0]))
+    data['name'] = NAME
+    return extract_character_info(data)
+
+def _fonts(reader):
+    """Font usati dalle pagine, anche dentro Form XObject e aspetti dei campi: {idnum: font}"""
+    fonts = {}
+    def collect(resources):
+        resources = resources.get_object()
+        for ref in resources.get('/Font', DictionaryObject()).get_object().values():
+            fonts[ref.idnum] = ref.get_object()
+        for xobject in resources.get('/XObject', DictionaryObject()).get_object().values():
+            if '/Resources' in xobject.get_object():
+                collect(xobject.get_object()['/Resources'])
+    for page in reader.pages:
+        collect(page['/Resources'])
+        for annotation in page.get('/Annots', ArrayObject()).get_object():
+            appearance = annotation.get_object().get('/AP', DictionaryObject()).get('/N')
+            if appearance is not None and '/Resources' in appearance.get_object():
+                collect(appearance.get_object()['/Resources'])
+    return fonts
+
+def _embedded(reader):
+    return [font for font in _fonts(reader).values() if "DejaVu" in font['/BaseFont']]
+
+def _fill(template_pdf, char_info, engine="overlay", font=None):
+    output = io.BytesIO()
+    sheet_render.fill_pdf(template_pdf, output, char_info, engine=engine, font=font)
+    return PdfReader(output)
+
+@pytest.mark.parametrize("engine", ["overlay", "acroform"])
+def test_dejavu_is_embedded_as_subset(template_pdf, char_info, engine):
+    reader = _fill(template_pdf, char_info, engine, "dejavu")
+    embedded = _embedded(reader)
+    assert embedded
+    for font in embedded:
+        # Prefisso di sei lettere maiuscole dei sottoinsiemi
+        assert font['/BaseFont'][7] == "+" and font['/BaseFont'][1:7].isupper()
+        descendant = font['/DescendantFonts'][0].get_object() if '/DescendantFonts' in font else font
+        assert '/FontFile2' in descendant['/FontDescriptor']
+    if engine == "overlay":
+        assert NAME in reader.pages[0].extract_text()
+
+def test_helvetica_is_not_embedded(template_pdf, char_info):
+    reader = _fill(template_pdf, char_info)
+    assert not _embedded(reader)
+    text = reader.pages[0].extract_text()
+    assert NAME not in text and "ucja" in text
+
+def test_bundle_writes_each_subset_once(template_pdf, char_info):
+    bundle = sheet_render.PartyBundle(template_pdf, "dejavu")
+    for _ in range(3):
+        bundle.add_sheet(char_info, title=char_info[DEFAULT_PROFILE.fields['character_name']])
+    output = io.BytesIO()
+    bundle.write(output)
+    # Tre schede, ma ogni sottoinsieme è un solo oggetto come in una scheda singola
+    embedded = _embedded(PdfReader(output))
+    assert len(embedded) == len(_embedded(_fill(template_pdf, char_info, font="dejavu")))
+    assert len({font['/BaseFont'] for font in embedded}) == len(embedded)
+
+def test_font_in_cache_key(char_info):
+    helvetica = render_cache_key(char_info, "hash", font_hash=font_digest("helvetica"))
+    dejavu = render_cache_key(char_info, "hash", font_hash=font_digest("dejavu"))
+    assert helvetica != dejavu
@@ -0,0 +1,26 @@
+"""Generatore di .cah sintetici dei benchmark"""
+import base64
+import io
+import json
+
+import pytest
+
+from benchmarks.generate_cah import write_roster
+from fill_dnd_sheet import CHARACTER_KEYS, extract_character_info, load_character_data
+
+def test_roster_is_deterministic_and_loadable(tmp_path):
+    first = write_roster(tmp_path / "a", 2, 'medium', seed=7, portrait_kb=20, classes_kb=20)
+    second = write_roster(tmp_path / "b", 2, 'medium', seed=7, portrait_kb=20, classes_kb=20)
+    assert [path.read_bytes() for path in first] == [path.read_bytes() for path in second]
+    for path in first:
+        assert json.loads(path.read_bytes())['image']
+        assert extract_character_info(load_character_data(path, CHARACTER_KEYS))
+
+def test_portrait_is_a_real_image(tmp_path):
+    Image = pytest.importorskip("PIL.Image")
+    path, = write_roster(tmp_path, 1, 'medium', seed=1, portrait_kb=40, classes_kb=10)
+    data = base64.b64decode(json.loads(path.read_bytes())['image'])
+    assert abs(len(data) - 40 * 1024 * 3 // 4) < 40 * 1024 // 4
+    with Image.open(io.BytesIO(data)) as image:
+        image.load()
+        assert image.format == "JPEG"
@@ -0,0 +1,39 @@
+"""Lotti di conversione della GUI, senza aprire finestre"""
+import time
+
+import pytest
+
+pytest.importorskip("tkinter")
+import sheet_gui
+
+def collect(batch, timeout=120):
+    results = []
+    deadline = time.monotonic() + timeout
+    while len(results) < len(batch.files):
+        assert time.monotonic() < deadline
+        results.append(batch.results.get(timeout=timeout))
+    return results
+
+@pytest.fixture
+def executor(repo_dir, monkeypatch):
+    # Il template incluso si trova a partire dalla cartella corrente
+    monkeypatch.chdir(repo_dir)
+    executor = sheet_gui.make_executor(2)
+    yield executor
+    executor.shutdown()
+
+def test_batch_runs_in_worker_processes(executor, sample_cah_files, tmp_path):
+    assert isinstance(executor, sheet_gui.ProcessPoolExecutor)
+    results = collect(sheet_gui.GuiBatch(executor, sample_cah_files, tmp_path))
+    assert sorted(cah_file.name for cah_file, *_ in results) == sorted(path.name for path in sample_cah_files)
+    for cah_file, res, error, elapsed in results:
+        assert error is None and elapsed > 0
+        assert res['path'].read_bytes().startswith(b'%PDF')
+
+def test_cancel_skips_pending_files(executor, sample_cah_files, tmp_path):
+    batch = sheet_gui.GuiBatch(executor, sample_cah_files * 10, tmp_path)
+    batch.cancel()
+    results = collect(batch)
+    assert len(results) == len(batch.files)
+    assert any(isinstance(error, sheet_gui.BatchCancelled) for _, _, error, _ in results)
+    assert all(error is None or isinstance(error, sheet_gui.BatchCancelled) for _, _, error, _ in results)
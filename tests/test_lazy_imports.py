@@ -0,0 +1,43 @@
+"""Import leggero: motore, interfaccia grafica e server caricati solo quando servono"""
+import json
+import subprocess
+import sys
+
+import pytest
+
+def _loaded_after(repo_dir, code):
+    """Moduli pesanti in memoria dopo il codice indicato, in un interprete nuovo"""
+    script = (f"import json, sys\n{code}\n"
+              "import fill_dnd_sheet\n"
+              "print(json.dumps([m for m in fill_dnd_sheet.HEAVY_MODULES if m in sys.modules]))")
+    output = subprocess.run([sys.executable, "-c", script], cwd=repo_dir, check=True,
+                            capture_output=True, text=True).stdout
+    return set(json.loads(output.splitlines()[-1]))
+
+def test_import_loads_no_heavy_module(repo_dir):
+    assert _loaded_after(repo_dir, "import fill_dnd_sheet") == set()
+
+def test_stats_only_path_stays_light(repo_dir, sample_cah_files):
+    code = ("import fill_dnd_sheet\n"
+            f"fill_dnd_sheet.extract_character_info(fill_dnd_sheet.load_character_data({str(sample_cah_files[0])!r}))")
+    assert not _loaded_after(repo_dir, code) & {"pypdf", "reportlab", "tkinter", "PIL"}
+
+def test_renderer_loaded_on_first_use(repo_dir):
+    loaded = _loaded_after(repo_dir, "import fill_dnd_sheet\nfill_dnd_sheet.fill_pdf")
+    assert {"pypdf", "reportlab"} <= loaded
+    assert "tkinter" not in loaded
+
+def test_forwarded_names():
+    import fill_dnd_sheet
+    import sheet_render
+    assert fill_dnd_sheet.fill_pdf is sheet_render.fill_pdf
+    assert fill_dnd_sheet.PartyBundle is sheet_render.PartyBundle
+    with pytest.raises(AttributeError):
+        fill_dnd_sheet.nome_inesistente
+
+def test_gui_names_forwarded():
+    pytest.importorskip("tkinter")
+    import fill_dnd_sheet
+    import sheet_gui
+    for name in fill_dnd_sheet.GUI_NAMES:
+        assert getattr(fill_dnd_sheet, name) is getattr(sheet_gui, name)
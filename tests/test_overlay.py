@@ -0,0 +1,48 @@
+"""Motore overlay: piano di render e aggiornamento incrementale delle sole pagine compilate"""
+import io
+
+from pypdf import PdfReader
+
+import sheet_render
+from fill_dnd_sheet import DEFAULT_PROFILE, extract_character_info, load_character_data
+
+def _fill(template_pdf, field_data):
+    output = io.BytesIO()
+    sheet_render.fill_pdf(template_pdf, output, field_data)
+    return output.getvalue()
+
+def test_render_plan_lists_pages_with_fields(template_pdf):
+    index = sheet_render.template_cache.get(template_pdf).index
+    name_field = DEFAULT_PROFILE.fields['character_name']
+    assert sheet_render.render_plan(index, {}) == []
+    assert sheet_render.render_plan(index, {name_field: "Arkan", "campo inesistente": "x"}) == [0]
+    by_page = {}
+    for field_name, field in index['fields'].items():
+        by_page.setdefault(field['page'], field_name)
+    assert sheet_render.render_plan(index, {by_page[2]: "x", by_page[0]: "y"}) == [0, 2]
+
+def test_output_appends_to_serialized_template(template_pdf):
+    base = sheet_render.template_cache.get(template_pdf).overlay_base()
+    name_field = DEFAULT_PROFILE.fields['character_name']
+    data = _fill(template_pdf, {name_field: "Arkan"})
+    # I byte del template restano tali e quali: segue solo l'aggiornamento
+    assert data.startswith(base.data)
+
+    reader = PdfReader(io.BytesIO(data))
+    assert "/AcroForm" not in reader.trailer["/Root"]
+    assert len(reader.pages) == 3
+    assert "Arkan" in reader.pages[0].extract_text()
+    base_reader = PdfReader(io.BytesIO(base.data))
+    # Le pagine fuori dal piano sono gli oggetti originali, con il solo contenuto del template
+    for page_num in (1, 2):
+        page, base_page = reader.pages[page_num], base_reader.pages[page_num]
+        assert page.indirect_reference.idnum == base_page.indirect_reference.idnum
+        assert page.raw_get("/Contents").idnum == base_page.raw_get("/Contents").idnum
+    assert len(reader.pages[0]["/Contents"]) > 1
+
+def test_sheet_text_on_every_page(template_pdf, sample_cah_files):
+    char_info = extract_character_info(load_character_data(sample_cah_files[0]))
+    reader = PdfReader(io.BytesIO(_fill(template_pdf, char_info)))
+    name = char_info[DEFAULT_PROFILE.fields['character_name']]
+    assert name in reader.pages[0].extract_text()
+    assert all(page.extract_text().strip() for page in reader.pages)
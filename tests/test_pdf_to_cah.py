@@ -0,0 +1,50 @@
+"""pdf_to_cah: da una scheda compilata di nuovo al .cah, anche in batch"""
+import json
+
+import pytest
+from pypdf import PdfReader
+
+from fill_dnd_sheet import ABILITIES, load_character_data, process_cah_file
+from pdf_to_cah import _field_value, convert_batch, convert_pdf, read_form_values
+
+@pytest.fixture
+def filled_pdfs(sample_cah_files, tmp_path, template_pdf):
+    """Le schede di esempio compilate nei campi del modulo"""
+    output_dir = tmp_path / "sheets"
+    output_dir.mkdir()
+    return {cah_file: process_cah_file(cah_file, output_dir, "acroform", template_pdf=template_pdf)['path']
+            for cah_file in sample_cah_files}
+
+def test_read_form_values_matches_get_fields(filled_pdfs):
+    for pdf in filled_pdfs.values():
+        fields = PdfReader(pdf).get_fields()
+        expected = {name: _field_value(field['/V']) for name, field in fields.items() if '/V' in field}
+        assert read_form_values(pdf) == expected
+
+def test_round_trip(filled_pdfs, tmp_path):
+    for cah_file, pdf in filled_pdfs.items():
+        original = load_character_data(cah_file)
+        result = convert_pdf(pdf, tmp_path / "back.cah")
+        converted = json.loads(result['path'].read_text(encoding='utf-8'))
+        assert converted['name'] == result['name'] == original['name']
+        for ability in ABILITIES:
+            assert converted[ability]['score'] == original[ability]['score']
+            assert converted[ability]['save'] == original[ability].get('save', False)
+        proficient = {skill['typeName'] for skill in original.get('skills', [])
+                      if skill.get('proficiencyName', 'NONE') != 'NONE'}
+        assert {skill['typeName'] for skill in converted['skills']} == proficient
+
+def test_flattened_pdf_is_rejected(sample_cah_files, tmp_path, template_pdf):
+    flat = process_cah_file(sample_cah_files[0], tmp_path, "acroform", flatten=True, template_pdf=template_pdf)
+    with pytest.raises(ValueError):
+        convert_pdf(flat['path'], tmp_path / "flat.cah")
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_batch_reports_failures(filled_pdfs, tmp_path, jobs):
+    sheets_dir = next(iter(filled_pdfs.values())).parent
+    (sheets_dir / "broken.pdf").write_bytes(b"non un pdf")
+    output_dir = tmp_path / f"cah-{jobs}"
+    failures = convert_batch([str(sheets_dir)], output_dir, jobs)
+    assert [pdf.name for pdf, _ in failures] == ["broken.pdf"]
+    assert sorted(path.name for path in output_dir.glob("*.cah")) == sorted(
+        pdf.stem + ".cah" for pdf in filled_pdfs.values())
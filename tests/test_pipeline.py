@@ -0,0 +1,23 @@
+"""--pipeline: conversione asyncio con fasi sovrapposte"""
+import asyncio
+
+from fill_dnd_sheet import DEFAULT_TEMPLATE, run_batch_pipeline
+
+def run(files, output_dir, template_pdf):
+    results = {}
+    def on_result(cah_file, res, error):
+        results[cah_file.name] = (res, error)
+    report = asyncio.run(run_batch_pipeline(files, output_dir, jobs=2, on_result=on_result,
+                                            template_pdf=template_pdf))
+    return results, report
+
+def test_pipeline_renders_then_reuses_cache(tmp_path, repo_dir, sample_cah_files):
+    template_pdf = repo_dir / DEFAULT_TEMPLATE
+    results, _ = run(sample_cah_files, tmp_path, template_pdf)
+    assert sorted(results) == sorted(path.name for path in sample_cah_files)
+    assert all(error is None and not res['cached'] for res, error in results.values())
+    for path in sample_cah_files:
+        assert (tmp_path / f"{path.stem}_sheet.pdf").read_bytes().startswith(b'%PDF')
+
+    results, _ = run(sample_cah_files, tmp_path, template_pdf)
+    assert all(error is None and res['cached'] for res, error in results.values())
@@ -0,0 +1,92 @@
+"""Ritratto del personaggio a pagina 2 e cache delle miniature"""
+import base64
+import io
+
+import pytest
+from pypdf import PdfReader
+from pypdf.generic import ArrayObject
+
+import sheet_render
+from fill_dnd_sheet import RawImage, process_cah_file
+
+Image = pytest.importorskip("PIL.Image")
+
+BOX = (120.0, 150.0)
+
+def _jpeg_base64(size=(400, 500)):
+    output = io.BytesIO()
+    Image.new("RGB", size, (200, 40, 40)).save(output, "JPEG")
+    return base64.b64encode(output.getvalue()).decode('ascii')
+
+def _images(resources):
+    """Immagini delle risorse, anche dentro i Form XObject"""
+    images = []
+    for xobject in resources.get('/XObject', {}).values():
+        xobject = xobject.get_object()
+        if xobject.get('/Subtype') == '/Image':
+            images.append(xobject)
+        elif '/Resources' in xobject:
+            images += _images(xobject['/Resources'])
+    return images
+
+def _page_images(page):
+    """Immagini disegnate nella pagina o negli aspetti dei suoi widget"""
+    images = _images(page['/Resources'])
+    for annotation in page.get('/Annots', ArrayObject()).get_object():
+        appearance = annotation.get_object().get('/AP', {}).get('/N')
+        if appearance is not None and '/Resources' in appearance.get_object():
+            images += _images(appearance.get_object()['/Resources'])
+    return images
+
+@pytest.mark.parametrize("engine, flatten", [("overlay", False), ("acroform", False), ("acroform", True)])
+def test_portrait_drawn_on_second_page(sample_cah_files, tmp_path, template_pdf, engine, flatten):
+    by_name = {path.stem: path for path in sample_cah_files}
+    with_portrait = process_cah_file(by_name['Arkan'], tmp_path, engine, flatten, template_pdf=template_pdf)
+    reader = PdfReader(with_portrait['path'])
+    images = _page_images(reader.pages[1])
+    # Widget sovrapposti dello stesso pulsante condividono una sola immagine
+    assert len({image.indirect_reference.idnum for image in images}) == 1
+    assert images[0]['/Filter'] == '/DCTDecode'
+    assert not _page_images(reader.pages[0])
+    assert list((tmp_path / sheet_render.PORTRAIT_CACHE_DIR).glob("*.jpg"))
+
+    # Nessun ritratto nel .cah: nessuna immagine
+    without_portrait = process_cah_file(by_name['Bella Tascabilly'], tmp_path, engine, flatten, template_pdf=template_pdf)
+    assert not _page_images(PdfReader(without_portrait['path']).pages[1])
+
+def test_thumbnail_fits_box_and_is_reused(tmp_path):
+    source = RawImage(f'"{_jpeg_base64()}"'.encode('ascii'))
+    portrait = sheet_render.PortraitCache(tmp_path).get(source, BOX)
+    assert portrait.width <= round(BOX[0] * sheet_render.PORTRAIT_DPI / 72)
+    assert portrait.height <= round(BOX[1] * sheet_render.PORTRAIT_DPI / 72)
+    x, y, width, height = portrait.fit((0, 0) + BOX)
+    assert width <= BOX[0] + 0.01 and height <= BOX[1] + 0.01
+
+    # Un'altra cache sulla stessa cartella legge la miniatura senza decodificare
+    cache = sheet_render.PortraitCache(tmp_path)
+    cache._make_thumbnail = lambda *args: pytest.fail("miniatura decodificata di nuovo")
+    assert cache.get(source, BOX).data == portrait.data
+
+def test_unreadable_portrait_is_decoded_once(tmp_path):
+    source = RawImage(b'"bm90IGFuIGltYWdl"')
+    assert sheet_render.PortraitCache(tmp_path).get(source, BOX) is None
+    assert len(list(tmp_path.glob("*.bad"))) == 1
+
+    cache = sheet_render.PortraitCache(tmp_path)
+    cache._make_thumbnail = lambda *args: pytest.fail("ritratto illeggibile decodificato di nuovo")
+    assert cache.get(source, BOX) is None
+
+def test_memory_cache_writes_nothing(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert sheet_render.PortraitCache(None).get(_jpeg_base64(), BOX) is not None
+    assert not list(tmp_path.iterdir())
+
+def test_eviction_keeps_recent_thumbnails(tmp_path):
+    cache = sheet_render.PortraitCache(tmp_path, max_bytes=1)
+    for color in range(3):
+        output = io.BytesIO()
+        Image.new("RGB", (300, 300), (color * 80, 0, 0)).save(output, "JPEG")
+        cache.get(base64.b64encode(output.getvalue()).decode('ascii'), BOX)
+    # Oltre il limite resta al più l'ultima miniatura scritta
+    assert len(list(tmp_path.glob("*.jpg"))) <= 1
+    assert not list(tmp_path.glob("*.tmp"))
@@ -0,0 +1,36 @@
+"""--profile: tempi per fase e contatori di una conversione"""
+import json
+
+from fill_dnd_sheet import process_cah_file
+
+def test_profile_reports_stages_and_counters(sample_cah_files, tmp_path, template_pdf):
+    for engine, render_stages in (("overlay", {"template", "draw", "merge", "write"}),
+                                  ("acroform", {"template", "fields", "write"})):
+        output_dir = tmp_path / engine
+        output_dir.mkdir()
+        result = process_cah_file(sample_cah_files[0], output_dir, engine, profile=True,
+                                  template_pdf=template_pdf)
+        report = result['profile']
+        assert {"load", "extract", "cache"} | render_stages <= set(report['stages'])
+        assert report['cache_hit'] is False
+        assert report['bytes_written'] > 0
+        assert len(report['fields_per_page']) == 3
+        assert 'cprofile' not in report
+        # Il report finisce in --profile-json
+        json.dumps(report)
+
+        # Dalla cache: nessuna fase di compilazione
+        cached = process_cah_file(sample_cah_files[0], output_dir, engine, profile=True,
+                                  template_pdf=template_pdf)['profile']
+        assert cached['cache_hit'] is True
+        assert not render_stages & set(cached['stages'])
+
+def test_profile_stage_adds_cprofile_stats(sample_cah_files, tmp_path, template_pdf):
+    result = process_cah_file(sample_cah_files[0], tmp_path, profile_stage="extract",
+                              template_pdf=template_pdf)
+    assert result['profile']['cprofile']['stage'] == "extract"
+    assert "extract_character_info" in result['profile']['cprofile']['stats']
+
+def test_no_profile_by_default(sample_cah_files, tmp_path, template_pdf):
+    result = process_cah_file(sample_cah_files[0], tmp_path, template_pdf=template_pdf)
+    assert 'profile' not in result
@@ -0,0 +1,81 @@
+"""Profili dei template: discovery dei campi su un template con nomi diversi"""
+import json
+import shutil
+
+import pytest
+from pypdf import PdfReader, PdfWriter
+from pypdf.generic import NameObject, TextStringObject
+
+import sheet_profiles
+from fill_dnd_sheet import extract_character_info, load_character_data, process_cah_file, profile_for_template
+
+# Campi rinominati come in una scheda italiana (alias) o con un'altra grafia (nome normalizzato)
+RENAMED = {
+    'CharacterName': 'NomePersonaggio',
+    'STR': 'Forza',
+    'XP': 'x_p',
+    'Initiative': 'Iniziativa',
+}
+
+@pytest.fixture
+def renamed_template(template_pdf, tmp_path):
+    writer = PdfWriter(clone_from=template_pdf)
+    for field in writer._root_object["/AcroForm"]["/Fields"]:
+        field = field.get_object()
+        if field.get("/T") in RENAMED:
+            field[NameObject("/T")] = TextStringObject(RENAMED[field["/T"]])
+    path = tmp_path / "scheda_it.pdf"
+    with open(path, "wb") as f:
+        writer.write(f)
+    return path
+
+def test_discovery_on_default_names():
+    field_names = [name for value in sheet_profiles.DEFAULT_FIELDS.values()
+                   for name in (value if isinstance(value, list) else [value])]
+    assert sheet_profiles.discover_fields(field_names) == (sheet_profiles.DEFAULT_FIELDS, [])
+
+def test_discovery_prefers_previous_mapping_and_assigns_each_field_once():
+    fields, missing = sheet_profiles.discover_fields(["Nome", "CharacterName"],
+                                                     previous={'character_name': "Nome"})
+    assert fields['character_name'] == "Nome"
+    assert fields['player_name'] is None
+    assert 'player_name' in missing
+
+def test_renamed_template_profile(renamed_template, sample_cah_files, tmp_path):
+    result = process_cah_file(sample_cah_files[0], tmp_path, "acroform", template_pdf=renamed_template)
+    profile = profile_for_template(renamed_template)
+    for slot, name in (('character_name', 'NomePersonaggio'), ('strength_score', 'Forza'),
+                       ('xp', 'x_p'), ('initiative', 'Iniziativa'), ('dexterity_score', 'DEX')):
+        assert profile.fields[slot] == name
+
+    # Il profilo proposto è salvato accanto al template, legato al suo hash
+    artifact = json.loads(sheet_profiles.get_profile_path(renamed_template).read_text(encoding='utf-8'))
+    assert artifact['fields']['character_name'] == 'NomePersonaggio'
+    assert artifact['template'] == renamed_template.name
+    assert not list(renamed_template.parent.glob("*.tmp"))
+
+    # I valori finiscono nei campi rinominati
+    expected = extract_character_info(load_character_data(sample_cah_files[0]))
+    values = {name: field.get('/V') for name, field in PdfReader(result['path']).get_fields().items()}
+    assert values['NomePersonaggio'] == expected['CharacterName']
+    assert values['Forza'] == expected['STR']
+
+def test_manual_correction_survives_template_change(renamed_template, tmp_path):
+    profile_for_template(renamed_template)
+    profile_path = sheet_profiles.get_profile_path(renamed_template)
+    artifact = json.loads(profile_path.read_text(encoding='utf-8'))
+    artifact['fields']['player_name'] = 'Background'
+    artifact['fields']['background'] = 'PlayerName'
+    profile_path.write_text(json.dumps(artifact), encoding='utf-8')
+
+    # Nuova versione del template: la discovery riparte dalle correzioni
+    copy = tmp_path / "copia"
+    copy.mkdir()
+    shutil.copyfile(renamed_template, copy / renamed_template.name)
+    with open(copy / renamed_template.name, "ab") as f:
+        f.write(b"\n% nuova versione\n")
+    shutil.copyfile(profile_path, sheet_profiles.get_profile_path(copy / renamed_template.name))
+    profile = profile_for_template(copy / renamed_template.name, persist=False)
+    assert profile.discovered
+    assert profile.fields['player_name'] == 'Background'
+    assert profile.fields['background'] == 'PlayerName'
@@ -0,0 +1,107 @@
+"""Cache dei render: chiavi, manifest con journal ed eviction"""
+import json
+import shutil
+
+import pytest
+
+import fill_dnd_sheet
+from fill_dnd_sheet import RenderCache, process_cah_file
+
+@pytest.fixture
+def cah_file(sample_cah_files):
+    return next(path for path in sample_cah_files if path.stem == "Valadurg")
+
+def test_hit_and_miss(cah_file, tmp_path, template_pdf, monkeypatch):
+    assert not process_cah_file(cah_file, tmp_path, template_pdf=template_pdf)['cached']
+    assert process_cah_file(cah_file, tmp_path, template_pdf=template_pdf)['cached']
+    assert not process_cah_file(cah_file, tmp_path, template_pdf=template_pdf, force=True)['cached']
+    # Un altro motore è un'altra scheda
+    assert not process_cah_file(cah_file, tmp_path, engine="acroform", template_pdf=template_pdf)['cached']
+
+    # Nuova versione del renderer: i PDF in cache non valgono più
+    monkeypatch.setattr(fill_dnd_sheet, 'RENDERER_VERSION', fill_dnd_sheet.RENDERER_VERSION + 1)
+    assert not process_cah_file(cah_file, tmp_path, template_pdf=template_pdf)['cached']
+    assert process_cah_file(cah_file, tmp_path, template_pdf=template_pdf)['cached']
+
+def test_template_change_is_a_miss(cah_file, tmp_path, template_pdf):
+    template = tmp_path / "template.pdf"
+    shutil.copyfile(template_pdf, template)
+    output_dir = tmp_path / "out"
+    output_dir.mkdir()
+    assert not process_cah_file(cah_file, output_dir, template_pdf=template)['cached']
+    assert process_cah_file(cah_file, output_dir, template_pdf=template)['cached']
+    with open(template, 'ab') as f:
+        f.write(b"\n% template modificato\n")
+    assert not process_cah_file(cah_file, output_dir, template_pdf=template)['cached']
+
+def store(cache, tmp_path, key, size=1000):
+    source = tmp_path / f"{key}.src"
+    source.write_bytes(b"x" * size)
+    cache.store(key, source, source=key)
+
+def test_updates_go_to_the_journal(tmp_path):
+    cache = RenderCache(tmp_path)
+    store(cache, tmp_path, "a")
+    store(cache, tmp_path, "b")
+    assert cache.fetch("a", tmp_path / "copy.pdf")
+    assert not cache.fetch("missing", tmp_path / "copy.pdf")
+    records = [json.loads(line) for line in cache.journal_path.read_text(encoding='utf-8').splitlines()]
+    assert [record['key'] for record in records] == ["a", "b", "a"]
+    assert set(records[2]) == {'key', 'used'}
+
+    # Un altro processo: manifest e journal letti una volta e applicati
+    RenderCache._states.pop(cache.root)
+    entries = RenderCache(tmp_path)._state()['entries']
+    assert set(entries) == {"a", "b"}
+    assert entries["a"]['used'] == records[2]['used']
+
+def test_manifest_is_read_once_per_process(tmp_path, monkeypatch):
+    cache = RenderCache(tmp_path)
+    store(cache, tmp_path, "a")
+    reads = []
+    original = RenderCache._read_manifest
+    monkeypatch.setattr(RenderCache, '_read_manifest', lambda self: reads.append(1) or original(self))
+    for key in "bcd":
+        store(RenderCache(tmp_path), tmp_path, key)
+        RenderCache(tmp_path).fetch(key, tmp_path / "copy.pdf")
+    assert reads == []
+
+@pytest.mark.parametrize('manifest', [None, b"{not json", b'{"version": 1, "entries": {}}'])
+def test_missing_or_unreadable_manifest_is_rebuilt(tmp_path, manifest):
+    cache = RenderCache(tmp_path)
+    store(cache, tmp_path, "a")
+    store(cache, tmp_path, "b")
+    RenderCache._states.pop(cache.root)
+    cache.journal_path.unlink()
+    if manifest is None:
+        cache.manifest_path.unlink(missing_ok=True)
+    else:
+        cache.manifest_path.write_bytes(manifest)
+    assert set(RenderCache(tmp_path)._state()['entries']) == {"a", "b"}
+    saved = json.loads(cache.manifest_path.read_text(encoding='utf-8'))
+    assert saved['version'] == RenderCache.MANIFEST_VERSION and set(saved['entries']) == {"a", "b"}
+
+def test_eviction_removes_least_recently_used(tmp_path):
+    cache = RenderCache(tmp_path, max_bytes=4000)
+    for key in "abcd":
+        store(cache, tmp_path, key)
+    assert cache.fetch("a", tmp_path / "copy.pdf")
+    store(cache, tmp_path, "e")
+    # Oltre il limite si scende al 90%: via le due voci usate meno di recente
+    assert sorted(path.stem for path in cache.root.glob("*.pdf")) == ["a", "d", "e"]
+    assert not cache.journal_path.exists()
+    saved = json.loads(cache.manifest_path.read_text(encoding='utf-8'))
+    assert sorted(saved['entries']) == ["a", "d", "e"]
+    assert RenderCache._states[cache.root]['total'] == 3000
+    assert not list(cache.root.glob("*.tmp"))
+
+def test_old_entries_expire(tmp_path):
+    cache = RenderCache(tmp_path, max_age=60)
+    store(cache, tmp_path, "a")
+    RenderCache._states.pop(cache.root)
+    cache.journal_path.unlink()
+    manifest = {'version': RenderCache.MANIFEST_VERSION,
+                'entries': {"a": {'size': 1000, 'created': 0, 'used': 0}}}
+    cache.manifest_path.write_text(json.dumps(manifest), encoding='utf-8')
+    assert RenderCache(tmp_path, max_age=60)._state()['entries'] == {}
+    assert not (cache.root / "a.pdf").exists()
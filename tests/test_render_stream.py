@@ -0,0 +1,53 @@
+"""render e CLI con -: compilazione in memoria, senza output/ né cache"""
+import os
+import subprocess
+import sys
+
+import pytest
+from pypdf import PdfReader
+
+from fill_dnd_sheet import process_cah_file, render
+
+@pytest.fixture
+def untouched_tree(repo_dir, monkeypatch):
+    """Il template si cerca nella cartella corrente: si lavora dalla radice, che non deve cambiare"""
+    monkeypatch.chdir(repo_dir)
+
+    def snapshot():
+        return {os.path.join(root, name) for root, dirs, files in os.walk(repo_dir)
+                if ".git" not in root and "__pycache__" not in root for name in files}
+    before = snapshot()
+    yield
+    assert snapshot() == before
+
+def test_render_returns_pdf_and_writes_nothing(sample_cah_files, untouched_tree):
+    data = sample_cah_files[0].read_bytes()
+    pdf = render(data)
+    assert pdf.startswith(b"%PDF")
+    with open(sample_cah_files[0], "rb") as stream:
+        assert render(stream) == pdf
+
+def test_render_matches_batch_sheet(sample_cah_files, tmp_path, template_pdf):
+    pdf = process_cah_file(sample_cah_files[0], tmp_path, template_pdf=template_pdf)['path'].read_bytes()
+    assert render(sample_cah_files[0].read_bytes(), template_pdf=template_pdf) == pdf
+
+def _cli(*args, stdin=b""):
+    return subprocess.run([sys.executable, "fill_dnd_sheet.py", *args], input=stdin, capture_output=True)
+
+def test_stdin_to_stdout(sample_cah_files, untouched_tree):
+    result = _cli("-", stdin=sample_cah_files[0].read_bytes())
+    assert result.returncode == 0, result.stderr
+    assert result.stdout == render(sample_cah_files[0].read_bytes())
+
+def test_output_file(sample_cah_files, tmp_path, untouched_tree):
+    output = tmp_path / "scheda.pdf"
+    result = _cli(str(sample_cah_files[0]), "-o", str(output), "--engine", "acroform")
+    assert result.returncode == 0, result.stderr
+    assert result.stdout == b""
+    assert len(PdfReader(output).pages) == 3
+
+def test_invalid_input_fails_without_output(untouched_tree):
+    result = _cli("-", stdin=b"{non json")
+    assert result.returncode == 1
+    assert result.stdout == b""
+    assert result.stderr
@@ -0,0 +1,29 @@
+"""extract_character_info_batch: stessi risultati della versione scalare"""
+import copy
+
+import pytest
+
+import fill_dnd_sheet
+from fill_dnd_sheet import extract_character_info, extract_character_info_batch, load_character_data
+
+@pytest.fixture
+def roster(sample_cah_files):
+    characters = [load_character_data(path) for path in sample_cah_files]
+    # Livello alto e caratteristiche estreme: bonus di competenza e modificatori ai limiti
+    strong = copy.deepcopy(characters[0])
+    for job in strong['jobs']:
+        job['level'] = 20 // len(strong['jobs'])
+    for ability, score in zip(fill_dnd_sheet.ABILITIES, (1, 30, 10, 11, 20, 3)):
+        strong[ability]['score'] = score
+    return characters + [strong]
+
+@pytest.mark.parametrize("numpy", [True, False], ids=["numpy", "scalar"])
+def test_batch_matches_scalar(roster, monkeypatch, numpy):
+    if numpy:
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(fill_dnd_sheet, "_import_numpy", lambda: None)
+    assert extract_character_info_batch(roster) == [extract_character_info(data) for data in roster]
+
+def test_empty_roster():
+    assert extract_character_info_batch([]) == []
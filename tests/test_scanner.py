@@ -0,0 +1,99 @@
+"""Scansione selettiva dei .cah confrontata con json.loads"""
+import json
+
+import pytest
+
+import fill_dnd_sheet
+from fill_dnd_sheet import (
+    CHARACTER_KEYS, RAW_KEYS, RawImage, _DECODE_WINDOW, _DECODE_WINDOW_MAX, _iter_top_level,
+    parse_character_data,
+)
+
+def scan(buf):
+    """Valori di primo livello trovati dallo scanner, decodificati uno per uno"""
+    return {key: json.loads(buf[start:end]) for key, start, end in _iter_top_level(buf)}
+
+def nested_description(depth):
+    """Stringa che contiene JSON che contiene JSON...: produce \\", \\\\\\" e oltre"""
+    value = {'description': 'Disse "ciao" \\ poi \\"basta\\"', 'level': 3}
+    for _ in range(depth):
+        value = {'json': json.dumps(value), 'tail': '\\'}
+    return json.dumps(value)
+
+STRINGS = [
+    'semplice',
+    'virgolette "escape"',          # \"
+    'backslash finale \\',          # \\" alla chiusura
+    'backslash e virgolette \\"',   # \\\"
+    '\\\\"\\\\\\"',
+    'a capo\n\ttab e unicode: ✓ Ł 名前  ',
+    nested_description(1),
+    nested_description(3),
+]
+
+@pytest.mark.parametrize('text', STRINGS)
+def test_strings_match_json_loads(text):
+    doc = {'before': 1, 'text': text, 'list': [text, {'inner': text}], 'after': 'fine'}
+    buf = json.dumps(doc).encode('utf-8')
+    assert scan(buf) == json.loads(buf)
+
+@pytest.mark.parametrize('options', [
+    {},
+    {'indent': 2},
+    {'separators': (',', ':')},
+    {'separators': (' ,\r\n ', ' :\t ')},
+    {'ensure_ascii': False},
+])
+def test_whitespace_and_non_ascii_keys(options):
+    doc = {'nöme': 'Łukasz', '名前': ['a', 'b'], 'esc"ape': {'x': None}, 'num': -1.5e3,
+           'vero': True, 'vuoto': {}, 'lista': []}
+    buf = json.dumps(doc, **options).encode('utf-8')
+    assert scan(buf) == json.loads(buf)
+
+@pytest.mark.parametrize('size', [
+    _DECODE_WINDOW // 2 - 10, _DECODE_WINDOW // 2 + 10, _DECODE_WINDOW + 1,
+    _DECODE_WINDOW_MAX - 5, _DECODE_WINDOW_MAX + 5, 3 * _DECODE_WINDOW_MAX,
+])
+def test_values_across_decode_windows(size):
+    # Una stringa lunga dentro un contenitore, e un contenitore di tante stringhe corte
+    long_text = ('x\\"' * size)[:size]
+    many = [nested_description(1)] * (size // 60 + 1)
+    doc = {'classes': {'id': 'a', 'blob': long_text, 'end': '}'}, 'many': many, 'tail': [long_text]}
+    buf = json.dumps(doc).encode('utf-8')
+    assert scan(buf) == json.loads(buf)
+
+def test_parse_character_data_keeps_raw_keys(sample_cah_files):
+    assert sample_cah_files
+    for path in sample_cah_files:
+        buf = path.read_bytes()
+        full = json.loads(buf)
+        data = parse_character_data(buf, CHARACTER_KEYS)
+        assert set(data) == CHARACTER_KEYS & set(full)
+        for key, value in data.items():
+            if RAW_KEYS.get(key) is bytes:
+                assert json.loads(value) == full[key]
+            elif isinstance(value, RawImage):
+                assert value.base64() == full[key]
+            else:
+                assert value == full[key]
+
+def test_raw_image_digest_and_truthiness():
+    image = RawImage(b'"aGVsbG8="')
+    assert image and image.base64() == 'aGVsbG8='
+    assert image.digest == RawImage(b'"aGVsbG8="').digest != RawImage(b'"aGVsbG9="').digest
+    assert not RawImage(b'""') and not RawImage(b'null')
+    with pytest.raises(ValueError):
+        RawImage(b'5').base64()
+
+@pytest.mark.parametrize('buf', [b'[1, 2]', b'"x"', b'{"a": "senza fine}', b'{"a" 1}', b'{"a": 1 "b": 2}'])
+def test_malformed_input_raises_value_error(buf):
+    with pytest.raises(ValueError):
+        scan(buf)
+
+def test_module_has_no_possessive_quantifiers():
+    # Python 3.8-3.10 non li conoscono: il modulo non si importerebbe
+    for name in dir(fill_dnd_sheet):
+        pattern = getattr(fill_dnd_sheet, name)
+        if hasattr(pattern, 'pattern') and isinstance(pattern.pattern, (bytes, str)):
+            source = pattern.pattern if isinstance(pattern.pattern, bytes) else pattern.pattern.encode()
+            assert b'*+' not in source and b'++' not in source and b'?+' not in source, name
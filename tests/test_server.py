@@ -0,0 +1,53 @@
+"""Modalità serve: codici di risposta del server HTTP"""
+import json
+import os
+import socket
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+import sheet_server
+
+@pytest.fixture(scope="module")
+def server(request):
+    # Il template incluso si trova a partire dalla cartella corrente
+    previous = os.getcwd()
+    os.chdir(request.config.rootpath)
+    server = sheet_server.RenderServer(('127.0.0.1', 0), workers=1, queue_limit=1)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    os.chdir(previous)
+
+def post(server, body, query=""):
+    url = f"http://127.0.0.1:{server.server_address[1]}/render{query}"
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, data=body, method='POST')) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+def test_renders_sample(server, sample_cah_files):
+    status, body = post(server, sample_cah_files[0].read_bytes())
+    assert status == 200 and body.startswith(b'%PDF')
+
+@pytest.mark.parametrize('body', [
+    b'{bad', b'[1, 2]', b'{"jobs": 5}', b'{"name": 5}', b'{"player": ["a"]}', b'{"race": 7}',
+    b'{"spells": [{"name": 5, "level": 1}]}',
+])
+def test_malformed_characters_are_client_errors(server, body):
+    status, payload = post(server, body)
+    assert status == 400, payload
+    assert payload['error']
+
+def test_unknown_engine_is_client_error(server, sample_cah_files):
+    assert post(server, sample_cah_files[0].read_bytes(), "?engine=nope")[0] == 400
+
+def test_negative_content_length(server):
+    with socket.create_connection(('127.0.0.1', server.server_address[1]), timeout=10) as conn:
+        conn.sendall(b"POST /render HTTP/1.1\r\nHost: x\r\nContent-Length: -5\r\n\r\n")
+        assert conn.recv(100).split(b"\r\n")[0].split()[1] == b"400"
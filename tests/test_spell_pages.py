@@ -0,0 +1,52 @@
+"""Pagine di continuazione per gli incantesimi che non entrano nella pagina 3"""
+import copy
+import io
+
+import pytest
+from pypdf import PdfReader
+
+import sheet_render
+from fill_dnd_sheet import DEFAULT_PROFILE, SPELL_PAGES_FIELD, extract_character_info, load_character_data
+
+@pytest.fixture
+def many_spells(sample_cah_files):
+    """Un incantatore con molti più incantesimi di 1° livello dei riquadri della scheda"""
+    data = copy.deepcopy(load_character_data(sample_cah_files[0]))
+    rows = len(DEFAULT_PROFILE.spells[1])
+    data['spells'] = [{'name': f"Incantesimo {i:02d}", 'level': 1} for i in range(2 * rows + 3)]
+    return data, rows
+
+def test_overflow_goes_to_continuations(many_spells):
+    data, rows = many_spells
+    char_info = extract_character_info(data)
+    continuation = char_info[SPELL_PAGES_FIELD]
+    assert len(continuation) == 2
+    level_fields = DEFAULT_PROFILE.spells[1]
+    assert char_info[level_fields[0]] == "Incantesimo 00"
+    assert continuation[0][level_fields[0]] == f"Incantesimo {rows:02d}"
+    assert continuation[1][level_fields[2]] == f"Incantesimo {2 * rows + 2:02d}"
+    # L'intestazione della pagina incantesimi si ripete su ogni continuazione
+    for name in DEFAULT_PROFILE.spell_header:
+        if name in char_info:
+            assert all(page[name] == char_info[name] for page in continuation)
+
+def test_few_spells_have_no_continuation(sample_cah_files):
+    data = copy.deepcopy(load_character_data(sample_cah_files[0]))
+    data['spells'] = [{'name': "Dardo incantato", 'level': 1}]
+    assert SPELL_PAGES_FIELD not in extract_character_info(data)
+
+@pytest.mark.parametrize("engine", ["overlay", "acroform"])
+def test_continuation_pages_in_output(many_spells, template_pdf, engine):
+    data, rows = many_spells
+    char_info = extract_character_info(data)
+    output = io.BytesIO()
+    sheet_render.fill_pdf(template_pdf, output, char_info, engine=engine)
+    reader = PdfReader(output)
+    assert len(reader.pages) == 5
+    for page_num, first in ((3, rows), (4, 2 * rows)):
+        page = reader.pages[page_num]
+        assert f"Incantesimo {first:02d}" in page.extract_text()
+        # Clone della pagina incantesimi, senza widget del modulo
+        assert "/Annots" not in page
+        assert page.mediabox == reader.pages[2].mediabox
+    assert f"Incantesimo {rows:02d}" not in reader.pages[2].extract_text()
@@ -0,0 +1,47 @@
+"""--stats-only: statistiche derivate in JSON Lines o CSV, senza compilare PDF"""
+import csv
+import io
+import json
+
+import pytest
+
+from fill_dnd_sheet import ABILITIES, STATS_FIELDS, character_stats, load_character_data, write_character_stats
+
+def test_character_stats_values(sample_cah_files):
+    by_name = {path.stem: path for path in sample_cah_files}
+    record = character_stats(load_character_data(by_name['Arkan']))
+    assert set(record) == set(STATS_FIELDS) - {'file'}
+    assert record['xp'] == 48000
+    assert record['proficiency_bonus'] == 2 + (record['level'] - 1) // 4
+    for ability in ABILITIES:
+        assert record[f'{ability}_mod'] == (record[ability] - 10) // 2
+        bonus = record['proficiency_bonus'] if record[f'{ability}_save_proficient'] else 0
+        assert record[f'{ability}_save'] == record[f'{ability}_mod'] + bonus
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_jsonl_in_file_order_with_errors(sample_cah_files, tmp_path, jobs):
+    broken = tmp_path / "broken.cah"
+    broken.write_bytes(b"{non json")
+    files = [sample_cah_files[0], broken] + sample_cah_files[1:]
+    output = io.StringIO()
+    failed = []
+    written, errors = write_character_stats(files, output, "jsonl", lambda f, e: failed.append(f), jobs)
+    assert (written, errors) == (len(sample_cah_files), 1)
+    assert failed == [broken]
+    rows = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [row['file'] for row in rows] == [path.name for path in sample_cah_files]
+    assert rows[0] == {'file': sample_cah_files[0].name, **character_stats(load_character_data(sample_cah_files[0]))}
+
+def test_csv_has_every_column(sample_cah_files, tmp_path):
+    output = tmp_path / "stats.csv"
+    write_character_stats(sample_cah_files, output, "csv")
+    with open(output, newline='', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        rows = list(reader)
+    assert tuple(reader.fieldnames) == STATS_FIELDS
+    assert len(rows) == len(sample_cah_files)
+    assert rows[0]['name'] == load_character_data(sample_cah_files[0])['name']
+
+def test_unknown_format():
+    with pytest.raises(ValueError):
+        write_character_stats([], io.StringIO(), "xml")
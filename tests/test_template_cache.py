@@ -0,0 +1,29 @@
+"""Template analizzato una volta per processo"""
+import io
+import os
+import shutil
+
+import sheet_render
+from fill_dnd_sheet import extract_character_info, load_character_data
+
+def test_same_template_is_parsed_once(template_pdf, tmp_path):
+    template = tmp_path / "template.pdf"
+    shutil.copyfile(template_pdf, template)
+    cache = sheet_render.TemplateCache()
+    first = cache.get(template)
+    assert cache.get(template) is first
+    assert first.page_count == 3
+
+    # Il file cambia (data di modifica diversa): il template viene riletto
+    stat = os.stat(template)
+    os.utime(template, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert cache.get(template) is not first
+
+def test_repeated_renders_are_identical(template_pdf, sample_cah_files):
+    field_data = extract_character_info(load_character_data(sample_cah_files[0]))
+    outputs = []
+    for _ in range(2):
+        output = io.BytesIO()
+        sheet_render.fill_pdf(template_pdf, output, field_data)
+        outputs.append(output.getvalue())
+    assert outputs[0] == outputs[1]
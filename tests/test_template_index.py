@@ -0,0 +1,53 @@
+"""Indice precompilato dei campi del template"""
+import json
+import shutil
+import threading
+
+import sheet_render
+from fill_dnd_sheet import DEFAULT_TEMPLATE
+
+def copy_template(repo_dir, tmp_path):
+    template = tmp_path / "template.pdf"
+    shutil.copyfile(repo_dir / DEFAULT_TEMPLATE, template)
+    return template
+
+def test_index_is_saved_and_reused(repo_dir, tmp_path):
+    template = copy_template(repo_dir, tmp_path)
+    index = sheet_render.load_template_index(template)
+    assert index['page_count'] == 3
+    assert index['fields']['CharacterName']['page'] == 0
+    saved = json.loads(sheet_render.get_template_index_path(template).read_text(encoding='utf-8'))
+    assert saved == index
+    assert sheet_render.load_template_index(template) == index
+
+def test_index_is_rebuilt_when_template_changes(repo_dir, tmp_path):
+    template = copy_template(repo_dir, tmp_path)
+    index_path = sheet_render.get_template_index_path(template)
+    sheet_render.load_template_index(template)
+    stale = json.loads(index_path.read_text(encoding='utf-8'))
+    stale['template_sha256'] = "0" * 64
+    stale['fields'] = {}
+    index_path.write_text(json.dumps(stale), encoding='utf-8')
+    assert sheet_render.load_template_index(template)['fields']
+
+def test_persist_false_writes_nothing(repo_dir, tmp_path):
+    template = copy_template(repo_dir, tmp_path)
+    assert sheet_render.load_template_index(template, persist=False)['fields']
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["template.pdf"]
+
+def test_concurrent_writers_leave_a_valid_index(repo_dir, tmp_path):
+    template = copy_template(repo_dir, tmp_path)
+    errors = []
+    def build():
+        try:
+            sheet_render.load_template_index(template)
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target=build) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert json.loads(sheet_render.get_template_index_path(template).read_text(encoding='utf-8'))['fields']
+    assert not list(tmp_path.glob("*.tmp"))
@@ -0,0 +1,48 @@
+"""--watch: rigenerazione dei file .cah modificati"""
+import shutil
+import threading
+
+from fill_dnd_sheet import watch_input_dir
+
+class StopWatching(Exception):
+    pass
+
+def test_watch_renders_new_changed_and_removed_files(sample_cah_files, tmp_path, template_pdf):
+    input_dir = tmp_path / "input"
+    output_dir = tmp_path / "output"
+    input_dir.mkdir()
+    output_dir.mkdir()
+    cah_file = input_dir / "hero.cah"
+    shutil.copyfile(sample_cah_files[0], cah_file)
+    messages = []
+
+    def log(message):
+        # Ogni messaggio fa il passo successivo: modifica, rimozione, fine
+        messages.append(message)
+        if len(messages) == 1:
+            with open(cah_file, 'ab') as f:
+                f.write(b"\n")
+        elif len(messages) == 2:
+            cah_file.unlink()
+        else:
+            raise StopWatching()
+
+    errors = []
+    def run():
+        try:
+            watch_input_dir(input_dir, output_dir, interval=0.01, debounce=0.05, log=log,
+                            template_pdf=template_pdf)
+        except StopWatching:
+            pass
+        except Exception as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout=60)
+    assert not thread.is_alive() and not errors
+    assert "hero.cah: scheda aggiornata -> hero_sheet.pdf" in messages[0]
+    # Solo spazi in più: i campi derivati non cambiano e la scheda viene dalla cache
+    assert "hero.cah: scheda invariata (cache)" in messages[1]
+    assert "hero.cah: file rimosso" in messages[2]
+    assert (output_dir / "hero_sheet.pdf").read_bytes().startswith(b'%PDF')